@@ -28,66 +28,36 @@ def prepare_data(working_loc, linework, range_bound, designated_lands_loc, outpu
         arcpy.management.CreateFileGDB(out_folder_path= working_loc , out_name="AOI.gdb" )
     arcpy.env.workspace = wrkspc_loc
 
-    # Habitat linework
+    # Habitat linework and range boundaries are each read once and split into one feature class per herd,
+    # with Area_Ha and the boundary Herd_Name/BCHab_code written as the features are copied (see partition.py)
+    from partition import schema_template, partition_features
+    from herd_index import normalize_name
 
-    herd_name = []
-    with arcpy.da.SearchCursor(linework, ["Herd_Name"]) as cursor:
-        for row in cursor:
-            herd_name.append(row[0])
-    herd_name = list(set(herd_name))
+    area_field = ("Area_Ha", "FLOAT", "Area_Ha")
+
+    # Moberly habitat is reported under the Klinse-za range name
+    renamed = {"Moberly": "Klinseza"}
 
-    # Extract to gdb
-    for h in herd_name:
-        value_update = h.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
-        arcpy.Select_analysis(linework, value_update, "Herd_Name = '{0}'".format(h))
+    linework_schema = schema_template(linework, "memory", "linework_schema", add_fields=[area_field])
+    linework_out = partition_features(linework, wrkspc_loc, "Herd_Name",
+                                      route=lambda h: renamed.get(h, normalize_name(h)),
+                                      template=linework_schema,
+                                      stamp=lambda h: {"Herd_Name": renamed[h]} if h in renamed else {},
+                                      area_field="Area_Ha")
+    herd_name = {key for key, count in linework_out.values()}
 
     # Get boundaries for areas without linework
-    herd_name_range = []
-    with arcpy.da.SearchCursor(range_bound, ["Herd_Name"]) as cursor:
-        for row in cursor:
-            herd_name_range.append(row[0])
-    herd_name_range = list(set(herd_name_range))
-
-    herd_name_noline = sorted([i for i in herd_name_range if i not in herd_name])
-    herd_name_noline.remove('Klinse-za')
-
-    # Extract to gdb
-    for h in herd_name_noline:
-        value_update = h.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
-        arcpy.Select_analysis(range_bound, value_update, "Herd_Name = '{0}'".format(h))
-        arcpy.DeleteField_management(value_update, "HERD_NAME")
-        arcpy.management.AddField(value_update, "Herd_Name", "TEXT", field_alias = "Herd Name")
-        if len(arcpy.ListFields(value_update, "BCHab_code")) == 0:
-            arcpy.AddField_management(value_update, "BCHab_code", "TEXT")
-        with arcpy.da.UpdateCursor(value_update, ["BCHab_code", "Herd_Name"]) as cursor:
-            for row in cursor:
-                row[0] = "Boundary"
-                row[1] = h 
-                cursor.updateRow(row)
-        
-    # Update range name 
-    arcpy.Rename_management("Moberly", "Klinseza")
-    with arcpy.da.UpdateCursor("Klinseza", ["Herd_Name"]) as cursor:
-        for row in cursor:
-            row[0] = "Klinseza"
-            cursor.updateRow(row)
-            
-    # Add area in ha
-    fc_list = arcpy.ListFeatureClasses()
-
-    for f in fc_list:
-        if len(arcpy.ListFields(f, "Area_Ha")) == 0:
-            arcpy.AddField_management(f, "Area_Ha", "FLOAT")
-        with arcpy.da.UpdateCursor(f, ["Shape_Area", "Area_Ha"]) as cursor:
-            for row in cursor:
-                row[1] = row[0] * 0.0001
-                cursor.updateRow(row)    
+    range_schema = schema_template(range_bound, "memory", "range_schema", drop_fields=["HERD_NAME"],
+                                   add_fields=[("Herd_Name", "TEXT", "Herd Name"), ("BCHab_code", "TEXT", "BCHab_code"),
+                                               area_field])
+    partition_features(range_bound, wrkspc_loc, "Herd_Name",
+                       route=lambda h: None if h in herd_name or h == 'Klinse-za' else normalize_name(h),
+                       template=range_schema,
+                       stamp=lambda h: {"BCHab_code": "Boundary", "Herd_Name": h},
+                       area_field="Area_Ha")
+
+    arcpy.Delete_management(linework_schema)
+    arcpy.Delete_management(range_schema)
 
     bcgw_connection =os.path.join(output_location,"BCGW.sde")
 
@@ -113,37 +83,28 @@ def prepare_data(working_loc, linework, range_bound, designated_lands_loc, outpu
         print('Updated designated gdb already exists')
 
     arcpy.env.workspace = desginated_loc
-    arcpy.management.Copy(bcgw_connection + r"\WHSE_LAND_USE_PLANNING.RMP_OGMA_NON_LEGAL_CURRENT_SVW", "OGMA_nonlegal")
-
-    # Match designated lands schema
-    fc_fields = [f.name for f in arcpy.ListFields("OGMA_nonlegal")]
-
-    for f in fc_fields:
-        if not f in ["OBJECTID", "GEOMETRY", "GEOMETRY_Length", "GEOMETRY_Area"]:
-            arcpy.DeleteField_management("OGMA_nonlegal", f)
-
-    if len(arcpy.ListFields("OGMA_nonlegal", "designation")) == 0:
-        arcpy.AddField_management("OGMA_nonlegal", "designation", "TEXT") 
-    if len(arcpy.ListFields("OGMA_nonlegal", "source_name")) == 0:
-        arcpy.AddField_management("OGMA_nonlegal", "source_name", "TEXT") 
-    if len(arcpy.ListFields("OGMA_nonlegal", "forest_restriction")) == 0:
-        arcpy.AddField_management("OGMA_nonlegal", "forest_restriction", "SHORT") 
-    if len(arcpy.ListFields("OGMA_nonlegal", "mine_restriction")) == 0:
-        arcpy.AddField_management("OGMA_nonlegal", "mine_restriction", "SHORT") 
-    if len(arcpy.ListFields("OGMA_nonlegal", "og_restriction")) == 0:
-        arcpy.AddField_management("OGMA_nonlegal", "og_restriction", "SHORT") 
-        
-    with arcpy.da.UpdateCursor("OGMA_nonlegal",["designation", "source_name", 
-                                                "forest_restriction","mine_restriction",
-                                                "og_restriction"]) as cursor:
-        for row in cursor:
-            row[0] = "ogma"
-            row[1] = "ogma_nonlegal"
-            row[2] = 3
-            row[3] = 0
-            row[4] = 2
-            cursor.updateRow(row)
-    
+    ogma_view = bcgw_connection + r"\WHSE_LAND_USE_PLANNING.RMP_OGMA_NON_LEGAL_CURRENT_SVW"
+
+    # Designated lands schema and the values every non-legal OGMA gets
+    ogma_fields = [("designation", "TEXT", "ogma"),
+                   ("source_name", "TEXT", "ogma_nonlegal"),
+                   ("forest_restriction", "SHORT", 3),
+                   ("mine_restriction", "SHORT", 0),
+                   ("og_restriction", "SHORT", 2)]
+
+    # Only the geometry is pulled from the BCGW, the schema is built on the empty feature class and the
+    # constant values are written as the polygons stream in
+    arcpy.management.CreateFeatureclass(desginated_loc, "OGMA_nonlegal", "POLYGON",
+                                        spatial_reference=arcpy.Describe(ogma_view).spatialReference)
+    # One schema change for all the fields instead of one AddField per field
+    arcpy.management.AddFields("OGMA_nonlegal", [[field_name, field_type] for field_name, field_type, value in ogma_fields])
+
+    ogma_values = [value for field_name, field_type, value in ogma_fields]
+    with arcpy.da.SearchCursor(ogma_view, ["SHAPE@"]) as search, \
+         arcpy.da.InsertCursor("OGMA_nonlegal", ["SHAPE@"] + [field[0] for field in ogma_fields]) as insert:
+        for row in search:
+            insert.insertRow([row[0]] + ogma_values)
+
     arcpy.Merge_management([designated_lands_loc, "OGMA_nonlegal"], "designations_ogma_update_221013")
 
     with arcpy.da.UpdateCursor("designations_ogma_update_221013",["designation"]) as cursor:
@@ -11,11 +11,20 @@ load_dotenv(dotenv_path)
 
 from arcpy import env
 from Data_prep import prepare_data
-from disturbance_layer import disturbance_aoi, buffer_disturbance, intersect, delete, interim_clean_up, delete_layers, disturbance_flatten, disturbance_field_mapping, disturbance_cleanup, disturbance_buffer_flatten,disturbance_buffer_field_mapping, disturbance_buffer_cleanup, identity
+from disturbance_layer import disturbance_aoi, buffer_disturbance, intersect, delete, interim_clean_up, LAYER_STEPS, layer_artifacts
 from table_create import combine_loose_sheets, make_sheet_base, static_grouping
-from protection_layer import protect_aoi, gather_protection, flatten_protection, field_mapping, clean_and_join, combine
-from protection_table import tabletotable, combine_loose_herds, protection_grouping, protection_classes
-from disturbance_protection_combine import combine_disturbance_and_protection, clean_up
+from protection_layer import protect_aoi, protection_flatten, merge_protection_cells
+from protection_table import combine_loose_herds, protection_grouping, protection_classes
+from report_builder import build_disturbance_report, build_protection_report
+from herd_index import build_herd_index, herd_values, herd_area, normalize_name
+from aoi_registry import release_registries
+from artifacts import get_artifacts
+from scheduler import herd_workers, layer_size, load_timing, record_timing, herd_inputs, run_herds
+from progress import predict_run, StageProgress
+from herd_tasks import disturbance_herd, protection_herd, protection_cell, disturbance_artifacts, protection_artifacts, collect_finals
+from journal import RunJournal, fingerprint, content_fingerprint
+from year_index import YearIndex
+from tile_index import build_tile_index, tile_artifacts, get_tile_index, tile_size, INDEX_FIELDS
 
 
 arcpy.env.parallelProcessingFactor = "50%"
@@ -66,486 +75,182 @@ csv_protect_output_list = []
 
 for layer_name in layer_name_list:
     # Clean layer name for file naming (same logic used in spagh_meatball function)
-    clean_name = layer_name.replace(" ", "").replace("-", "").replace(":", "").replace("/", "")
+    clean_name = normalize_name(layer_name)
     
     # Generate output names based on pattern from comments
     csv_output_name_list.append(f"{clean_name}_1005")  # or use appropriate suffix
     final_output_list.append(f"{clean_name}_final")
     csv_protect_output_list.append(f"{clean_name}_protect")
+
+# Herd names, areas and ecotypes are indexed once and reused until the AOI gdb changes (see herd_index.py)
+herd_index_path = os.path.join(root_dir, "herd_index.csv")
+# Scratch namespaces and interim layers of each herd (see artifacts.py)
+artifacts = get_artifacts(workspace)
+# Seconds per herd/stage of every run, the scheduler estimates the herd costs from it (see scheduler.py)
+timing_report = os.path.join(csv_dir, "herd_timing.csv")
+workers = herd_workers()
+# Completed steps of the run, an interrupted run resumes at the first incomplete step (see journal.py)
+journal_path = os.path.join(root_dir, "run_journal.sqlite")
+# Designated lands partitioned into tiles until they change, each herd's protection clip reads only its tiles (see tile_index.py)
+tile_gdb = os.path.join(root_dir, "designated_tiles.gdb")
+# With PROTECTION_FLATTEN=province the designated lands are flattened once and each herd's protection flat is clipped from it
+province_flat = os.path.join(workspace, "designated_lands_protect_flat") if protection_flatten() == "province" else None
 ###end config ####
 
 
 def layers():
     print('************ layers ************')
     arcpy.env.workspace = workspace
-    disturbance_aoi(connPath, connFile, username, password, aoi_location, layer_name, unique_value, roads_file, bcce_file,bcgw_inst)
-    buffer_disturbance()
-    intersect(unique_value, aoi_location, layer_name, dissolve_values)
-    delete()
-    interim_clean_up(dissolve_values,layer_name)
+    # Every herd resumes at its first layer step that isn't done, a herd whose _final layers are done is skipped
+    steps = {values: journal.resume(layer_name, values, list(LAYER_STEPS)) for values in herd_values(herd_index, layer_name)}
+
+    precision_report = os.path.join(csv_dir, f"{layer_name}_precision_report.csv")
+    fetch_report = os.path.join(csv_dir, f"{layer_name}_fetch_report.csv")
+    disturbance_aoi(connPath, connFile, username, password, aoi_location, layer_name, unique_value, roads_file, bcce_file,bcgw_inst, herd_index, precision_report, journal, fetch_report,
+                    [values for values, stages in steps.items() if "extract" in stages])
+    for values, stages in steps.items():
+        value_update = normalize_name(values)
+        for stage in [stage for stage in stages if stage != "extract"]:
+            journal.begin(layer_name, values, stage, layer_artifacts(value_update, stage))
+            if stage == "buffer":
+                buffer_disturbance([value_update])
+            elif stage == "intersect":
+                intersect(values, unique_value, aoi_location, layer_name)
+            else:
+                interim_clean_up(dissolve_values, value_update)
+            journal.complete(layer_name, values, stage, layer_artifacts(value_update, stage))
+    delete([normalize_name(values) for values in steps])
 def spagh_meatball():
-
-    aoi = os.path.join(aoi_location,layer_name)
-    search_word = "{}".format(unique_value)
-
-    with arcpy.da.SearchCursor(aoi, [search_word]) as cursor:
-        values_sorted = sorted({row[0] for row in cursor})
-    print('Running disturbance on: {}'.format(values_sorted))
-    
-    for values in values_sorted:
-        layer_query = """{0} = '{1}'""".format(unique_value, values)
-        layer_select = arcpy.SelectLayerByAttribute_management(aoi, "NEW_SELECTION", layer_query)
-        arcpy.CopyFeatures_management(layer_select, 'aoi')
-
-        (print('Selected {}'.format(values)))
-
-        value_update = values.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
-
-
-        disturbance_flatten(values, value_update)
-        disturbance_field_mapping(values, value_update)
-        disturbance_cleanup(values, value_update, keep_list)
-
-        delete_layers()
-
-        disturbance_buffer_flatten(values, value_update)
-        disturbance_buffer_field_mapping(values, value_update)
-        disturbance_buffer_cleanup(values, value_update, keep_list)
-
-        delete_layers()
-
-        identity(csv_dir, values, value_update, unique_value, intersect_layer, aoi_location)
+    # Herds completed before an interrupted run stopped are skipped, the rest are started from scratch
+    costs = predictions["disturbance"]
+    costs = costs.loc[journal.pending(layer_name, "disturbance", costs.index)]
+    print('Running disturbance on: {}'.format(list(costs.index)))
+    for values in costs.index:
+        journal.begin(layer_name, values, "disturbance", disturbance_artifacts(values))
+
+    # Largest herds first, on HERD_WORKERS worker processes
+    with StageProgress(layer_name, "disturbance", costs, stage_inputs["disturbance"]["hectares"], workers) as progress:
+        for values, seconds in run_herds(costs, disturbance_herd, (keep_list,), workers, progress):
+            collect_finals("disturbance", normalize_name(values))
+            artifacts.drop(normalize_name(values), "intersect")
+            record_timing(timing_report, layer_name, values, "disturbance", seconds, *stage_inputs["disturbance"].loc[values])
+            # The herd's _final layers are fingerprinted with the step, a herd whose layers were rebuilt is flattened again
+            journal.complete(layer_name, values, "disturbance", disturbance_artifacts(values) + layer_artifacts(normalize_name(values), "final"))
 
 def table():
     combine_loose_sheets(csv_dir, csv_output_name)
-    make_sheet_base(intersect_layer, unique_value, aoi_location, csv_dir)
+    make_sheet_base(intersect_layer, unique_value, aoi_location, csv_dir, herd_index)
     static_grouping(csv_dir, csv_output_name, table_group, final_output)
+    # Year lists of the flat for as-of-year queries without rerunning static_grouping (see year_index.py)
+    YearIndex.from_csv(csv_dir, csv_output_name, table_group).save(os.path.join(csv_dir, f"{csv_output_name}_years.npz"))
 def protection():
-    protect_aoi(aoi_location, layer_name, unique_value)
-    
-    aoi = os.path.join(aoi_location,layer_name)
-    search_word = "{}".format(unique_value)
-
-    with arcpy.da.SearchCursor(aoi, [search_word]) as cursor:
-        values_sorted = sorted({row[0] for row in cursor})
-    print('Running protection on: {}'.format(values_sorted))
-
-    for values in values_sorted:
-        layer_query = """{0} = '{1}'""".format(unique_value, values)
-        layer_select = arcpy.SelectLayerByAttribute_management(aoi, "NEW_SELECTION", layer_query)
-        arcpy.CopyFeatures_management(layer_select, 'aoi')
-
-        (print('Selected {}'.format(values)))
-
-        value_update = values.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
-
-        gather_protection(designated_lands, value_update)
-        flatten_protection(value_update)
-        field_mapping(value_update)
-        clean_and_join(value_update, keep_list)
-        combine(values, value_update, unique_value, intersect_layer, aoi_location)
+    protect_aoi(aoi_location, layer_name, unique_value, herd_index)
+
+    costs = predictions["protection"]
+    costs = costs.loc[journal.pending(layer_name, "protection", costs.index)]
+    print('Running protection on: {}'.format(list(costs.index)))
+    for values in costs.index:
+        journal.begin(layer_name, values, "protection", protection_artifacts(values, csv_dir))
+
+    herd_args = (designated_lands, os.path.join(aoi_location,layer_name), unique_value, keep_list, csv_dir, intersect_layer, aoi_location, tile_gdb, province_flat)
+    with StageProgress(layer_name, "protection", costs, stage_inputs["protection"]["hectares"], workers) as progress:
+        for values, seconds in run_herds(costs, protection_herd, herd_args, workers, progress):
+            collect_finals("protection", normalize_name(values))
+            record_timing(timing_report, layer_name, values, "protection", seconds, *stage_inputs["protection"].loc[values])
+            journal.complete(layer_name, values, "protection", protection_artifacts(values, csv_dir))
 def protection_table():
-    aoi = os.path.join(aoi_location,layer_name)
-    search_word = "{}".format(unique_value)
-
-    with arcpy.da.SearchCursor(aoi, [search_word]) as cursor:
-        values_sorted = sorted({row[0] for row in cursor})
+    values_sorted = herd_values(herd_index, layer_name)
     print('Running protection on: {}'.format(values_sorted))
 
     for values in values_sorted:
         (print('Selected {}'.format(values)))
 
-        value_update = values.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
+        value_update = normalize_name(values)
 
-        tabletotable(value_update, csv_dir)
+        # sheet_base.csv was written once for the layer in table()
         combine_loose_herds(csv_dir, value_update, csv_protect_output)
-        make_sheet_base(intersect_layer, unique_value, aoi_location, csv_dir)
         protection_grouping(csv_dir, csv_protect_output, table_group)
         protection_classes(csv_dir, csv_protect_output, table_group)
 
 
-prepare_data(root_dir, linework, range_bounds, designated_lands, connPath, username, password, bcgw_inst )
-
-######################################
-arcpy.env.workspace = workspace
-arcpy.env.overwriteOutput = True
-######################################
-
-
-iterate = 0
-for layer_name in layer_name_list:
-
-    intersect_layer = intersect_layer_list[iterate]
-    csv_output_name = csv_output_name_list[iterate]
-    final_output = final_output_list[iterate]
-    csv_protect_output = csv_protect_output_list[iterate]
+# Worker processes import this script, only the process that was started runs the analysis
+if __name__ == "__main__":
+    journal = RunJournal(journal_path)
+    # The interim layers recorded for each herd are kept in the journal, a resumed run can still drop them
+    artifacts.attach(journal)
+
+    prepare_data(root_dir, linework, range_bounds, designated_lands, connPath, username, password, bcgw_inst )
+
+    herd_index = build_herd_index(aoi_location, herd_index_path, unique_value)
+
+    # The tiles are kept across runs while the rows of the designated lands and the tile size are unchanged
+    tile_source = "{}|{}|{}".format(content_fingerprint(designated_lands), tile_size(), ",".join(INDEX_FIELDS))
+    if journal.current(tile_artifacts(tile_gdb), tile_source):
+        print('Designated lands tiles unchanged, reusing {}'.format(tile_gdb))
+    else:
+        journal.rebuild(tile_artifacts(tile_gdb))
+        build_tile_index(designated_lands, tile_gdb)
+        journal.derive(tile_artifacts(tile_gdb), tile_source)
+
+    # The designated lands are flattened by grid cell (largest cells first, on the worker pool) into the provincial flat,
+    # which is kept across runs while the tiles, the designated lands and the kept fields are unchanged
+    flatten_source = "|".join([tile_source] + [fingerprint(artifact) for artifact in tile_artifacts(tile_gdb)] + keep_list)
+    if province_flat and journal.current([province_flat], flatten_source):
+        print('Designated lands unchanged, reusing {}'.format(province_flat))
+    elif province_flat:
+        journal.rebuild([province_flat])
+        cells = pd.Series(get_tile_index(tile_gdb).cells()).sort_values(ascending=False)
+        for cell, seconds in run_herds(cells, protection_cell, (designated_lands, keep_list, tile_gdb), workers,
+                                       label="Cell order (designated lands features)"):
+            collect_finals("flatten", cell)
+            print('{} flattened in {:.0f}s'.format(cell, seconds))
+        merge_protection_cells(cells.index, workspace, province_flat)
+        journal.derive([province_flat], flatten_source)
+
+    ######################################
+    arcpy.env.workspace = workspace
+    arcpy.env.overwriteOutput = True
+    ######################################
+
+
+    iterate = 0
+    for layer_name in layer_name_list:
+
+        intersect_layer = intersect_layer_list[iterate]
+        csv_output_name = csv_output_name_list[iterate]
+        final_output = final_output_list[iterate]
+        csv_protect_output = csv_protect_output_list[iterate]
+
+        layers()
+        # Features and vertices of what each stage reads for a herd, used with the herd area to estimate the herd costs:
+        # the herd's disturbance layer for the disturbance stage, the designated lands tiles over the herd for protection
+        herd_sizes = {values: layer_size(f"{normalize_name(values)}_disturbance_final") for values in herd_values(herd_index, layer_name)}
+        extents = herd_index.loc[herd_index["layer"] == layer_name].dropna(subset=["xmin"]).groupby("Herd_Name").agg(
+            {"xmin": "min", "ymin": "min", "xmax": "max", "ymax": "max"})
+        protection_sizes = {values: get_tile_index(tile_gdb).size(arcpy.Extent(*extent)) for values, extent in zip(extents.index, extents.to_numpy())}
+        stage_inputs = {"disturbance": herd_inputs(herd_index, layer_name, herd_sizes),
+                        "protection": herd_inputs(herd_index, layer_name, protection_sizes)}
+        # Predicted seconds of each herd/stage from the earlier runs' timings, printed with the ETA of the layer
+        predictions = predict_run(stage_inputs, load_timing(timing_report), layer_name, workers)
+        spagh_meatball()
+        # protection runs before the tables as the final identity needs the disturbance and protection flats
+        protection()
+        table()
+        protection_table()
+
+        iterate += 1
+
+    # The herd AOIs held in the memory workspace aren't needed by the reports
+    release_registries()
+ 
+    #%%% Format the output tables to match past final products
+    # Area of each herd/habitat type from the herd index
+    area_df = herd_area(herd_index)
 
-    layers()
-    spagh_meatball()
-    table()
-    protection()
-    protection_table()
+    ########################################## Reports ##########################################
+    yr=datetime.now().year
+    build_disturbance_report(csv_dir, final_output_list, area_df, os.path.join(csv_dir, f"Disturbance Analysis {yr}.xlsx"))
+    build_protection_report(csv_dir, csv_protect_output_list, area_df, os.path.join(csv_dir, f"Protection Analysis {yr}.xlsx"))
 
-    iterate += 1
- 
-#%%% Format the output tables to match past final products
-os.chdir(csv_dir)
-
-# Get area of each habitat type
-arcpy.env.workspace = aoi_location   #.replace('\\','/')[:-1]
-aoilist = arcpy.ListFeatureClasses()
-herd = []
-hab = []
-ha = []
-for aoi in aoilist:
-    with arcpy.da.SearchCursor(aoi, ['Herd_Name', "BCHab_code", 'Shape_Area']) as cursor:
-        for row in cursor:
-            herd.append(row[0])
-            hab.append(row[1])
-            # Convert to ha
-            ha.append(row[2] * 0.0001)
- 
-herd_update = []
-for h in herd:
-    value_update = h.replace(" ", "")
-    value_update = value_update.replace("-", "") 
-    value_update = value_update.replace(":", "") 
-    value_update = value_update.replace("/", "") 
-    herd_update.append(value_update)
-
-area_df = pd.DataFrame({"Herd": herd_update, "Habitat": hab, "Hectare": ha})
-
-########################################## Disturbance ##########################################
-# Write to multiple sheets in the same excel file
-yr=datetime.now().year
-writer = pd.ExcelWriter(f"Disturbance Analysis {yr}.xlsx")
-
-disturb_all_df = pd.DataFrame()
-disturb_percent_all_df = pd.DataFrame()
-for final_output in final_output_list:
-    disturb_df = pd.read_csv(final_output + ".csv")
-
-    # Insert total area
-    rangename = final_output.rsplit("_",-1)[0]
-    ha_val = list(area_df[area_df["Herd"] == rangename]["Hectare"])
-    insert_index = disturb_df.columns.get_loc("Herd_Name") + 1
-    disturb_df.insert(insert_index,'Area (ha)',ha_val)
-    
-    disturb_df = disturb_df.transpose()
-    
-    # Edit row names
-    droplist = ['Unnamed: 0', 'OID_', 'HERD_NO', 'HERD_CODE', 'REGION', 'ECO_GROUP',
-           'COSEWIC_DU_CODE', 'COSEWIC_DU', 'HERD_PLAN', 'STATUS', 'DATE_LOADED',
-           'DATE_APPROVED', 'DATE_RETIRED', 'CENTROID_X', 'CENTROID_Y', "Area_ha",
-           'Species','Herd_id', 'Herd_code','Bc_ecotype_grouping', 'Bc_habitat_type', 
-           'Elevation', 'Season', 'Du_cosewic_2014', 'Designation_cosewic_2014', 'Version']
-    for d in droplist:
-        if d in disturb_df.index:
-            disturb_df.drop(d, axis=0, inplace=True)   
-    for d in disturb_df.index.values:
-        disturb_df = disturb_df.rename(index={d: d.capitalize().replace('Cumuatlive', 'Cumulative')\
-        .replace('buffer', '500m buffer').replace("past 40", "past 40 years").replace("past 80", "past 80 years")})
-        
-    for d in droplist:
-        if d in disturb_df.index:
-            disturb_df.drop(d, axis=0, inplace=True) 
-       
-    # Case by case
-    disturb_df = disturb_df.rename(index={"Bchab_code": "Habitat",\
-                            "Herd_name": "Herd Name","Air (ha)": "Airstrip (ha)", \
-                            "Pipe (ha)": "Pipeline (ha)","Static (ha)": "Static Total (ha)",\
-                            "Air 500m buffer (ha)": "Airstrip 500m buffer (ha)",\
-                            "Pipe 500m buffer (ha)": "Pipeline 500m buffer (ha)",\
-                            "Ag 500m buffer (ha)": "Agriculture 500m buffer (ha)",\
-                            "Static (500m buffer) (ha)": "Static Total 500m buffer (ha)"})
-        
-    if "Bc_ecotype" in disturb_df.index:
-        disturb_df.drop("Bc_ecotype", axis=0, inplace=True) 
-        
-    # Append to total table
-    disturb_all_df = pd.concat([disturb_all_df, disturb_df], axis = 1)
-    
-    #### Percentage ####
-    # Make copy of dataframe so changes don't affect original
-    disturb_percent = disturb_df.copy()
-    
-    for x in list(range(0, len(disturb_percent.columns))):
-        total_area = disturb_percent.loc["Area (ha)",x]
-        # Find non-null values in data value rows, round to 2 decimal place, change to text and put % at end
-        disturb_percent.iloc[3:,x][disturb_percent.iloc[3:,x].notnull()] = \
-            (disturb_percent.iloc[3:,x][disturb_percent.iloc[3:,x].notnull()]\
-             / total_area * 100).astype(float).round(2).astype(str) + '%'
-     
-    # Append to total table
-    disturb_percent_all_df = pd.concat([disturb_percent_all_df, disturb_percent], axis = 1)    
-
-# Delete extraneous field
-if "Area_ha" in disturb_all_df.index:
-    disturb_all_df.drop("Area_ha", axis=0, inplace=True) 
-if "Area_ha" in disturb_percent_all_df.index:
-    disturb_percent_all_df.drop("Area_ha", axis=0, inplace=True) 
-   
-# Correct range name
-disturb_all_df = disturb_all_df.replace(['Klinseza'],'Klinse-za')
-disturb_percent_all_df = disturb_percent_all_df.replace(['Klinseza'],'Klinse-za')
-
-# Rename columns to the range names
-disturb_all_df.columns = disturb_all_df.iloc[0,:]
-disturb_percent_all_df.columns = disturb_percent_all_df.iloc[0,:]
-
-# Filter overall dataset to separate eco groups
-# Boreal
-Boreal_ranges = ['Calendar','Chinchaga','Maxhamish','Snake-Sahtaneh','Westside Fort Nelson']
-disturb_all_df_Boreal = disturb_all_df.loc[:, disturb_all_df.columns.isin(Boreal_ranges)]
-disturb_percent_all_df_Boreal = disturb_percent_all_df.loc[:, disturb_percent_all_df.columns.isin(Boreal_ranges)]
-# Check for naming inconsistency
-for i in list(set(disturb_percent_all_df_Boreal.columns)):
-    if i not in Boreal_ranges:
-        print(i)
-# Northern
-Northern_ranges = ["Atlin", "Carcross", "Edziza", "Finlay", "Frog", "Gataga", 
-                   "Horseranch", "Level-Kawdy", "Liard Plateau", "Little Rancheria",
-                   "Muskwa", "Pink Mountain", "Rabbit", "Spatsizi", "Swan Lake", "Thutade", "Tsenaglode"]
-disturb_all_df_Northern = disturb_all_df.loc[:, disturb_all_df.columns.isin(Northern_ranges)]
-disturb_percent_all_df_Northern = disturb_percent_all_df.loc[:, disturb_percent_all_df.columns.isin(Northern_ranges)]
-# Check for naming inconsistency
-for i in list(set(disturb_percent_all_df_Northern.columns)):
-    if i not in Northern_ranges:
-        print(i)
-# SMC North
-SMC_North_ranges = ["Charlotte Alplands", "Chase", "Graham", "Itcha-Ilgachuz", 
-                    "Rainbows", "Takla", "Telkwa", "Tweedsmuir", "Wolverine"]
-disturb_all_df_SMC_North = disturb_all_df.loc[:, disturb_all_df.columns.isin(SMC_North_ranges)]
-disturb_percent_all_df_SMC_North = disturb_percent_all_df.loc[:, disturb_percent_all_df.columns.isin(SMC_North_ranges)]
-# Check for naming inconsistency
-for i in list(set(disturb_percent_all_df_SMC_North.columns)):
-    if i not in SMC_North_ranges:
-        print(i)
-# SMC Central
-SMC_Central_ranges = ["Klinse-za", "Narraway", "Quintette", "Redrock-Prairie Creek", "Scott"]
-disturb_all_df_SMC_Central = disturb_all_df.loc[:, disturb_all_df.columns.isin(SMC_Central_ranges)]
-disturb_percent_all_df_SMC_Central = disturb_percent_all_df.loc[:, disturb_percent_all_df.columns.isin(SMC_Central_ranges)]
-# Check for naming inconsistency
-for i in list(set(disturb_percent_all_df_SMC_Central.columns)):
-    if i not in SMC_Central_ranges:
-        print(i)
-# SMC South
-SMC_South_ranges = ["Barkerville", "Central Rockies", "Central Selkirks", 
-                    "Columbia North", "Columbia South", "Frisby Boulder", 
-                    "George Mountain", "Groundhog", "Hart Ranges", "Monashee", 
-                    "Narrow Lake", "North Cariboo", "Purcell Central", 
-                    "Purcells South", "South Selkirks", "Wells Gray North", "Wells Gray South"]
-disturb_all_df_SMC_South = disturb_all_df.loc[:, disturb_all_df.columns.isin(SMC_South_ranges)]
-disturb_percent_all_df_SMC_South = disturb_percent_all_df.loc[:, disturb_percent_all_df.columns.isin(SMC_South_ranges)]
-# Check for naming inconsistency
-for i in list(set(disturb_percent_all_df_SMC_South.columns)):
-    if i not in SMC_South_ranges:
-        print(i)
-
-# Write to excel
-disturb_all_df.to_excel(writer, sheet_name = "All Ranges (ha)", header = False)
-disturb_percent_all_df.to_excel(writer, sheet_name = "All Ranges (%)", header = False)
-
-disturb_all_df_Boreal.to_excel(writer, sheet_name = "Boreal (ha)", header = False)
-disturb_percent_all_df_Boreal.to_excel(writer, sheet_name = "Boreal (%)", header = False)
-
-disturb_all_df_Northern.to_excel(writer, sheet_name = "Northern (ha)", header = False)
-disturb_percent_all_df_Northern.to_excel(writer, sheet_name = "Northern  (%)", header = False)
-
-disturb_all_df_SMC_North.to_excel(writer, sheet_name = "SMC - North (ha)", header = False)
-disturb_percent_all_df_SMC_North.to_excel(writer, sheet_name = "SMC - North (%)", header = False)
-
-disturb_all_df_SMC_Central.to_excel(writer, sheet_name = "SMC - Central (ha)", header = False)
-disturb_percent_all_df_SMC_Central.to_excel(writer, sheet_name = "SMC - Central (%)", header = False)
-
-disturb_all_df_SMC_South.to_excel(writer, sheet_name = "SMC - South (ha)", header = False)
-disturb_percent_all_df_SMC_South.to_excel(writer, sheet_name = "SMC - South (%)", header = False)
-
-writer.close()
-
-del(writer)
-
-########################################## Protection ##########################################
-# Write to multiple sheets in the same excel file
-writer = pd.ExcelWriter(f"Protection Analysis {yr}.xlsx")
-    
-prot_all_df = pd.DataFrame()
-prot_percent_all_df = pd.DataFrame()
-for final_output in csv_protect_output_list:
-    rangename = final_output.replace('_protect', '')
-    prot_df1 = pd.read_csv(f"{rangename}_protect_flat.csv") # changed from f"{rangename}_protections_flat.csv"
-
-    # # Add range area in hectares
-    # ha_val = list(area_df[area_df["Herd"] == rangename]["Hectare"])
-    # insert_index = prot_df1.columns.get_loc("Herd_Name") + 1
-    # prot_df1.insert(insert_index,'Area (ha)',ha_val)
-    # Modify the ha_val assignment to handle length mismatch
-    ha_val = list(area_df[area_df["Herd"] == rangename]["Hectare"])
-
-    # Check if we have a length mismatch
-    if len(ha_val) == 1 and len(prot_df1) > 1:
-        # Broadcast the single value to match DataFrame length
-        ha_val = [ha_val[0]] * len(prot_df1)
-    elif len(ha_val) == 0:
-        # Handle case where no matching herd is found
-        print(f"Warning: No area found for herd {rangename}")
-        ha_val = [0] * len(prot_df1)
-    elif len(ha_val) != len(prot_df1):
-        # Handle any other length mismatch
-        print(f"Warning: Area values length ({len(ha_val)}) doesn't match DataFrame length ({len(prot_df1)})")
-        # Use first value or pad with zeros
-        ha_val = [ha_val[0] if ha_val else 0] * len(prot_df1)
-
-    # Now insert with matching lengths
-    insert_index = prot_df1.columns.get_loc("Herd_Name") + 1
-    prot_df1.insert(insert_index, 'Area (ha)', ha_val)
-    
-    prot_df1 = prot_df1.transpose()
-    
-    # Edit row names
-    droplist = ['Unnamed: 0', 'OID_', 'HERD_NO', 'HERD_CODE', 'REGION', 'ECO_GROUP',
-           'COSEWIC_DU_CODE', 'COSEWIC_DU', 'HERD_PLAN', 'STATUS', 'DATE_LOADED',
-           'DATE_APPROVED', 'DATE_RETIRED', 'CENTROID_X', 'CENTROID_Y', "Area_ha", "Area_Ha",
-           'Species','Herd_id', 'Herd_code','Bc_ecotype_grouping', 'Bc_habitat_type', 
-           'Elevation', 'Season', 'Du_cosewic_2014', 'Designation_cosewic_2014', 'Version',
-           'Herd_ID', 'Herd_Code', 'BC_Ecotype_Grouping','BC_Habitat_Type', 'Habitat', 
-           'DU_COSEWIC_2014','Designation_COSEWIC_2014', 'VERSION']
-    for d in droplist:
-        if d in prot_df1.index:
-            prot_df1.drop(d, axis=0, inplace=True)  
-    prot_df1 = prot_df1.rename(index={"BCHab_code": "Habitat",\
-                            "HERD_NAME": "Herd Name", 'Herd_Name': "Herd Name"})
-    
-    # Grouped protection (levels of protection from Forestry, Mining, Oil & Gas) 
-    prot_df2 = pd.read_csv(rangename + "_flat_groupings.csv")
-    
-    prot_df2 = prot_df2.transpose()
-    
-    # Edit row names
-    droplist = ['Unnamed: 0', 'OID_', 'HERD_NO', 'HERD_CODE', 'REGION', 'ECO_GROUP',
-           'COSEWIC_DU_CODE', 'COSEWIC_DU', 'HERD_PLAN', 'STATUS', 'DATE_LOADED',
-           'DATE_APPROVED', 'DATE_RETIRED', 'CENTROID_X', 'CENTROID_Y', "Area_ha", "Area_Ha",
-           'Species','Herd_id', 'Herd_code','Bc_ecotype_grouping', 'Bc_habitat_type', 
-           'Elevation', 'Season', 'Du_cosewic_2014', 'Designation_cosewic_2014', 'Version',
-           "BCHab_code", "HERD_NAME", "Herd_Name",
-           'Herd_ID', 'Herd_Code', 'BC_Ecotype_Grouping','BC_Habitat_Type', 'Habitat', 
-           'DU_COSEWIC_2014','Designation_COSEWIC_2014', 'VERSION']
-    for d in droplist:
-        if d in prot_df2.index:
-            prot_df2.drop(d, axis=0, inplace=True)  
-    
-    # Join together
-    prot_df = pd.concat([prot_df1, prot_df2])
-    
-    # Append to total table
-    prot_all_df = pd.concat([prot_all_df, prot_df], axis = 1)
-    
-    #### Percentage ####
-    # Make copy of dataframe so changes don't affect original
-    prot_percent = prot_df.copy()
-    
-    # for x in list(range(0, len(prot_percent.columns))):
-    #     total_area = prot_percent.loc["Area (ha)",x]
-    #     # Find non-null values in data value rows, round to 2 decimal place, change to text and put % at end
-    #     prot_percent.iloc[3:,x][prot_percent.iloc[3:,x].notnull()] = \
-    #         (prot_percent.iloc[3:,x][prot_percent.iloc[3:,x].notnull()]\
-    #          / total_area * 100).astype(float).round(2).astype(str) + '%'
-    for col in prot_percent.columns:
-        if col != 'Protection':  # Skip non-numeric columns
-            prot_percent[col] = pd.to_numeric(prot_percent[col], errors='coerce')
-
-    # Then at line 458, the division operation should work:
-    (prot_percent.iloc[3:,x][prot_percent.iloc[3:,x].notnull()]\
-    / prot_percent.iloc[0,x]) * 100
-
-    # Append to total table
-    prot_percent_all_df = pd.concat([prot_percent_all_df, prot_percent], axis = 1) 
-        
-# Correct range name
-prot_all_df = prot_all_df.replace(['Klinseza'],'Klinse-za')
-prot_percent_all_df = prot_percent_all_df.replace(['Klinseza'],'Klinse-za')
-
-# Rename columns to the range names
-prot_all_df.columns = prot_all_df.iloc[0,:]
-prot_percent_all_df.columns = prot_percent_all_df.iloc[0,:]
-
-# Filter overall dataset to separate eco groups
-# Boreal
-Boreal_ranges = ['Calendar','Chinchaga','Maxhamish','Snake-Sahtaneh','Westside Fort Nelson']
-prot_all_df_Boreal = prot_all_df.loc[:, prot_all_df.columns.isin(Boreal_ranges)]
-prot_percent_all_df_Boreal = prot_percent_all_df.loc[:, prot_percent_all_df.columns.isin(Boreal_ranges)]
-# Check for naming inconsistency
-for i in list(set(prot_percent_all_df_Boreal.columns)):
-    if i not in Boreal_ranges:
-        print(i)
-# Northern
-Northern_ranges = ["Atlin", "Carcross", "Edziza", "Finlay", "Frog", "Gataga", 
-                   "Horseranch", "Level-Kawdy", "Liard Plateau", "Little Rancheria",
-                   "Muskwa", "Pink Mountain", "Rabbit", "Spatsizi", "Swan Lake", "Thutade", "Tsenaglode"]
-prot_all_df_Northern = prot_all_df.loc[:, prot_all_df.columns.isin(Northern_ranges)]
-prot_percent_all_df_Northern = prot_percent_all_df.loc[:, prot_percent_all_df.columns.isin(Northern_ranges)]
-# Check for naming inconsistency
-for i in list(set(prot_percent_all_df_Northern.columns)):
-    if i not in Northern_ranges:
-        print(i)
-# SMC North
-SMC_North_ranges = ["Charlotte Alplands", "Chase", "Graham", "Itcha-Ilgachuz", 
-                    "Rainbows", "Takla", "Telkwa", "Tweedsmuir", "Wolverine"]
-prot_all_df_SMC_North = prot_all_df.loc[:, prot_all_df.columns.isin(SMC_North_ranges)]
-prot_percent_all_df_SMC_North = prot_percent_all_df.loc[:, prot_percent_all_df.columns.isin(SMC_North_ranges)]
-# Check for naming inconsistency
-for i in list(set(prot_percent_all_df_SMC_North.columns)):
-    if i not in SMC_North_ranges:
-        print(i)
-# SMC Central
-SMC_Central_ranges = ["Klinse-za", "Narraway", "Quintette", "Redrock-Prairie Creek", "Scott"]
-prot_all_df_SMC_Central = prot_all_df.loc[:, prot_all_df.columns.isin(SMC_Central_ranges)]
-prot_percent_all_df_SMC_Central = prot_percent_all_df.loc[:, prot_percent_all_df.columns.isin(SMC_Central_ranges)]
-# Check for naming inconsistency
-for i in list(set(prot_percent_all_df_SMC_Central.columns)):
-    if i not in SMC_Central_ranges:
-        print(i)
-# SMC South
-SMC_South_ranges = ["Barkerville", "Central Rockies", "Central Selkirks", 
-                    "Columbia North", "Columbia South", "Frisby Boulder", 
-                    "George Mountain", "Groundhog", "Hart Ranges", "Monashee", 
-                    "Narrow Lake", "North Cariboo", "Purcell Central", 
-                    "Purcells South", "South Selkirks", "Wells Gray North", "Wells Gray South"]
-prot_all_df_SMC_South = prot_all_df.loc[:, prot_all_df.columns.isin(SMC_South_ranges)]
-prot_percent_all_df_SMC_South = prot_percent_all_df.loc[:, prot_percent_all_df.columns.isin(SMC_South_ranges)]
-# Check for naming inconsistency
-for i in list(set(prot_percent_all_df_SMC_South.columns)):
-    if i not in SMC_South_ranges:
-        print(i)
-
-# Write to excel
-prot_all_df.to_excel(writer, sheet_name = "All Ranges (ha)", header = False)
-prot_percent_all_df.to_excel(writer, sheet_name = "All Ranges (%)", header = False)
-
-prot_all_df_Boreal.to_excel(writer, sheet_name = "Boreal (ha)", header = False)
-prot_percent_all_df_Boreal.to_excel(writer, sheet_name = "Boreal (%)", header = False)
-
-prot_all_df_Northern.to_excel(writer, sheet_name = "Northern (ha)", header = False)
-prot_percent_all_df_Northern.to_excel(writer, sheet_name = "Northern  (%)", header = False)
-
-prot_all_df_SMC_North.to_excel(writer, sheet_name = "SMC - North (ha)", header = False)
-prot_percent_all_df_SMC_North.to_excel(writer, sheet_name = "SMC - North (%)", header = False)
-
-prot_all_df_SMC_Central.to_excel(writer, sheet_name = "SMC - Central (ha)", header = False)
-prot_percent_all_df_SMC_Central.to_excel(writer, sheet_name = "SMC - Central (%)", header = False)
-
-prot_all_df_SMC_South.to_excel(writer, sheet_name = "SMC - South (ha)", header = False)
-prot_percent_all_df_SMC_South.to_excel(writer, sheet_name = "SMC - South (%)", header = False)
-
-writer.close()
-
-del(writer)
+    # Every step of the run is done, the next start begins a new run
+    journal.finish()
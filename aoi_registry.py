@@ -0,0 +1,95 @@
+'''
+    Herd AOI registry
+
+    Purpose:   Materialize every herd's AOI once per source layer (the AOI layer or the intersect layer) in the memory
+               workspace, instead of selecting the herd and copying it to a shared 'aoi' feature class in every stage.
+               Each entry keeps the memory handle used as a tool input, the herd's dissolved geometry and its envelope
+               so spatial predicates can reject features on the envelope before testing the geometry.
+'''
+import arcpy
+import os
+from collections import namedtuple
+from herd_index import normalize_name
+from partition import partition_features
+from scratch import hold
+
+AoiEntry = namedtuple("AoiEntry", ["herd", "handle", "geometry", "extent"])
+
+# One registry per (source layer, herd field), built the first time a stage asks for it
+_registries = {}
+
+
+def envelopes_overlap(a, b):
+    return not (a.XMax < b.XMin or a.XMin > b.XMax or a.YMax < b.YMin or a.YMin > b.YMax)
+
+
+class AoiRegistry:
+    """Herd AOIs of one source layer, keyed by the herd name"""
+
+    def __init__(self, source, unique_value="Herd_Name", workspace="memory", prefix="aoi"):
+        self.source = source
+        self.unique_value = unique_value
+        self.entries = {}
+
+        # One pass over the source writes every herd to its own memory feature class
+        outputs = partition_features(source, workspace, unique_value,
+                                     lambda herd: f"{prefix}_{normalize_name(herd)}" if herd else None)
+
+        for name, (herd, count) in outputs.items():
+            handle = os.path.join(workspace, name)
+            hold(handle)
+            geometry = None
+            with arcpy.da.SearchCursor(handle, ["SHAPE@"]) as cursor:
+                for row in cursor:
+                    if row[0] is not None:
+                        geometry = row[0] if geometry is None else geometry.union(row[0])
+            self.entries[herd] = AoiEntry(herd, handle, geometry, geometry.extent if geometry else None)
+
+        print(f"AOI registry for {source}: {len(self.entries)} herds")
+
+    def __contains__(self, herd):
+        return herd in self.entries
+
+    def herds(self):
+        return sorted(self.entries)
+
+    def handle(self, herd):
+        """Memory feature class of the herd's AOI, with the source attributes, to use as a tool input"""
+        return self.entries[herd].handle
+
+    def geometry(self, herd):
+        return self.entries[herd].geometry
+
+    def extent(self, herd):
+        return self.entries[herd].extent
+
+    def intersects(self, herd, geometry):
+        """Envelope test first, the exact predicate only runs on geometry whose envelope overlaps the herd"""
+        entry = self.entries[herd]
+        if entry.geometry is None or geometry is None:
+            return False
+        if not envelopes_overlap(entry.extent, geometry.extent):
+            return False
+        return not entry.geometry.disjoint(geometry)
+
+    def release(self):
+        """Delete the memory feature classes once the run is done with them"""
+        for entry in self.entries.values():
+            if arcpy.Exists(entry.handle):
+                arcpy.Delete_management(entry.handle)
+        self.entries = {}
+
+
+def get_registry(source, unique_value="Herd_Name"):
+    """Registry for the source layer, built on first use and shared by every later stage"""
+    key = (source, unique_value)
+    if key not in _registries:
+        prefix = "aoi_{}".format(normalize_name(os.path.basename(source)))
+        _registries[key] = AoiRegistry(source, unique_value, prefix=prefix)
+    return _registries[key]
+
+
+def release_registries():
+    for registry in _registries.values():
+        registry.release()
+    _registries.clear()
@@ -0,0 +1,108 @@
+'''
+    Artifact manager for the per herd stages
+
+    Purpose:   Give every herd/stage its own scratch namespace and keep a registry of the layers each herd leaves in
+               the output gdb, so clean up drops one namespace or the recorded layers of one herd instead of listing
+               the whole output gdb and deleting by suffix. Herds never touch each other's layers, so stages for
+               different herds can run side by side.
+
+               A namespace is a scratch gdb per herd/stage in the local scratch folder, deleted in one operation when
+               the stage is done. With INTERMEDIATE_WORKSPACE=memory the namespace is the memory workspace (until the
+               memory budget is reached) and only the datasets the stage created are deleted.
+
+               With a run journal attached the records are kept in it (see journal.py) and survive a restart,
+               otherwise they only live as long as the process.
+'''
+import arcpy
+import os
+from contextlib import contextmanager
+from scratch import intermediate_mode, over_budget, scratch_folder, list_datasets, is_held
+
+# One manager per output gdb, shared by the stages
+_managers = {}
+
+
+class ArtifactManager:
+    """Scratch namespaces and the recorded interim layers of every herd for one output gdb"""
+
+    def __init__(self, output_gdb, scratch_root=None):
+        self.output_gdb = output_gdb
+        self.scratch_root = scratch_root or scratch_folder()
+        self.produced = {}
+        self.journal = None
+
+    def attach(self, journal):
+        """Keep the records in the run journal from here on"""
+        self.journal = journal
+
+    def record(self, herd, stage, *names):
+        """Register interim layers a stage wrote to the output gdb for a herd"""
+        if self.journal:
+            self.journal.record(self.output_gdb, herd, stage, names)
+        else:
+            self.produced.setdefault((herd, stage), set()).update(names)
+
+    def drop(self, herd, stage=None):
+        """Delete the layers recorded for a herd, for one stage or all of them"""
+        if self.journal:
+            records = self.journal.produced(self.output_gdb, herd, stage)
+        else:
+            records = [(key[1], name) for key in [key for key in self.produced if key[0] == herd and stage in (None, key[1])]
+                       for name in sorted(self.produced.pop(key))]
+        for record_stage, name in records:
+            path = os.path.join(self.output_gdb, name)
+            if arcpy.Exists(path):
+                arcpy.Delete_management(path)
+            if self.journal:
+                self.journal.forget(self.output_gdb, herd, record_stage, [name])
+
+    def namespace_path(self, herd, stage):
+        return os.path.join(self.scratch_root, f"{herd}_{stage}.gdb")
+
+    @contextmanager
+    def namespace(self, herd, stage, inputs=(), finals=(), output_gdb=None):
+        """
+        Run a stage with its own scratch namespace as arcpy.env.workspace
+
+        inputs: layers in the output gdb the stage reads by name
+        finals: layers the stage produces that are written to the output gdb, everything else is dropped with the
+                namespace
+        output_gdb: gdb the finals are written to instead of the output gdb
+        """
+        output_gdb = output_gdb or self.output_gdb
+        if intermediate_mode() == "memory" and not over_budget():
+            target = "memory"
+            existing = set(list_datasets(target))
+        else:
+            target = self.namespace_path(herd, stage)
+            if arcpy.Exists(target):
+                arcpy.Delete_management(target)
+            arcpy.management.CreateFileGDB(self.scratch_root, os.path.basename(target))
+            existing = None
+
+        try:
+            for name in inputs:
+                if arcpy.Exists(os.path.join(self.output_gdb, name)):
+                    arcpy.CopyFeatures_management(os.path.join(self.output_gdb, name), os.path.join(target, name))
+
+            with arcpy.EnvManager(workspace=target):
+                yield target
+
+            for name in finals:
+                if arcpy.Exists(os.path.join(target, name)):
+                    arcpy.CopyFeatures_management(os.path.join(target, name), os.path.join(output_gdb, name))
+                    print(f"{name} written to {output_gdb}")
+        finally:
+            if existing is None:
+                # The whole namespace goes in one operation
+                arcpy.Delete_management(target)
+            else:
+                for name in set(list_datasets(target)) - existing:
+                    if not is_held(name):
+                        arcpy.Delete_management(os.path.join(target, name))
+
+
+def get_artifacts(output_gdb):
+    if output_gdb not in _managers:
+        _managers[output_gdb] = ArtifactManager(output_gdb)
+    return _managers[output_gdb]
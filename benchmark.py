@@ -0,0 +1,246 @@
+'''
+    Benchmark of the per herd stages on a synthetic province
+
+    Purpose:   Generate a synthetic province at each density scale (see synthetic_province.py), run every stage on
+               the open backend (see open_backend.py) and time it. static_grouping and protection_classes are the
+               table_create/protection_table functions used by Run_Disturbance, run on the csv files the stages write.
+
+    Outputs:   <output>.json with the run settings, feature counts, per stage seconds/features/throughput for every
+               scale and the scaling exponent of each stage (seconds ~ scale ** exponent), and <output>.csv with one
+               row per scale and stage
+
+    Usage:     python benchmark.py --scales 1 5 20 --herds 12 --output benchmark_results
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import open_backend as backend
+from synthetic_province import generate_province
+from fetch import fetch_all, fetch_pool
+from extraction import pest_rules, pest_query
+from table_create import static_grouping
+from protection_table import protection_classes
+
+STAGES = ["extraction selection", "linear buffers", "merge clip dissolve", "500m buffers", "intersect", "flatten",
+          "field mapping", "identity", "static_grouping", "protection_classes"]
+
+TABLE_GROUP = ["Herd_Name", "BCHab_code"]
+
+# disturbance name: CEF_DISTURB_GROUP of each BCCE layer
+BCCE_GROUPS = {"urban": "Urban", "ag": "Agriculture_and_Clearing", "seismic": "OGC_Geophysical",
+               "mining": "Mining_and_Extraction"}
+
+# source: (synthetic layer, attribute query, split field, [(disturbance name, split value)]) as the sources are set up
+# in disturbance_aoi, the BCCE is read once and split into its four layers
+SOURCES = {name: (name, None, None, [(name, None)]) for name in ["rail", "fire_historical", "fire_current", "cutblock", "roads"]}
+SOURCES["bcce"] = ("bcce", lambda layer: layer["CEF_DISTURB_GROUP"].isin(BCCE_GROUPS.values()), "CEF_DISTURB_GROUP",
+                   list(BCCE_GROUPS.items()))
+SOURCES["pest"] = ("pest", lambda layer: pest_selection(layer, *pest_rules()), None, [("pest", None)])
+
+# The same queries as SQL for the GeoPackage stand-in, as disturbance_aoi sends them to the BCCE/BCGW
+FETCH_QUERIES = {
+    "bcce": "CEF_DISTURB_GROUP IN ({})".format(", ".join(f"'{group}'" for group in BCCE_GROUPS.values())),
+    "pest": pest_query(),
+}
+
+
+def pest_selection(layer, species, severity):
+    """The pest rows pest_query selects from the BCGW"""
+    selected = layer["PEST_SPECIES_CODE"].isin(species)
+    return selected & layer["PEST_SEVERITY_CODE"].isin(severity) if severity else selected
+
+
+class StageTimer:
+    """Seconds and features processed per stage, summed over the herds"""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.features = dict.fromkeys(STAGES, 0)
+
+    @contextlib.contextmanager
+    def stage(self, name, features):
+        start = time.perf_counter()
+        yield
+        self.seconds[name] += time.perf_counter() - start
+        self.features[name] += int(features)
+
+    def results(self):
+        return {name: {"seconds": round(self.seconds[name], 4), "features": self.features[name],
+                       "throughput": round(self.features[name] / self.seconds[name], 2) if self.seconds[name] else None}
+                for name in STAGES}
+
+
+def run_herd(province, herd, timer):
+    """Every per herd stage from extraction to the final identity, returns the herd's final flat table"""
+    aoi = province["boundaries"].loc[province["boundaries"]["Herd_Name"] == herd, "geometry"].iloc[0]
+    habitat = province["habitat"][province["habitat"]["Herd_Name"] == herd].reset_index(drop=True)
+
+    with timer.stage("extraction selection", sum(len(province[layer]) for layer, *_ in SOURCES.values())
+                     + len(province["designated_lands"])):
+        extracted = {name: output for layer, query, split_field, outputs in SOURCES.values()
+                     for name, output in backend.split_source(backend.select_intersecting(province[layer], aoi, query),
+                                                              outputs, split_field).items()}
+        designated = backend.select_intersecting(province["designated_lands"], aoi)
+
+    with timer.stage("linear buffers", sum(len(extracted[name]) for name in extracted if name in backend.LINEAR_BUFFERS)):
+        layers = [backend.buffer_layer(layer, *backend.LINEAR_BUFFERS[name]) if name in backend.LINEAR_BUFFERS
+                  else layer for name, layer in extracted.items()]
+
+    with timer.stage("merge clip dissolve", sum(len(layer) for layer in layers) + len(designated)):
+        disturbance = backend.merge_clip_dissolve(layers, aoi)
+        designated = backend.merge_clip_dissolve([designated], aoi, backend.PROTECTION_FIELDS)
+
+    with timer.stage("500m buffers", len(disturbance)):
+        buffered = backend.buffer_disturbance(disturbance)
+
+    with timer.stage("intersect", len(disturbance) + len(buffered)):
+        disturbance = backend.intersect(disturbance, habitat)
+        buffered = backend.intersect(buffered, habitat)
+
+    with timer.stage("flatten", len(disturbance) + len(buffered) + len(designated)):
+        faces = backend.flatten(disturbance["geometry"].values)
+        buffer_faces = backend.flatten(buffered["geometry"].values)
+        protect_faces = backend.flatten(designated["geometry"].values)
+
+    with timer.stage("field mapping", len(faces) + len(buffer_faces) + len(protect_faces)):
+        flat = backend.field_mapping(faces, disturbance, backend.DISTURBANCE_FIELD_MAPS)
+        flat = flat.rename(columns={"Join_Count": "Number_Disturbance"})
+        buffer_flat = backend.field_mapping(buffer_faces, buffered, backend.BUFFER_FIELD_MAPS)
+        buffer_flat = buffer_flat.rename(columns={"Join_Count": "Number_Disturbance_buff"})
+        protect_flat = backend.field_mapping(protect_faces, designated, backend.PROTECTION_FIELD_MAPS)
+        protect_flat = protect_flat.rename(columns={"Join_Count": "Number_Protection"}).drop(columns="area_ha", errors="ignore")
+
+    aoi_table = habitat.assign(Area_Ha=habitat["geometry"].map(lambda geometry: geometry.area / 10000))
+    with timer.stage("identity", len(flat) + len(buffer_flat) + len(protect_flat)):
+        final = backend.identity(aoi_table, [(flat, "_1"), (buffer_flat, "_12"), (protect_flat, "_13")])
+
+    return final.drop(columns="geometry")
+
+
+def run_tables(province, finals, timer, csv_dir):
+    """static_grouping and protection_classes on the combined herd tables, as Run_Disturbance runs them"""
+    csv_output_name, final_output, csv_protect_output = "bench_output", "bench_final", "bench_protect"
+
+    flat = pd.concat(finals, ignore_index=True)
+    # combine_loose_sheets and combine_loose_herds write the combined tables with the index
+    flat.to_csv(os.path.join(csv_dir, f"{csv_output_name}.csv"))
+    flat.to_csv(os.path.join(csv_dir, f"{csv_protect_output}.csv"))
+
+    sheet_base = province["habitat"].drop(columns="geometry").assign(
+        Shape_Length=province["habitat"]["geometry"].map(lambda geometry: geometry.length),
+        Shape_Area=province["habitat"]["geometry"].map(lambda geometry: geometry.area))
+    sheet_base.to_csv(os.path.join(csv_dir, "sheet_base.csv"), index=False)
+
+    # The table functions print every intermediate table
+    with contextlib.redirect_stdout(io.StringIO()):
+        with timer.stage("static_grouping", len(flat)):
+            static_grouping(csv_dir, csv_output_name, TABLE_GROUP, final_output)
+        with timer.stage("protection_classes", len(flat)):
+            protection_classes(csv_dir, csv_protect_output, TABLE_GROUP)
+
+
+def run_fetch(province, csv_dir, latency, workers):
+    """Fetch every source of the first herd from a GeoPackage stand-in for the BCGW, one after another and concurrently"""
+    path = os.path.join(csv_dir, "bcgw_standin.gpkg")
+    backend.write_gpkg({layer: province[layer] for layer in sorted({layer for layer, *_ in SOURCES.values()})}, path)
+
+    aoi = province["boundaries"]["geometry"].iloc[0]
+    jobs = [(name, (path, layer, FETCH_QUERIES.get(name), aoi, outputs, split_field, latency))
+            for name, (layer, query, split_field, outputs) in SOURCES.items()]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        fetch_all(backend.fetch_gpkg, jobs, retries=1)
+        sequential = time.perf_counter() - start
+
+        # The open reader is thread safe, arcpy needs the process pool
+        pool = fetch_pool(workers, processes=False)
+        start = time.perf_counter()
+        results = fetch_all(backend.fetch_gpkg, jobs, pool, retries=1)
+        concurrent = time.perf_counter() - start
+        if pool:
+            pool.shutdown()
+
+    return {"sources": len(jobs), "latency": latency, "workers": workers,
+            "sequential_seconds": round(sequential, 4), "concurrent_seconds": round(concurrent, 4),
+            "slowest_source_seconds": round(max(r.seconds for r in results.values()), 4),
+            "source_seconds": {name: round(r.seconds, 4) for name, r in results.items()},
+            "features": {name: len(layer) for r in results.values() for name, layer in r.result.items()}}
+
+
+def run_scale(herds, scale, seed, fetch_latency=0.5, fetch_workers=len(SOURCES)):
+    start = time.perf_counter()
+    province = generate_province(herds, scale, seed)
+    generated = time.perf_counter() - start
+    print(f"Scale {scale}: province generated in {generated:.1f}s "
+          f"({', '.join(f'{name} {len(layer)}' for name, layer in province.items())})")
+
+    timer = StageTimer()
+    finals = [run_herd(province, herd, timer) for herd in province["boundaries"]["Herd_Name"]]
+    with tempfile.TemporaryDirectory() as csv_dir:
+        run_tables(province, finals, timer, csv_dir)
+        fetch = run_fetch(province, csv_dir, fetch_latency, fetch_workers)
+
+    for name, result in timer.results().items():
+        print(f"  {name:<22}{result['seconds']:>10.3f}s {result['features']:>10} features")
+    print(f"  fetch {fetch['sources']} sources: {fetch['sequential_seconds']:.3f}s one after another, "
+          f"{fetch['concurrent_seconds']:.3f}s on {fetch['workers']} workers (slowest source {fetch['slowest_source_seconds']:.3f}s)")
+
+    return {"scale": scale, "generate_seconds": round(generated, 4),
+            "features": {name: len(layer) for name, layer in province.items()},
+            "flat_records": int(sum(len(final) for final in finals)),
+            "stages": timer.results(), "fetch": fetch}
+
+
+def scaling(runs):
+    """Per stage seconds over the scales and the log-log slope (1 is linear in the feature density)"""
+    curves = {}
+    for name in STAGES:
+        points = [(run["scale"], run["stages"][name]["seconds"]) for run in runs if run["stages"][name]["seconds"]]
+        exponent = None
+        if len({scale for scale, _ in points}) > 1:
+            exponent = round(float(np.polyfit(np.log([p[0] for p in points]), np.log([p[1] for p in points]), 1)[0]), 3)
+        curves[name] = {"scales": [p[0] for p in points], "seconds": [p[1] for p in points], "exponent": exponent}
+    return curves
+
+
+def write_results(results, output):
+    with open(f"{output}.json", "w") as json_file:
+        json.dump(results, json_file, indent=2)
+
+    rows = [{"scale": run["scale"], "stage": name, **stage} for run in results["runs"]
+            for name, stage in run["stages"].items()]
+    pd.DataFrame(rows).to_csv(f"{output}.csv", index=False)
+    print(f"Benchmark results written to {output}.json and {output}.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the per herd stages on a synthetic province")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 5, 20],
+                        help="feature density as a multiple of the provincial density")
+    parser.add_argument("--herds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results")
+    parser.add_argument("--fetch-latency", type=float, default=0.5,
+                        help="seconds added to every source read of the GeoPackage stand-in for the BCGW round trips")
+    parser.add_argument("--fetch-workers", type=int, default=len(SOURCES))
+    args = parser.parse_args()
+
+    import shapely
+    runs = [run_scale(args.herds, scale, args.seed, args.fetch_latency, args.fetch_workers) for scale in args.scales]
+    results = {"created": datetime.now().isoformat(timespec="seconds"), "herds": args.herds, "seed": args.seed,
+               "python": platform.python_version(), "shapely": shapely.__version__, "pandas": pd.__version__,
+               "runs": runs, "scaling": scaling(runs)}
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -28,15 +28,36 @@ import socket
 import pandas as pd
 import dotenv
 from datetime import datetime
+from precision import get_profile, generalize, densify_buffer, write_precision_report
+from herd_index import herd_values, normalize_name
+from aoi_registry import get_registry
+from scratch import intermediate, scratch_folder
+from artifacts import get_artifacts
+from fetch import fetch_pool, fetch_all, fetch_source, fetch_gdb, connect_worker, write_fetch_report
+from extraction import pest_query, SOURCE_MARGIN
 
 root_dir=os.getenv("ROOT_DIR")
 workspace= os.path.join(root_dir, os.getenv("OUTPUT_GDB"))
 arcpy.env.overwriteOutput = True
 arcpy.env.workspace = workspace
-def disturbance_aoi(connPath, connFile, username, password, aoi_location, layer_name, unique_value, roads_file, bcce_file,inst):
+artifacts = get_artifacts(workspace)
+# Journal steps of the layer stage of a herd in order, with the layers each one writes (see journal.py)
+LAYER_STEPS = {"extract": ["disturbance"], "buffer": ["disturbance_buffer"],
+               "intersect": ["disturbance_intersect", "disturbance_buffer_intersect"],
+               "final": ["disturbance_final", "disturbance_buffer_final"]}
+def layer_artifacts(value_update, stage):
+    return [os.path.join(workspace, '{}_{}'.format(value_update, suffix)) for suffix in LAYER_STEPS[stage]]
+# herds: the herds to extract, every herd of the layer when not given
+def disturbance_aoi(connPath, connFile, username, password, aoi_location, layer_name, unique_value, roads_file, bcce_file,inst, herd_index, precision_report=None, journal=None, fetch_report=None, herds=None):
     if arcpy.Exists(f"{layer_name}_disturbance"):
         print('disturbance aoi finished moving on to next step')
         return
+
+    # Precision profile applied to every layer as it is extracted (see precision.py)
+    profile = get_profile()
+    print('Precision profile: {}'.format(profile['name']))
+    if precision_report and os.path.exists(precision_report):
+        os.remove(precision_report)
     bcgwConn = os.path.join(connPath, connFile)
     try:
                 arcpy.CreateDatabaseConnection_management(out_folder_path=connPath,
@@ -53,357 +74,268 @@ def disturbance_aoi(connPath, connFile, username, password, aoi_location, layer_
 
     aoi = (os.path.join(aoi_location,layer_name))
 
-    search_word = str(unique_value)
-
     print(aoi)
-    print(search_word)
 
-    with arcpy.da.SearchCursor(aoi, [search_word]) as cursor:
-        values_sorted = sorted({row[0] for row in cursor})
+    values_sorted = herd_values(herd_index, layer_name) if herds is None else herds
     print('Running disturbance on: {}'.format(values_sorted))
+    aoi_registry = get_registry(aoi, unique_value)
 
-    for values in values_sorted:
-        layer_query = """{0} = '{1}'""".format(unique_value, values)
-        layer_select = arcpy.SelectLayerByAttribute_management(aoi, "NEW_SELECTION", layer_query)
-        arcpy.CopyFeatures_management(layer_select, 'aoi')
-
-        (print('Selected {}'.format(values)))
-
-        # # Update values name to allow it to be a naming convention for layer use
-        value_update = values.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
-
-        # #Local disturbance variables from the BCGW:
-        rail = (bcgwConn + "\\WHSE_BASEMAPPING.GBA_RAILWAY_TRACKS_SP") #open
-        transmission = (bcgwConn + "\\WHSE_BASEMAPPING.GBA_TRANSMISSION_LINES_SP") #open
-        pipe = (bcgwConn + "\\WHSE_MINERAL_TENURE.OG_PIPELINE_AREA_PERMIT_SP") #closed
-        well = (bcgwConn + "\\WHSE_MINERAL_TENURE.OG_WELL_FACILITY_PERMIT_SP") #closed
-        air = (bcgwConn + "\\WHSE_BASEMAPPING.TRIM_EBM_AIRFIELDS") #closed
-        dam = (bcgwConn + "\\WHSE_WATER_MANAGEMENT.WRIS_DAMS_PUBLIC_SVW") #open
-        reservoir = (bcgwConn + "\\WHSE_WATER_MANAGEMENT.WLS_RESERVOIR_PMT_LICENSEE_SP") #open
-        fire_historical = (bcgwConn + "\\WHSE_LAND_AND_NATURAL_RESOURCE.PROT_HISTORICAL_FIRE_POLYS_SP") #open
-        fire_current = (bcgwConn + "\\WHSE_LAND_AND_NATURAL_RESOURCE.PROT_CURRENT_FIRE_POLYS_SP") #closed
-        cutblock = (bcgwConn + "\\WHSE_FOREST_VEGETATION.VEG_CONSOLIDATED_CUT_BLOCKS_SP") #closed
-        pest = (bcgwConn + "\\WHSE_FOREST_VEGETATION.PEST_INFESTATION_POLY") #closed
-
-        # Roads data from the BCCE
-        roads = roads_file
-        # Human disturbance data from the BCCE
-        bcce = bcce_file
-
-        # Setting up the dictionary
-        disturbance_dictionary = {"rail": rail, "transmission": transmission, "pipe":pipe, "well":well, "air":air, "dam":dam, "reservoir":reservoir, "fire_historical": fire_historical, "fire_current": fire_current, "cutblock": cutblock ,"roads": roads}
-        print("dictionary setup")
-
-        #runs through the dictionary and for each item it select layers that intersect with the AOI (values boundary) and copies them out
-        for name,layer in zip(disturbance_dictionary.keys(), disturbance_dictionary.values()):
-                arcpy.MakeFeatureLayer_management(layer, "{}_lyr".format(name))
-                arcpy.SelectLayerByLocation_management('{}_lyr'.format(name), "INTERSECT", 'aoi')
-                arcpy.CopyFeatures_management('{}_lyr'.format(name), '{}_{}'.format(name, value_update))
-                print('copied {} {}'.format(name, values))
-
-                #add field of type and disturbance for each disturbance
-                arcpy.AddField_management('{}_{}'.format(name, value_update), "type", "TEXT")
-                arcpy.AddField_management('{}_{}'.format(name, value_update), "disturbance", "TEXT")
-                arcpy.AddField_management('{}_{}'.format(name, value_update), "year", "SHORT")
-                arcpy.AddField_management('{}_{}'.format(name, value_update), "severity", "TEXT")
-
-                print('Field added')
-                
-                # Add in the year to the cutblock layer
-                if name.startswith('cut'):
-                    arcpy.CalculateField_management('{}_{}'.format(name, value_update), "type", '''"Temporal"''', "PYTHON")
-                    
-                    # cut_select = "!HARVEST_YEAR!"
-                    cut_select = "!HARVEST_START_YEAR_CALENDAR!"
-                    arcpy.CalculateField_management('{}_{}'.format(name, value_update), "year", cut_select)
-                    print('done cutblock')
-
-                # Add in the year to the fire layer
-                elif name.startswith('fire'):
-                    arcpy.CalculateField_management('{}_{}'.format(name, value_update), "type", '''"Temporal"''', "PYTHON")
-                    
-                    fire_select = "!FIRE_YEAR!"
-                    arcpy.CalculateField_management('{}_{}'.format(name, value_update), "year", fire_select)
+    # One pool of fetch workers for every herd, starting arcpy in a worker process is slow (see fetch.py), none when
+    # every herd was extracted in an earlier attempt
+    pool = fetch_pool(initializer=connect_worker, initargs=(bcgwConn, inst, username, password)) if values_sorted else None
+    fetch_root = scratch_folder()
+    if fetch_report and os.path.exists(fetch_report):
+        os.remove(fetch_report)
 
+    try:
+        for values in values_sorted:
+            aoi_fc = aoi_registry.handle(values)
+
+            (print('Selected {}'.format(values)))
+            precision_rows = []
+
+            # # Update values name to allow it to be a naming convention for layer use
+            value_update = values.replace(" ", "")
+            value_update = value_update.replace("-", "") 
+            value_update = value_update.replace(":", "") 
+            value_update = value_update.replace("/", "") 
+
+            # Anything an interrupted attempt left of the herd's disturbance layer is deleted first (see journal.py)
+            herd_disturbance = layer_artifacts(value_update, "extract")
+            if journal:
+                journal.begin(layer_name, values, "extract", herd_disturbance)
+
+            # #Local disturbance variables from the BCGW:
+            rail = (bcgwConn + "\\WHSE_BASEMAPPING.GBA_RAILWAY_TRACKS_SP") #open
+            transmission = (bcgwConn + "\\WHSE_BASEMAPPING.GBA_TRANSMISSION_LINES_SP") #open
+            pipe = (bcgwConn + "\\WHSE_MINERAL_TENURE.OG_PIPELINE_AREA_PERMIT_SP") #closed
+            well = (bcgwConn + "\\WHSE_MINERAL_TENURE.OG_WELL_FACILITY_PERMIT_SP") #closed
+            air = (bcgwConn + "\\WHSE_BASEMAPPING.TRIM_EBM_AIRFIELDS") #closed
+            dam = (bcgwConn + "\\WHSE_WATER_MANAGEMENT.WRIS_DAMS_PUBLIC_SVW") #open
+            reservoir = (bcgwConn + "\\WHSE_WATER_MANAGEMENT.WLS_RESERVOIR_PMT_LICENSEE_SP") #open
+            fire_historical = (bcgwConn + "\\WHSE_LAND_AND_NATURAL_RESOURCE.PROT_HISTORICAL_FIRE_POLYS_SP") #open
+            fire_current = (bcgwConn + "\\WHSE_LAND_AND_NATURAL_RESOURCE.PROT_CURRENT_FIRE_POLYS_SP") #closed
+            cutblock = (bcgwConn + "\\WHSE_FOREST_VEGETATION.VEG_CONSOLIDATED_CUT_BLOCKS_SP") #closed
+            pest = (bcgwConn + "\\WHSE_FOREST_VEGETATION.PEST_INFESTATION_POLY") #closed
+
+            # Roads data from the BCCE
+            roads = roads_file
+            # Human disturbance data from the BCCE
+            bcce = bcce_file
+
+            # Setting up the dictionary
+            disturbance_dictionary = {"rail": rail, "transmission": transmission, "pipe":pipe, "well":well, "air":air, "dam":dam, "reservoir":reservoir, "fire_historical": fire_historical, "fire_current": fire_current, "cutblock": cutblock ,"roads": roads}
+            print("dictionary setup")
+
+            #Setting up the CEF_DISTURB_GROUP of each BCCE layer and the pest query
+            bcce_groups = {"urban": "Urban", "ag": "Agriculture_and_Clearing", "seismic": "OGC_Geophysical", "mining": "Mining_and_Extraction"}
+            bcce_qery = "CEF_DISTURB_GROUP IN ({})".format(", ".join("'{}'".format(group) for group in bcce_groups.values()))
+            # The species/severity inclusion rules (PEST_SPECIES, PEST_SEVERITY) go into the query, excluded pest polygons are never fetched
+            pest_qery = pest_query()
+
+            # (source, query, split field, [(layer, split value)]) - the BCCE is read once and split into its four layers
+            sources = {name: (layer, None, None, [(name, None)]) for name, layer in disturbance_dictionary.items()}
+            sources["bcce"] = (bcce, bcce_qery, "CEF_DISTURB_GROUP", list(bcce_groups.items()))
+            sources["pest"] = (pest, pest_qery, None, [("pest", None)])
+
+            # Every source is read with its query and the AOI envelope, the features that intersect the AOI are copied out with
+            # the type/disturbance/year/severity fields filled in (see extraction.py), all sources at once when there is a pool
+            if pool:
+                # The workers can't see the memory workspace, they read the AOI from disk and each write to their own gdb
+                aoi_path = os.path.join(fetch_gdb(fetch_root, "aoi"), "aoi_{}".format(value_update))
+                arcpy.CopyFeatures_management(aoi_fc, aoi_path)
+            outputs = {job: [(name, os.path.join(fetch_gdb(fetch_root, job), '{}_{}'.format(name, value_update)) if pool else '{}_{}'.format(name, value_update), split_value)
+                             for name, split_value in layers] for job, (layer, query, split_field, layers) in sources.items()}
+            jobs = [(job, (layer, query, aoi_path if pool else aoi_fc, outputs[job], split_field)) for job, (layer, query, split_field, layers) in sources.items()]
+            fetched = fetch_all(fetch_source, jobs, pool)
+            if fetch_report:
+                write_fetch_report(values, fetched, fetch_report)
+
+            for name, out_fc, split_value in [output for job in outputs.values() for output in job]:
+                if pool:
+                    arcpy.CopyFeatures_management(out_fc, '{}_{}'.format(name, value_update))
+                    arcpy.Delete_management(out_fc)
+                precision_rows.extend(generalize('{}_{}'.format(name, value_update), values, name, profile))
+            if pool:
+                arcpy.Delete_management(aoi_path)
+
+            print('Done layer collection for {}'.format(values))
+
+            if precision_report:
+                write_precision_report(precision_rows, precision_report)
+
+            # Creates an empty list for the buffer features to be added to 
+            buffer_class = []
+
+            featureclasses = arcpy.ListFeatureClasses()
+
+            # Gathers the linear features that require buffering and applies pre-deteremined buffer
+            for feature in featureclasses:
+                if feature.startswith('rail'):
+                    arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["rail"], "", "", "ALL")
+                    densify_buffer('{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["rail"], profile)
+                    buffer_class.append(feature)
+
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
+
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"rail"''', "PYTHON")
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
+
+                elif feature.startswith('dam'):
+                    arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["dam"], "", "", "ALL")
+                    densify_buffer('{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["dam"], profile)
+
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
+
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"dam"''', "PYTHON")
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
+                    buffer_class.append(feature)
+
+                elif feature.startswith('transmission'):
+                    arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["transmission"], "", "", "ALL")
+                    densify_buffer('{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["transmission"], profile)
+
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
+
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"transmission"''', "PYTHON")
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
+
+                    buffer_class.append(feature)
+
+                elif feature.startswith('road'):
+                    arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["roads"], "", "", "ALL")
+                    densify_buffer('{}_b_{}'.format(feature, value_update), SOURCE_MARGIN["roads"], profile)
+
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
+                    arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
+
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"road"''', "PYTHON")
+                    arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
+
+                    buffer_class.append(feature)
                 else:
-                    arcpy.CalculateField_management('{}_{}'.format(name, value_update), "type", '''"Static"''', "PYTHON")
-                
-                arcpy.CalculateField_management('{}_{}'.format(name, value_update), "disturbance", '''"{}"'''.format(name), "PYTHON")
-                
-        #Setting up queries for BCCE layer selection and the pest query
-        urban_qery = """CEF_DISTURB_GROUP = 'Urban'"""
-        ag_qery = """CEF_DISTURB_GROUP = 'Agriculture_and_Clearing'"""
-        sesimic_qery = """CEF_DISTURB_GROUP = 'OGC_Geophysical'"""
-        mining_qery = """CEF_DISTURB_GROUP = 'Mining_and_Extraction'"""
-        pest_qery = """PEST_SPECIES_CODE = 'IBM' OR PEST_SPECIES_CODE = 'IBS' """
-
-        bcce_dict = {"urban": bcce, "ag": bcce, "seismic": bcce, "mining": bcce, "pest": pest}
-        query_list = [urban_qery, ag_qery, sesimic_qery, mining_qery, pest_qery]
-
-        # Runs through the dictiarony with the queries to run the same process as above for the BCCE layers (and BCGW pest layer) that need to be selected out 
-        for name,layer,query in zip(bcce_dict.keys(), bcce_dict.values(), query_list):
-            arcpy.MakeFeatureLayer_management(layer, '{}_lyr'.format(name), query)
-            arcpy.SelectLayerByLocation_management('{}_lyr'.format(name), "INTERSECT", 'aoi')
-            arcpy.CopyFeatures_management('{}_lyr'.format(name), '{}_{}'.format(name, value_update))
-            print('copied {} {}'.format(name, values))
-
-            #add field of type and disturbance for each disturbance
-            arcpy.AddField_management('{}_{}'.format(name, value_update), "type", "TEXT")
-            arcpy.AddField_management('{}_{}'.format(name, value_update), "disturbance", "TEXT")
-            arcpy.AddField_management('{}_{}'.format(name, value_update), "year", "SHORT")
-            arcpy.AddField_management('{}_{}'.format(name, value_update), "severity", "TEXT")           
-
-            # Inputs the year and severity code into the pest layer 
-            if name == "pest":
-                arcpy.CalculateField_management('{}_{}'.format(name, value_update), "type", '''"Temporal"''', "PYTHON")
-
-                pest_select = "!CAPTURE_YEAR!"
-                arcpy.CalculateField_management('{}_{}'.format(name, value_update), "year", pest_select)
-
-                pest_severity = "!PEST_SEVERITY_CODE!"
-                arcpy.CalculateField_management('{}_{}'.format(name, value_update), "severity", pest_severity)
-                
-# =============================================================================
-#                 # Exclude all pest infestions as disturbance except for the very severe class
-#                 with arcpy.da.UpdateCursor('{}_{}'.format(name, value_update), ['severity']) as cursor:
-#                     for row in cursor:
-#                         if row[0] != "V":
-#                             cursor.deleteRow()
-# =============================================================================
-                print('done pest')
-            else:
-                arcpy.CalculateField_management('{}_{}'.format(name, value_update), "type", '''"Static"''', "PYTHON")
-            
-            arcpy.CalculateField_management('{}_{}'.format(name, value_update), "disturbance", '''"{}"'''.format(name), "PYTHON")
-
-        print('Done layer collection for {}'.format(values))
-
-        # Creates an empty list for the buffer features to be added to 
-        buffer_class = []
-
-        featureclasses = arcpy.ListFeatureClasses()
-
-        # Gathers the linear features that require buffering and applies pre-deteremined buffer
-        for feature in featureclasses:
-            if feature.startswith('rail'):
-                arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), 5, "", "", "ALL")
-                buffer_class.append(feature)
-
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
-
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"rail"''', "PYTHON")
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
-
-            elif feature.startswith('dam'):
-                arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), 7, "", "", "ALL")
-
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
-
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"dam"''', "PYTHON")
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
-                buffer_class.append(feature)
-
-            elif feature.startswith('transmission'):
-                arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), 25, "", "", "ALL")
+                    pass
 
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
+            print(buffer_class)
 
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"transmission"''', "PYTHON")
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
+            for feature in buffer_class:
+                arcpy.Delete_management(feature)
 
-                buffer_class.append(feature)
+            print('Linear buffers complete')
 
-            elif feature.startswith('road'):
-                arcpy.Buffer_analysis(feature, '{}_b_{}'.format(feature, value_update), 25, "", "", "ALL")
+            merge_list = []
+            merge_group = arcpy.ListFeatureClasses()
 
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "type", "TEXT")
-                arcpy.AddField_management('{}_b_{}'.format(feature, value_update), "disturbance", "TEXT")
-
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "disturbance", '''"road"''', "PYTHON")
-                arcpy.CalculateField_management('{}_b_{}'.format(feature, value_update), "type", '''"Static"''', "PYTHON")
-
-                buffer_class.append(feature)
-            else:
-                pass
-
-        print(buffer_class)
-
-        for feature in buffer_class:
-            arcpy.Delete_management(feature)
-
-        print('Linear buffers complete')
-
-        merge_list = []
-        merge_group = arcpy.ListFeatureClasses()
-
-        for merge in merge_group:
-            if merge.endswith(value_update):
-                merge_list.append(merge)
-            if merge.endswith('_b'):
-                merge_list.append(merge)
-            else:
-                pass
+            for merge in merge_group:
+                if merge.endswith(value_update):
+                    merge_list.append(merge)
+                if merge.endswith('_b'):
+                    merge_list.append(merge)
+                else:
+                    pass
         
-        print(merge_list)
-        arcpy.management.Merge(merge_list, '{}_disturbance_merge'.format(value_update))
-
-        print('Disturbances merged')
-
-
-        road_count = arcpy.GetCount_management('roads_{0}_b_{0}'.format(value_update))
-        seismic_count = arcpy.GetCount_management('seismic_{}'.format(value_update))
-
-        print('road count is {0}, seismic count is {1}'.format(road_count, seismic_count))
-
-        #unique_disturbance = arcpy.da.SearchCursor('{}_disturbance_merge'.format(value_update), ['disturbance'])
-        values = [row[0] for row in arcpy.da.SearchCursor('{}_disturbance_merge'.format(value_update), ['disturbance'])]
-        uniqueValues = set(values)
-        print(uniqueValues)
-        if road_count != '0':
-            if 'Road' not in uniqueValues:
-                print('Roads no merged into layer')
-                arcpy.management.Merge(['roads_{0}_b_{0}'.format(value_update), '{}_disturbance_merge'.format(value_update)] , '{}_disturbance_update_merge'.format(value_update))
-                arcpy.Delete_management('{}_disturbance_merge'.format(value_update))
-            else:
-                pass
-        else:
-            pass
-
-        if seismic_count != '0':
-            if 'seismic' not in uniqueValues:
-                print('Seismic no merge into layer')
-                arcpy.management.Merge(['seismic_{}'.format(value_update), '{}_disturbance_update_merge'.format(value_update)], '{}_disturbance_update_2_merge'.format(value_update))
-                arcpy.Delete_management('{}_disturbance_update_merge'.format(value_update))
-        else:
-            pass
-
-
-        for delete in merge_list:
-            arcpy.Delete_management(delete)
-
-        layer_list_2 = arcpy.ListFeatureClasses()
-
-        for layer in layer_list_2:
-            if layer.endswith('_merge'):
-                arcpy.management.Dissolve(layer, '{}_disturbance_d'.format(value_update), ["year", "type", "disturbance", "severity"])
-                print('disturbances dissolved')
-
-        arcpy.analysis.Clip('{}_disturbance_d'.format(value_update), 'aoi', '{}_disturbance'.format(value_update))
-        print('disturbances clipped')
-
-        print('--------------------------------------------------LAYER PROCESS DONE----------------------------------------------')
-# buffers out features by 500m for buffer disturbance class
-def buffer_disturbance():
-    buffer_features = arcpy.ListFeatureClasses()
+            print(merge_list)
+            merge_clip_dissolve(merge_list, value_update, aoi_fc)
+
+            for delete in merge_list:
+                arcpy.Delete_management(delete)
+
+            if journal:
+                journal.complete(layer_name, values, "extract", herd_disturbance)
+
+            print('--------------------------------------------------LAYER PROCESS DONE----------------------------------------------')
+
+    finally:
+        # The workers are shut down when a herd fails too
+        if pool:
+            pool.shutdown()
+# Merges, clips and dissolves the extracted layers for a herd into <herd>_disturbance
+def merge_clip_dissolve(merge_list, value_update, aoi_fc, dissolve_fields=("year", "type", "disturbance", "severity")):
+    # Empty layers are left out instead of being merged and checked for afterwards
+    inputs = [layer for layer in merge_list if int(arcpy.GetCount_management(layer)[0]) > 0]
+    if not inputs:
+        print('No disturbances found for {}'.format(value_update))
+        return
 
-    for buffer_f in buffer_features:
-        if arcpy.Exists(f"{buffer_f}_buffer"):
-            print(f"{buffer_f}_buffer already buffered")
-            return
-        
-        if buffer_f.endswith('_disturbance'):
+    # Only the dissolve fields are carried through the merge so every input maps onto the same schema
+    field_mappings = arcpy.FieldMappings()
+    for field in dissolve_fields:
+        field_map = arcpy.FieldMap()
+        for layer in inputs:
+            if field in [f.name for f in arcpy.ListFields(layer)]:
+                field_map.addInputField(layer, field)
+        if field_map.inputFieldCount:
+            output_field = field_map.outputField
+            output_field.name = field
+            field_map.outputField = output_field
+            field_mappings.addFieldMap(field_map)
+
+    merged = intermediate("{}_disturbance_merge".format(value_update))
+    clipped = intermediate("{}_disturbance_clip".format(value_update))
+    arcpy.management.Merge(inputs, merged, field_mappings)
+    print('Disturbances merged')
+
+    # Clip first so geometry outside of the AOI is never dissolved
+    arcpy.analysis.PairwiseClip(merged, aoi_fc, clipped)
+    print('disturbances clipped')
+
+    arcpy.analysis.PairwiseDissolve(clipped, '{}_disturbance'.format(value_update), list(dissolve_fields))
+    artifacts.record(value_update, "layers", '{}_disturbance'.format(value_update))
+    print('disturbances dissolved')
+
+    for layer in (merged, clipped):
+        arcpy.Delete_management(layer)
+
+# buffers out the disturbance layer of each herd by 500m for buffer disturbance class
+def buffer_disturbance(value_updates):
+    profile = get_profile()
+
+    for value_update in value_updates:
+        buffer_f = '{}_disturbance'.format(value_update)
+        if arcpy.Exists(buffer_f):
             print(buffer_f)
             # Select all disturbance except fire, pest and reservoir - they don't recieve the 500m buffer 
             buffer_query = """disturbance <> 'fire_historical' AND disturbance <> 'fire_current' And disturbance <> 'pest' And disturbance <> 'reservoir'"""
             buffer_select = arcpy.SelectLayerByAttribute_management(buffer_f, "NEW_SELECTION", buffer_query)
 
             #Copy out the selected features
-            arcpy.CopyFeatures_management(buffer_select, "buffer_select")
+            arcpy.CopyFeatures_management(buffer_select, intermediate("buffer_select"))
             
             #Buffer the layer by 500
-            arcpy.Buffer_analysis("buffer_select", "{}_buffer".format(buffer_f), "500 METERS")
+            arcpy.Buffer_analysis(intermediate("buffer_select"), "{}_buffer".format(buffer_f), "500 METERS")
+            arcpy.Delete_management(intermediate("buffer_select"))
+            artifacts.record(value_update, "layers", "{}_buffer".format(buffer_f))
+            densify_buffer("{}_buffer".format(buffer_f), 500, profile)
             print('buffered')
 
             arcpy.CalculateField_management("{}_buffer".format(buffer_f), "disturbance", "!disturbance! + ' buffer'", "PYTHON3")   
 
     print('--------------------------------------------------BUFFER DISTURBANCE DONE----------------------------------------------')       
-#Intersects buffer and disturbance layers with values boundary/habitat
-def intersect(unique_value, aoi_location, layer_name, dissolve_values):
-    intersect_features = arcpy.ListFeatureClasses()
-    intersect_str = ("_buffer", "_disturbance")
-    intersect_layers = []
-    # Picks features that end with _buffer or _disturbance
-    for intersect_f in intersect_features:
-        if arcpy.Exists(f"{intersect_f}_intersect"):
-            print(f"{intersect_f}_intersect already exists")
-            continue
-        
-        if intersect_f.endswith(intersect_str):
-            intersect_layers.append(intersect_f)
-        else:
-            pass
-        # If the features starts with the values name that is currently being used
-    aoi = os.path.join(aoi_location,layer_name)
-
-    search_word = "{}".format(unique_value)
-
-    with arcpy.da.SearchCursor(aoi, [search_word]) as cursor:
-        values_sorted = sorted({row[0] for row in cursor})
-
-    for values in values_sorted:
-
-        if arcpy.Exists("aoi"):
-            arcpy.Delete_management("aoi")
-
-        ###    
-        layer_query = """{0} = '{1}'""".format(unique_value, values)
-        layer_select = arcpy.SelectLayerByAttribute_management(aoi, "NEW_SELECTION", layer_query)
-        arcpy.CopyFeatures_management(layer_select, 'aoi')
-
-        value_update = values.replace(" ", "")
-        value_update = value_update.replace("-", "") 
-        value_update = value_update.replace(":", "") 
-        value_update = value_update.replace("/", "") 
-        for intersect_f in intersect_layers:
-            if intersect_f.startswith(value_update):
-                #Intersect the merged disturbance with the habitat layer
-                arcpy.analysis.Intersect(["aoi", intersect_f], '{}_intersect'.format(intersect_f))
-            else:
-                pass
-# Deletes all interm layers that aren't the final intersected, flat or final layers
-def delete():
-    # Deletes all interm layers that aren't the final intersected, flat or final layers
-    layer_list = arcpy.ListFeatureClasses()
-
-    delete_list = []
-
-    for layer in layer_list:
-        if layer.endswith('_intersect'):
-            pass
-        elif layer.endswith('_final'):
-            pass
-        elif layer.endswith('_flat'):
-            pass
-        else:
-            print('delete {}'.format(layer))
-            delete_list.append(layer)
-
-    print(delete_list)
-
-    for delete in delete_list:
-        arcpy.Delete_management(delete)
-# cleans up fields from layer
-def interim_clean_up(dissolve_values, lyr):
+#Intersects the disturbance and buffer layers of a herd with values boundary/habitat
+def intersect(values, unique_value, aoi_location, layer_name):
+    aoi_fc = get_registry(os.path.join(aoi_location, layer_name), unique_value).handle(values)
+    value_update = normalize_name(values)
+    for intersect_f in ['{}_disturbance'.format(value_update), '{}_disturbance_buffer'.format(value_update)]:
+        if arcpy.Exists(intersect_f):
+            #Intersect the merged disturbance with the habitat layer
+            arcpy.analysis.Intersect([aoi_fc, intersect_f], '{}_intersect'.format(intersect_f))
+            artifacts.record(value_update, "intersect", '{}_intersect'.format(intersect_f))
+# Deletes the interm layers recorded for each herd by the layer stage, the intersected, flat and final layers are kept
+def delete(value_updates):
+    for value_update in value_updates:
+        print('delete interm layers for {}'.format(value_update))
+        artifacts.drop(value_update, "layers")
+# cleans up fields from the intersected layers of a herd
+def interim_clean_up(dissolve_values, value_update):
     print('******************** interim clean up ********************')
-    if arcpy.Exists(f"{lyr}_disturbance_final"):
-        print(f"{lyr}_disturbance_final already exists")
-        return
-    intersect_features = arcpy.ListFeatureClasses()
-    intersect_str = ("_intersect")
-    print("working??")
     print(dissolve_values)
-    ##
-    #if feature ends with _intersect it 
-    for intersect_f in intersect_features:
-        if intersect_f.endswith(intersect_str):
+    for intersect_f in ['{}_disturbance_intersect'.format(value_update), '{}_disturbance_buffer_intersect'.format(value_update)]:
+        if arcpy.Exists(intersect_f):
             print(intersect_f)
-            layer_output = intersect_f.replace("intersect", "final")
+            layer_output = intersect_f[:-len("intersect")] + "final"
             print(layer_output)
             arcpy.management.Dissolve(intersect_f, layer_output, dissolve_values)
     print('--------------------------------------------------CLEAN UP DONE----------------------------------------------')
@@ -1024,30 +956,3 @@ def disturbance_buffer_cleanup(values, value_update, keep_list):
     
     arcpy.AddField_management("{}_disturb_buffer_flat".format(value_update), "area_ha", "DOUBLE", "", "", "", "Area Ha")
     arcpy.CalculateField_management("{}_disturb_buffer_flat".format(value_update), "area_ha", '!shape.area@HECTARES!', "PYTHON3")
-################################################################################
-def delete_layers():
-    cleanupfeatures = arcpy.ListFeatureClasses()
-
-    final_str = ("_final", "_flat")
-    for intersect_f in cleanupfeatures:
-        if intersect_f.endswith(final_str):
-            pass
-        else:
-            arcpy.Delete_management(intersect_f)
-def identity(csv_dir, values, value_update, unique_value, intersect_layer, aoi_location):
-    # get all that start with values name and end with flat
-    print(values)
-    print(value_update)
-
-    layer_location = os.path.join(aoi_location,intersect_layer)
-    values_query = """{} = '{}'""".format(unique_value, values)
-
-    values_select = arcpy.SelectLayerByAttribute_management(layer_location, "NEW_SELECTION", values_query)
-    arcpy.CopyFeatures_management(values_select, 'aoi')
-    
-    arcpy.analysis.Identity('aoi', value_update + "_disturb_flat", value_update + '_disturb_identity_1')
-    arcpy.analysis.Identity(value_update + '_disturb_identity_1', value_update + "_disturb_buffer_flat", 
-                            value_update + '_flat')
-
-
-    arcpy.TableToTable_conversion("{}_flat".format(value_update), csv_dir, "{}_flat.csv".format(value_update))
@@ -27,6 +27,9 @@ import logging
 import smtplib
 import socket
 import pandas as pd
+from aoi_registry import get_registry
+from scratch import intermediate
+from artifacts import get_artifacts
 def combine_disturbance_and_protection(value_update):
     
     protection_layers = arcpy.ListFeatureClasses()
@@ -46,13 +49,34 @@ def combine_disturbance_and_protection(value_update):
         else:
             pass
 
-def clean_up():
-    cleanupfeatures = arcpy.ListFeatureClasses()
+# Drops every interm layer recorded for the herd, the final and flat layers are never recorded
+def clean_up(value_update):
+    get_artifacts(arcpy.env.workspace).drop(value_update)
 
-    final_str = ("_final", "_flat")
-    for intersect_f in cleanupfeatures:
-        if intersect_f.endswith(final_str):
-            pass
-        else:
-            arcpy.Delete_management(intersect_f)
+# Single overlay of the AOI with the disturbance, disturbance buffer and protection flats. Replaces identity() in
+# disturbance_layer and combine() in protection_layer, which together ran four Identity overlays of the same AOI
+# flat_layers: paths of the disturbance, disturbance buffer and protection flats, the results go to the workspace
+def final_identity(csv_dir, values, value_update, unique_value, intersect_layer, aoi_location, flat_layers):
+    print(values)
+    print(value_update)
+
+    layer_location = os.path.join(aoi_location, intersect_layer)
+    aoi_fc = get_registry(layer_location, unique_value).handle(values)
+
+    overlay = [aoi_fc] + [flat for flat in flat_layers if arcpy.Exists(flat)]
+    print(overlay)
+
+    # Union nodes all the layers in one pass, keeping the aoi first gives the same field names (area_ha_1, area_ha_12)
+    # as the chained Identity calls
+    final_union = intermediate("{}_final_union".format(value_update))
+    arcpy.analysis.Union(overlay, final_union, "ALL")
+
+    # Faces outside the AOI are the only difference between a Union and an Identity on the AOI
+    arcpy.Select_analysis(final_union, "{}_final_flat".format(value_update),
+                          "FID_{} <> -1".format(os.path.basename(aoi_fc)))
+    arcpy.Delete_management(final_union)
+
+    print("Done identity for {}".format(value_update))
 
+    # The disturbance and protection tables are both read from the one _flat.csv
+    arcpy.TableToTable_conversion("{}_final_flat".format(value_update), csv_dir, "{}_flat.csv".format(value_update))
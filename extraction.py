@@ -0,0 +1,212 @@
+'''
+    Extraction writer for the disturbance source layers
+
+    Purpose:   Copy the features of a BCGW/BCCE source that intersect a herd AOI into the output gdb with the standard
+               disturbance schema (type, disturbance, year, severity) filled in while copying. Replaces a CopyFeatures
+               followed by four AddFields and two to four CalculateFields, each of which rewrote the whole table.
+
+               The source is read with the attribute query and the AOI envelope pushed into the cursor, so only
+               candidates come back from the database, and the exact intersect test runs locally on the candidates.
+               One read can feed several layers split on a field (the four CEF_DISTURB_GROUP layers of the BCCE)
+               instead of a full scan per layer.
+
+               Only the columns in the source's manifest (SOURCE_COLUMNS) are read and written, the dozens of other
+               cutblock/fire/pest attributes stay in the database and aren't dragged through the later merges and
+               dissolves.
+
+    Dependencies:  ArcGIS Pro 3.2 or later for the cursor spatial filter
+'''
+import os
+import re
+from contextlib import ExitStack
+
+# Standard schema every extracted disturbance layer gets
+STANDARD_FIELDS = [("type", "TEXT"), ("disturbance", "TEXT"), ("year", "SHORT"), ("severity", "TEXT")]
+
+# disturbance name: (type, source field for year, source field for severity)
+DISTURBANCE_SCHEMA = {
+    "rail": ("Static", None, None),
+    "transmission": ("Static", None, None),
+    "pipe": ("Static", None, None),
+    "well": ("Static", None, None),
+    "air": ("Static", None, None),
+    "dam": ("Static", None, None),
+    "reservoir": ("Static", None, None),
+    "fire_historical": ("Temporal", "FIRE_YEAR", None),
+    "fire_current": ("Temporal", "FIRE_YEAR", None),
+    "cutblock": ("Temporal", "HARVEST_START_YEAR_CALENDAR", None),
+    "roads": ("Static", None, None),
+    "urban": ("Static", None, None),
+    "ag": ("Static", None, None),
+    "seismic": ("Static", None, None),
+    "mining": ("Static", None, None),
+    "pest": ("Temporal", "CAPTURE_YEAR", "PEST_SEVERITY_CODE"),
+}
+
+
+# disturbance name: source columns carried to the extracted layer, the only attributes the pipeline reads
+# (year/severity/species/group), every other source column is left in the database
+SOURCE_COLUMNS = {
+    "fire_historical": ["FIRE_YEAR"],
+    "fire_current": ["FIRE_YEAR"],
+    "cutblock": ["HARVEST_START_YEAR_CALENDAR"],
+    "urban": ["CEF_DISTURB_GROUP"],
+    "ag": ["CEF_DISTURB_GROUP"],
+    "seismic": ["CEF_DISTURB_GROUP"],
+    "mining": ["CEF_DISTURB_GROUP"],
+    "pest": ["CAPTURE_YEAR", "PEST_SEVERITY_CODE", "PEST_SPECIES_CODE"],
+}
+
+# arcpy.ListFields type: AddField type
+FIELD_TYPES = {"String": "TEXT", "SmallInteger": "SHORT", "Integer": "LONG", "BigInteger": "BIGINTEGER",
+               "Single": "FLOAT", "Double": "DOUBLE", "Date": "DATE", "DateOnly": "DATEONLY", "TimeOnly": "TIMEONLY",
+               "TimestampOffset": "TIMESTAMPOFFSET"}
+
+# Pest species included as disturbance when PEST_SPECIES isn't set, every severity is included when PEST_SEVERITY isn't
+DEFAULT_PEST_SPECIES = ["IBM", "IBS"]
+
+# Linear buffer distance (m) applied to a source after extraction (see disturbance_aoi). Features are selected on the
+# AOI itself, as SelectLayerByLocation did, the buffers are clipped to the AOI afterwards
+SOURCE_MARGIN = {"rail": 5, "dam": 7, "transmission": 25, "roads": 25}
+
+
+def _codes(value, env_key):
+    codes = [code.strip().upper() for code in value.split(",") if code.strip()]
+    invalid = [code for code in codes if not re.fullmatch(r"\w+", code)]
+    if invalid:
+        raise ValueError(f"Invalid code(s) {invalid} in {env_key}, expected a comma separated list of codes")
+    return codes
+
+
+def pest_rules():
+    """
+    (species codes, severity codes) of the pest features included as disturbance, from PEST_SPECIES and
+    PEST_SEVERITY in the .env, severity codes are None when every severity is included
+    """
+    species = _codes(os.getenv("PEST_SPECIES") or ",".join(DEFAULT_PEST_SPECIES), "PEST_SPECIES")
+    severity = _codes(os.getenv("PEST_SEVERITY") or "", "PEST_SEVERITY")
+    return species, severity or None
+
+
+def pest_query(species=None, severity=None):
+    """
+    Source query of the pest layer, excluded species/severities are never read from the BCGW
+
+    species/severity: codes to include, taken from pest_rules when not given; an empty severity list includes every
+                      severity
+    """
+    if species is None or severity is None:
+        rule_species, rule_severity = pest_rules()
+        species = rule_species if species is None else species
+        severity = rule_severity if severity is None else severity
+    if not species:
+        raise ValueError("No pest species to include, expected at least one species code")
+    clauses = ["PEST_SPECIES_CODE IN ({})".format(", ".join(f"'{code}'" for code in species))]
+    if severity:
+        clauses.append("PEST_SEVERITY_CODE IN ({})".format(", ".join(f"'{code}'" for code in severity)))
+    return " AND ".join(clauses)
+
+
+def aoi_geometry(aoi_fc):
+    """Union of the AOI features"""
+    import arcpy
+
+    geometry = None
+    with arcpy.da.SearchCursor(aoi_fc, ["SHAPE@"]) as cursor:
+        for row in cursor:
+            if row[0] is not None:
+                geometry = row[0] if geometry is None else geometry.union(row[0])
+    return geometry
+
+
+def read_envelope(geometry):
+    """Envelope polygon of the geometry, used as the cursor's spatial filter"""
+    import arcpy
+
+    extent = geometry.extent
+    corners = [(extent.XMin, extent.YMin), (extent.XMin, extent.YMax), (extent.XMax, extent.YMax), (extent.XMax, extent.YMin)]
+    return arcpy.Polygon(arcpy.Array([arcpy.Point(x, y) for x, y in corners]), geometry.spatialReference)
+
+
+def create_output(source, out_fc, copy_fields):
+    """
+    Empty feature class with the copy_fields of the source and the standard fields, adding fields to it rewrites no
+    rows
+    """
+    import arcpy
+
+    desc = arcpy.Describe(source)
+    workspace = os.path.dirname(out_fc) or arcpy.env.workspace
+    arcpy.management.CreateFeatureclass(workspace, os.path.basename(out_fc), desc.shapeType,
+                                        has_m="ENABLED" if desc.hasM else "DISABLED",
+                                        has_z="ENABLED" if desc.hasZ else "DISABLED",
+                                        spatial_reference=desc.spatialReference)
+    source_fields = {field.name: field for field in arcpy.ListFields(source)}
+    fields = [[name, FIELD_TYPES[source_fields[name].type], source_fields[name].aliasName,
+               source_fields[name].length if source_fields[name].type == "String" else None] for name in copy_fields]
+    fields += [[field_name, field_type] for field_name, field_type in STANDARD_FIELDS]
+    # One schema change for all the fields instead of one AddField per field
+    arcpy.management.AddFields(out_fc, fields)
+
+
+def extract_source(source, aoi_fc, outputs, where=None, split_field=None):
+    """
+    Read source once and write the features that intersect the AOI to every output, mapping the source fields to the
+    standard schema
+
+    outputs: list of (disturbance name, output feature class, split value); with a split_field each feature goes to the
+             output whose split value matches its split_field value, without one every feature goes to the output
+    Returns disturbance name -> features written
+    """
+    import arcpy
+    from aoi_registry import envelopes_overlap
+
+    aoi = aoi_geometry(aoi_fc)
+    standard_names = [field_name for field_name, field_type in STANDARD_FIELDS]
+    # Only the manifest columns of the outputs are read and written (see SOURCE_COLUMNS), matched case insensitively
+    # as the source spells them
+    source_fields = {field.name.upper(): field.name for field in arcpy.ListFields(source)
+                     if field.type in FIELD_TYPES and field.name.lower() not in standard_names}
+    wanted = dict.fromkeys(column.upper() for name, out_fc, split_value in outputs
+                           for column in SOURCE_COLUMNS.get(name, []))
+    copy_fields = [source_fields[column] for column in wanted if column in source_fields]
+    mapped_fields = list(dict.fromkeys(field for name, out_fc, split_value in outputs
+                                       for field in DISTURBANCE_SCHEMA[name][1:] if field and field not in copy_fields))
+    if split_field and split_field not in copy_fields + mapped_fields:
+        mapped_fields.append(split_field)
+
+    for name, out_fc, split_value in outputs:
+        create_output(source, out_fc, copy_fields)
+    counts = {name: 0 for name, out_fc, split_value in outputs}
+    if aoi is None:
+        return counts
+
+    with ExitStack() as cursors:
+        inserts = {split_value if split_field else None:
+                   (name, cursors.enter_context(arcpy.da.InsertCursor(out_fc, ["SHAPE@"] + copy_fields + standard_names)))
+                   for name, out_fc, split_value in outputs}
+
+        # The where clause and the envelope go to the database, only candidates are returned
+        with arcpy.da.SearchCursor(source, ["SHAPE@"] + copy_fields + mapped_fields, where_clause=where,
+                                   spatial_filter=read_envelope(aoi), spatial_relationship="INTERSECTS") as search:
+            for row in search:
+                values = dict(zip(copy_fields + mapped_fields, row[1:]))
+                target = inserts.get(values.get(split_field) if split_field else None)
+                shape = row[0]
+                if target is None or shape is None:
+                    continue
+                # Exact test, the same features SelectLayerByLocation INTERSECT with the AOI selects
+                if not envelopes_overlap(aoi.extent, shape.extent) or aoi.disjoint(shape):
+                    continue
+
+                name, insert = target
+                type_value, year_field, severity_field = DISTURBANCE_SCHEMA[name]
+                year = values.get(year_field) if year_field else None
+                insert.insertRow(list(row[:1 + len(copy_fields)]) +
+                                 [type_value, name, int(year) if year not in (None, "") else None,
+                                  values.get(severity_field) if severity_field else None])
+                counts[name] += 1
+
+    for name, count in counts.items():
+        print('copied {} {} features'.format(count, name))
+    return counts
@@ -0,0 +1,137 @@
+'''
+    Concurrent source fetching
+
+    Purpose:   Pull the disturbance source layers of a herd side by side instead of one after another. The pulls from
+               the BCGW and the BCCE are almost all Oracle/network latency, so with a bounded pool the fetch of a herd
+               takes about as long as its slowest source instead of the sum of all of them. Every source is timed and
+               retried with a growing wait when it fails (SDE timeouts, dropped connections).
+
+               arcpy isn't safe to use from several threads, the arcpy fetch runs in worker processes that each write
+               to their own fetch gdb in the scratch folder. Readers that are thread safe (the open backend) can use a
+               thread pool.
+
+    Settings:  FETCH_WORKERS=4 (1 fetches the sources one after another in this process)
+               FETCH_RETRIES=3
+'''
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import pandas as pd
+
+FetchResult = namedtuple("FetchResult", ["name", "result", "seconds", "attempts"])
+
+REPORT_COLUMNS = ["herd", "source", "seconds", "attempts", "features"]
+
+# Seconds to wait before the first retry, doubled for every retry after it
+BACKOFF_SECONDS = 5
+
+# (connection file of the main process, connection file of this worker), see connect_worker
+_worker_connection = None
+
+
+def fetch_workers():
+    return max(1, int(os.getenv("FETCH_WORKERS") or 4))
+
+
+def fetch_retries():
+    return max(1, int(os.getenv("FETCH_RETRIES") or 3))
+
+
+def fetch_pool(workers=None, processes=True, initializer=None, initargs=()):
+    """Pool to share between fetch_all calls (starting arcpy in a process is slow), None for a single worker"""
+    workers = fetch_workers() if workers is None else workers
+    if workers <= 1:
+        return None
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    return executor(max_workers=workers, initializer=initializer, initargs=initargs)
+
+
+def connect_worker(connection, inst, username, password):
+    """
+    Pool initializer giving a worker process its own BCGW connection
+
+    The connection file of the main process doesn't save the login, so a worker makes its own in a temp folder (the
+    login only lives in the worker's session) and reads the BCGW sources through it.
+    """
+    global _worker_connection
+    import arcpy
+
+    arcpy.env.overwriteOutput = True
+    folder = tempfile.mkdtemp(prefix="fetch_")
+    arcpy.CreateDatabaseConnection_management(out_folder_path=folder, out_name="BCGW.sde", database_platform='ORACLE',
+                                              instance=inst, account_authentication='DATABASE_AUTH',
+                                              username=username, password=password,
+                                              save_user_pass='DO_NOT_SAVE_USERNAME')
+    _worker_connection = (connection, os.path.join(folder, "BCGW.sde"))
+
+
+def fetch_with_retry(fetch, name, args, retries, backoff=BACKOFF_SECONDS):
+    """fetch(name, *args) timed over all its attempts, the last error is raised once the retries are used up"""
+    start = time.perf_counter()
+    for attempt in range(1, retries + 1):
+        try:
+            result = fetch(name, *args)
+            return FetchResult(name, result, time.perf_counter() - start, attempt)
+        except Exception as error:
+            if attempt == retries:
+                raise RuntimeError(f"Fetching {name} failed after {retries} attempts: {error}") from error
+            print(f"Fetching {name} failed ({error}), attempt {attempt + 1} of {retries} in {backoff * 2 ** (attempt - 1)}s")
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+
+def fetch_all(fetch, jobs, pool=None, retries=None, backoff=BACKOFF_SECONDS):
+    """
+    Run fetch(name, *args) for every (name, args) job, on the pool when there is one
+
+    fetch has to be a module level function when the pool is a process pool
+    Returns name -> FetchResult in the order of the jobs
+    """
+    retries = fetch_retries() if retries is None else retries
+    start = time.perf_counter()
+
+    if pool is None:
+        results = {name: fetch_with_retry(fetch, name, args, retries, backoff) for name, args in jobs}
+    else:
+        futures = {pool.submit(fetch_with_retry, fetch, name, args, retries, backoff): name for name, args in jobs}
+        done = {futures[future]: future.result() for future in as_completed(futures)}
+        results = {name: done[name] for name, _ in jobs}
+
+    wall = time.perf_counter() - start
+    for result in results.values():
+        print('    {:<16}{:>8.1f}s{}'.format(result.name, result.seconds,
+                                              f" ({result.attempts} attempts)" if result.attempts > 1 else ""))
+    if results:
+        print('Fetched {} sources in {:.1f}s (slowest source {:.1f}s, all sources {:.1f}s)'.format(
+            len(results), wall, max(r.seconds for r in results.values()), sum(r.seconds for r in results.values())))
+    return results
+
+
+def write_fetch_report(herd, results, report_path):
+    """Append the per source timings of a herd to the fetch report csv"""
+    if not results:
+        return
+    report = pd.DataFrame([[herd, r.name, round(r.seconds, 2), r.attempts,
+                            sum(r.result.values()) if isinstance(r.result, dict) else None]
+                           for r in results.values()], columns=REPORT_COLUMNS)
+    report.to_csv(report_path, mode="a", index=False, header=not os.path.exists(report_path))
+
+
+def fetch_gdb(root, name):
+    """File gdb in root a worker writes one source to, created on first use"""
+    import arcpy
+
+    path = os.path.join(root, f"fetch_{name}.gdb")
+    if not arcpy.Exists(path):
+        arcpy.management.CreateFileGDB(root, os.path.basename(path))
+    return path
+
+
+def fetch_source(name, source, query, aoi_fc, outputs, split_field=None):
+    """Extract the source features that match the query and intersect the AOI to the outputs, see extract_source"""
+    from extraction import extract_source
+
+    if _worker_connection and source.startswith(_worker_connection[0]):
+        source = _worker_connection[1] + source[len(_worker_connection[0]):]
+    return extract_source(source, aoi_fc, outputs, query, split_field)
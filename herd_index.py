@@ -0,0 +1,94 @@
+'''
+    Herd metadata index
+
+    Purpose:   Read the herd AOI layers and keep one record per herd/habitat polygon with the herd name, the
+               feature class friendly name, habitat code, ecotype, area and envelope. The stages and the report
+               builder look herds, areas and ecotypes up here instead of re-scanning the AOI layers. The index is
+               only rebuilt when the AOI gdb has changed since it was written or the herds are named by a different
+               field (unique_value) than the one it was built on.
+
+    Outputs:   herd_index.csv in the root directory
+'''
+import os
+import pandas as pd
+
+# Herd_Name holds the values of the unique_value field, which is kept in the unique_value column
+INDEX_COLUMNS = ["layer", "Herd_Name", "herd", "BCHab_code", "ecotype", "hectares", "xmin", "ymin", "xmax", "ymax",
+                 "unique_value"]
+
+# Ecotype fields in the habitat linework and herd boundaries, the first one filled in is used
+ECOTYPE_FIELDS = ["BC_Ecotype_Grouping", "ECO_GROUP"]
+
+
+def normalize_name(name):
+    """Herd name as used for feature class and file names"""
+    return name.replace(" ", "").replace("-", "").replace(":", "").replace("/", "")
+
+
+def aoi_modified(aoi_location):
+    """Latest modification time of the files of the AOI gdb"""
+    times = [entry.stat().st_mtime for entry in os.scandir(aoi_location) if entry.is_file()]
+    return max(times, default=os.path.getmtime(aoi_location))
+
+
+def build_herd_index(aoi_location, index_path, unique_value="Herd_Name"):
+    """
+    One cursor pass over every AOI feature class, persisted to index_path and reused until the AOI gdb changes or
+    unique_value differs from the field the index was built on
+    """
+    if os.path.exists(index_path) and os.path.getmtime(index_path) > aoi_modified(aoi_location):
+        index = load_herd_index(index_path)
+        built_on = set(index["unique_value"].dropna()) if "unique_value" in index else set()
+        if built_on == {unique_value}:
+            print(f"Herd index read from {index_path} ({len(index)} records)")
+            return index
+        print(f"Herd index in {index_path} wasn't built on {unique_value}, rebuilding it")
+
+    import arcpy
+
+    with arcpy.EnvManager(workspace=aoi_location):
+        layers = arcpy.ListFeatureClasses()
+
+    records = []
+    for layer in layers:
+        layer_path = os.path.join(aoi_location, layer)
+        field_names = [field.name for field in arcpy.ListFields(layer_path)]
+        if unique_value not in field_names:
+            print(f"{layer} has no {unique_value} field, not indexed")
+            continue
+
+        habitat = "BCHab_code" if "BCHab_code" in field_names else None
+        ecotype_fields = [field for field in ECOTYPE_FIELDS if field in field_names]
+        fields = [unique_value] + ([habitat] if habitat else []) + ecotype_fields + ["SHAPE@AREA", "SHAPE@"]
+
+        with arcpy.da.SearchCursor(layer_path, fields) as cursor:
+            for row in cursor:
+                values = dict(zip(fields, row))
+                ecotype = next((str(values[field]).strip() for field in ecotype_fields
+                                if values[field] and str(values[field]).strip()), None)
+                extent = values["SHAPE@"].extent if values["SHAPE@"] else None
+                records.append([layer, values[unique_value], normalize_name(values[unique_value]),
+                                values[habitat] if habitat else None, ecotype, values["SHAPE@AREA"] * 0.0001,
+                                extent.XMin if extent else None, extent.YMin if extent else None,
+                                extent.XMax if extent else None, extent.YMax if extent else None, unique_value])
+
+    index = pd.DataFrame(records, columns=INDEX_COLUMNS)
+    index.to_csv(index_path, index=False)
+    print(f"Herd index written to {index_path} ({len(index)} records)")
+    return index
+
+
+def load_herd_index(index_path):
+    return pd.read_csv(index_path, dtype={"Herd_Name": str, "herd": str, "BCHab_code": str, "ecotype": str,
+                                          "unique_value": str})
+
+
+def herd_values(index, layer_name):
+    """Sorted herd names in an AOI layer, replaces the SearchCursor over the layer in each stage"""
+    return sorted(index.loc[index["layer"] == layer_name, "Herd_Name"].dropna().unique())
+
+
+def herd_area(index):
+    """Herd/habitat areas in hectares and the herd ecotype in the layout used by the report builder"""
+    return pd.DataFrame({"Herd": index["herd"], "Habitat": index["BCHab_code"], "Hectare": index["hectares"],
+                         "Ecotype": index["ecotype"]})
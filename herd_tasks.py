@@ -0,0 +1,128 @@
+'''
+    Per herd stages
+
+    Purpose:   The disturbance and protection work for a single herd, run by Run_Disturbance through the scheduler
+               (see scheduler.py). They are module level functions in their own module so a worker process can import
+               them without running Run_Disturbance.
+
+               A file gdb can't take new datasets from several processes at once, so in a worker process a task
+               writes its finals to a handoff gdb of its own in the scratch folder and the main process copies them
+               into the output gdb as each herd finishes (collect_finals).
+'''
+import arcpy
+import os
+from herd_index import normalize_name
+from aoi_registry import get_registry
+from artifacts import get_artifacts
+from disturbance_layer import disturbance_flatten, disturbance_field_mapping, disturbance_cleanup, disturbance_buffer_flatten, disturbance_buffer_field_mapping, disturbance_buffer_cleanup
+from protection_layer import gather_protection, flatten_protection, field_mapping, clean_and_join, clip_protection_flat
+from disturbance_protection_combine import final_identity
+from tile_index import get_tile_index
+from scheduler import in_worker
+from scratch import scratch_folder, list_datasets
+
+workspace = os.path.join(os.getenv("ROOT_DIR"), os.getenv("OUTPUT_GDB"))
+arcpy.env.overwriteOutput = True
+arcpy.env.workspace = workspace
+artifacts = get_artifacts(workspace)
+
+
+def disturbance_artifacts(values):
+    """Layers disturbance_herd writes to the output gdb, recorded in the run journal (see journal.py)"""
+    value_update = normalize_name(values)
+    return [os.path.join(workspace, f"{value_update}_disturb_flat"), os.path.join(workspace, f"{value_update}_disturb_buffer_flat")]
+
+
+def protection_artifacts(values, csv_dir):
+    """Layers and csv files protection_herd writes"""
+    value_update = normalize_name(values)
+    return [os.path.join(workspace, f"{value_update}_protect_flat"), os.path.join(workspace, f"{value_update}_final_flat"),
+            os.path.join(csv_dir, f"{value_update}_flat.csv")]
+
+
+def handoff_gdb(stage, name):
+    return os.path.join(scratch_folder(), f"finals_{stage}_{name}.gdb")
+
+
+def finals_gdb(stage, name):
+    """gdb a task writes its finals to, the output gdb in the main process and its own handoff gdb in a worker"""
+    if not in_worker():
+        return workspace
+    path = handoff_gdb(stage, name)
+    if not arcpy.Exists(path):
+        arcpy.management.CreateFileGDB(os.path.dirname(path), os.path.basename(path))
+    return path
+
+
+def collect_finals(stage, name):
+    """Copy what a worker wrote to its handoff gdb into the output gdb and delete the handoff gdb, main process only"""
+    path = handoff_gdb(stage, name)
+    if not arcpy.Exists(path):
+        return
+    for dataset in list_datasets(path):
+        arcpy.management.Copy(os.path.join(path, dataset), os.path.join(workspace, dataset))
+        print(f"{dataset} written to {workspace}")
+    arcpy.Delete_management(path)
+
+
+def disturbance_herd(values, keep_list):
+    """Flatten, field map and clean the disturbance and disturbance buffer layers of one herd"""
+    print('Selected {}'.format(values))
+    value_update = normalize_name(values)
+
+    # Each stage runs in its own namespace, only the _disturb_flat/_disturb_buffer_flat layers reach the output gdb
+    output_gdb = finals_gdb("disturbance", value_update)
+    with artifacts.namespace(value_update, "disturb", [f"{value_update}_disturbance_final"], [f"{value_update}_disturb_flat"], output_gdb):
+        disturbance_flatten(values, value_update)
+        disturbance_field_mapping(values, value_update)
+        disturbance_cleanup(values, value_update, keep_list)
+
+    with artifacts.namespace(value_update, "disturb_buffer", [f"{value_update}_disturbance_buffer_final"], [f"{value_update}_disturb_buffer_flat"], output_gdb):
+        disturbance_buffer_flatten(values, value_update)
+        disturbance_buffer_field_mapping(values, value_update)
+        disturbance_buffer_cleanup(values, value_update, keep_list)
+
+
+def protection_cell(cell, designated_lands, keep_list, tile_gdb):
+    """Protection flat of one grid cell of the designated lands, merged into the provincial flat (PROTECTION_FLATTEN=province)"""
+    tiles = get_tile_index(tile_gdb)
+    with artifacts.namespace(cell, "protect", finals=[f"{cell}_protect_flat"], output_gdb=finals_gdb("flatten", cell)):
+        arcpy.CopyFeatures_management([tiles.cell_polygon(cell)], f"{cell}_cell")
+        gather_protection(designated_lands, cell, f"{cell}_cell", tiles)
+        # Cells a tile envelope reaches into without any designated lands in them have nothing to flatten
+        if int(arcpy.management.GetCount(f"{cell}_designated_lands")[0]) == 0:
+            return
+        flatten_protection(cell)
+        field_mapping(cell)
+        clean_and_join(cell, keep_list)
+
+
+def protection_herd(values, designated_lands, aoi, unique_value, keep_list, csv_dir, intersect_layer, aoi_location, tile_gdb=None, province_flat=None):
+    """
+    Protection flat of one herd and the final identity with its disturbance flats
+
+    province_flat: the provincial protection flat, when given the herd's flat is clipped from it instead of flattened
+    """
+    print('Selected {}'.format(values))
+    value_update = normalize_name(values)
+    aoi_fc = get_registry(aoi, unique_value).handle(values)
+    output_gdb = finals_gdb("protection", value_update)
+
+    if province_flat:
+        # Without any designated lands there is no provincial flat and the herd has no protection flat
+        if arcpy.Exists(province_flat):
+            with arcpy.EnvManager(workspace=output_gdb):
+                clip_protection_flat(province_flat, value_update, aoi_fc)
+    else:
+        # The designated lands tiles that overlap the herd are read instead of the provincial layer (see tile_index.py)
+        tiles = get_tile_index(tile_gdb) if tile_gdb else None
+        with artifacts.namespace(value_update, "protect", finals=[f"{value_update}_protect_flat"], output_gdb=output_gdb):
+            gather_protection(designated_lands, value_update, aoi_fc, tiles)
+            flatten_protection(value_update)
+            field_mapping(value_update)
+            clean_and_join(value_update, keep_list)
+    # One overlay of the AOI with the disturbance, buffer and protection flats (_final_flat, _flat.csv)
+    flat_layers = [os.path.join(workspace, f"{value_update}_disturb_flat"), os.path.join(workspace, f"{value_update}_disturb_buffer_flat"),
+                   os.path.join(output_gdb, f"{value_update}_protect_flat")]
+    with arcpy.EnvManager(workspace=output_gdb):
+        final_identity(csv_dir, values, value_update, unique_value, intersect_layer, aoi_location, flat_layers)
@@ -0,0 +1,210 @@
+'''
+    Run journal
+
+    Purpose:   Record every completed step of a run (layer, herd, stage) with a fingerprint of each artifact it wrote in
+               a SQLite database in the root directory, so a run that stopped part way (an SDE timeout, a failed tool,
+               a locked gdb) resumes at the first incomplete step when Run_Disturbance is started again.
+
+               A step counts as done only while every artifact it recorded still exists with the same fingerprint, so
+               an artifact that was deleted or rewritten since makes the step run again. A step that was started and
+               never completed left partial artifacts, they are deleted before the step runs again.
+
+               A run stays open until finish() is called after the reports are written, the next start of
+               Run_Disturbance resumes an open run and starts a new run otherwise.
+
+               The interim layers the stages record for a herd (see artifacts.py) are kept here too, so a resumed
+               run still drops the layers an earlier attempt left in the output gdb.
+
+               Products derived once from a source for every run (the designated lands tiles) are recorded against a
+               key of their source, not a run, and are reused by later runs while the key and the products are
+               unchanged. The key hashes the rows of the source (content_fingerprint), an edit that keeps the count
+               and extent still makes them build again.
+
+    Outputs:   run_journal.sqlite in the root directory
+'''
+import arcpy
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (run INTEGER PRIMARY KEY AUTOINCREMENT, started TEXT, finished TEXT);
+CREATE TABLE IF NOT EXISTS steps (run INTEGER, layer TEXT, herd TEXT, stage TEXT, status TEXT, started TEXT,
+                                  completed TEXT, PRIMARY KEY (run, layer, herd, stage));
+CREATE TABLE IF NOT EXISTS artifacts (run INTEGER, layer TEXT, herd TEXT, stage TEXT, artifact TEXT, fingerprint TEXT,
+                                      PRIMARY KEY (run, layer, herd, stage, artifact));
+CREATE TABLE IF NOT EXISTS produced (gdb TEXT, herd TEXT, stage TEXT, name TEXT, PRIMARY KEY (gdb, herd, stage, name));
+CREATE TABLE IF NOT EXISTS derived (artifact TEXT PRIMARY KEY, source TEXT, fingerprint TEXT);
+"""
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def exists(artifact):
+    return os.path.isfile(artifact) or arcpy.Exists(artifact)
+
+
+def fingerprint(artifact):
+    """sha1 of a file's contents, or of a dataset's row count, fields and extent, None when it doesn't exist"""
+    if os.path.isfile(artifact):
+        digest = hashlib.sha1()
+        with open(artifact, "rb") as artifact_file:
+            for block in iter(lambda: artifact_file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    if not arcpy.Exists(artifact):
+        return None
+
+    desc = arcpy.Describe(artifact)
+    parts = [arcpy.management.GetCount(artifact)[0]] + [field.name for field in arcpy.ListFields(artifact)]
+    extent = getattr(desc, "extent", None)
+    if extent:
+        parts += [f"{value:.3f}" for value in (extent.XMin, extent.YMin, extent.XMax, extent.YMax)]
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def content_fingerprint(dataset):
+    """sha1 of every row of a dataset, its attributes and SHAPE@WKB in ObjectID order"""
+    desc = arcpy.Describe(dataset)
+    fields = [field.name for field in arcpy.ListFields(dataset) if field.type not in ("OID", "Geometry", "Blob", "Raster")]
+    if getattr(desc, "shapeFieldName", None):
+        fields.append("SHAPE@WKB")
+    digest = hashlib.sha1("|".join(fields).encode())
+    with arcpy.da.SearchCursor(dataset, fields, sql_clause=(None, f"ORDER BY {desc.OIDFieldName}")) as cursor:
+        for row in cursor:
+            for value in row:
+                digest.update(bytes(value) if isinstance(value, (bytes, bytearray)) else repr(value).encode())
+                digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def delete(artifact):
+    if os.path.isfile(artifact):
+        os.remove(artifact)
+    elif arcpy.Exists(artifact):
+        arcpy.Delete_management(artifact)
+
+
+class RunJournal:
+    """Completed steps of the open run, only used from the process that runs Run_Disturbance"""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # WAL with full sync, a step committed as complete survives the process or machine going down
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript(SCHEMA)
+
+        last = self.connection.execute("SELECT run, started, finished FROM runs ORDER BY run DESC LIMIT 1").fetchone()
+        if last and last[2] is None:
+            self.run = last[0]
+            done = self.connection.execute("SELECT COUNT(*) FROM steps WHERE run = ? AND status = 'done'",
+                                           (self.run,)).fetchone()[0]
+            print(f"Resuming run {self.run} started {last[1]} ({done} steps done)")
+        else:
+            with self.connection:
+                self.run = self.connection.execute("INSERT INTO runs (started) VALUES (?)", (_now(),)).lastrowid
+            print(f"Starting run {self.run}, journal in {path}")
+
+    def done(self, layer, herd, stage):
+        """True when the step completed in this run and its artifacts are unchanged since"""
+        status = self.connection.execute("SELECT status FROM steps WHERE run = ? AND layer = ? AND herd = ? AND stage = ?",
+                                         (self.run, layer, herd, stage)).fetchone()
+        if not status or status[0] != "done":
+            return False
+
+        recorded = self.connection.execute(
+            "SELECT artifact, fingerprint FROM artifacts WHERE run = ? AND layer = ? AND herd = ? AND stage = ?",
+            (self.run, layer, herd, stage)).fetchall()
+        for artifact, recorded_fingerprint in recorded:
+            if fingerprint(artifact) != recorded_fingerprint:
+                print(f"{artifact} changed since {herd} {stage} completed, running it again")
+                return False
+        return True
+
+    def pending(self, layer, stage, herds):
+        """Herds (in the given order) whose step still has to run"""
+        return [herd for herd in herds if not self.done(layer, herd, stage)]
+
+    def resume(self, layer, herd, stages):
+        """
+        Steps of a herd still to run out of a chain of steps: from its first step that isn't done on, as every step
+        after it reads what that step writes. None once the last step is done, the earlier steps' interim layers
+        may be dropped by then.
+        """
+        if self.done(layer, herd, stages[-1]):
+            return []
+        first = next(position for position, stage in enumerate(stages) if not self.done(layer, herd, stage))
+        return stages[first:]
+
+    def begin(self, layer, herd, stage, artifacts=()):
+        """Mark a step as running, anything an interrupted attempt left of its artifacts is deleted first"""
+        for artifact in artifacts:
+            if exists(artifact):
+                print(f"Deleting {artifact} left by an interrupted {stage} step")
+                delete(artifact)
+        with self.connection:
+            self.connection.execute("DELETE FROM artifacts WHERE run = ? AND layer = ? AND herd = ? AND stage = ?",
+                                    (self.run, layer, herd, stage))
+            self.connection.execute("INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, 'running', ?, NULL)",
+                                    (self.run, layer, herd, stage, _now()))
+
+    def complete(self, layer, herd, stage, artifacts=()):
+        """Record the step and the fingerprint of every artifact it wrote, artifacts that weren't written are skipped"""
+        fingerprints = [(artifact, fingerprint(artifact)) for artifact in artifacts]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(self.run, layer, herd, stage, artifact, value)
+                                         for artifact, value in fingerprints if value is not None])
+            self.connection.execute("UPDATE steps SET status = 'done', completed = ? "
+                                    "WHERE run = ? AND layer = ? AND herd = ? AND stage = ?",
+                                    (_now(), self.run, layer, herd, stage))
+
+    def current(self, artifacts, source):
+        """True when every artifact was derived from the same source key, in any run, and is unchanged since"""
+        for artifact in artifacts:
+            recorded = self.connection.execute("SELECT source, fingerprint FROM derived WHERE artifact = ?",
+                                               (artifact,)).fetchone()
+            if not recorded or recorded[0] != source or fingerprint(artifact) != recorded[1]:
+                return False
+        return bool(artifacts)
+
+    def rebuild(self, artifacts):
+        """Forget and delete derived artifacts that are about to be built again"""
+        with self.connection:
+            self.connection.executemany("DELETE FROM derived WHERE artifact = ?", [(artifact,) for artifact in artifacts])
+        for artifact in artifacts:
+            delete(artifact)
+
+    def derive(self, artifacts, source):
+        """Record the artifacts as derived from the source key"""
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO derived VALUES (?, ?, ?)",
+                                        [(artifact, source, fingerprint(artifact)) for artifact in artifacts])
+
+    def record(self, gdb, herd, stage, names):
+        """Interim layers a stage wrote to the gdb for a herd, kept across runs until they are forgotten"""
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO produced VALUES (?, ?, ?, ?)",
+                                        [(gdb, herd, stage, name) for name in names])
+
+    def produced(self, gdb, herd, stage=None):
+        """(stage, name) of the interim layers recorded for a herd, for one stage or all of them"""
+        return self.connection.execute("SELECT stage, name FROM produced WHERE gdb = ? AND herd = ? "
+                                       "AND (? IS NULL OR stage = ?) ORDER BY stage, name",
+                                       (gdb, herd, stage, stage)).fetchall()
+
+    def forget(self, gdb, herd, stage, names):
+        with self.connection:
+            self.connection.executemany("DELETE FROM produced WHERE gdb = ? AND herd = ? AND stage = ? AND name = ?",
+                                        [(gdb, herd, stage, name) for name in names])
+
+    def finish(self):
+        """Close the run, the next start of the pipeline begins a new one"""
+        with self.connection:
+            self.connection.execute("UPDATE runs SET finished = ? WHERE run = ?", (_now(), self.run))
+        self.connection.close()
@@ -0,0 +1,338 @@
+'''
+    Open source backend for the geoprocessing stages
+
+    Purpose:   shapely/pandas versions of the per herd stages (extraction selection, linear buffers, merge/clip/
+               dissolve, 500m buffers, intersect, spaghetti and meatball flatten, field mapping and the final
+               identity) so the pipeline can be run and timed without ArcGIS. Layers are DataFrames with a shapely
+               'geometry' column; the output tables have the field names of the arcpy outputs so static_grouping and
+               protection_classes run on them unchanged.
+
+    Dependencies:  numpy, pandas and shapely (2.0 or later)
+'''
+import sqlite3
+import struct
+import time
+import numpy as np
+import pandas as pd
+from extraction import DISTURBANCE_SCHEMA
+
+# Source layer: linear buffer distance (m) and the disturbance name written on the buffered features
+LINEAR_BUFFERS = {"rail": (5, "rail"), "dam": (7, "dam"), "transmission": (25, "transmission"), "roads": (25, "road")}
+
+# Disturbances that don't get the 500m buffer
+NO_BUFFER = ("fire_historical", "fire_current", "pest", "reservoir")
+
+DISSOLVE_FIELDS = ["year", "type", "disturbance", "severity"]
+
+# (output field, source field, disturbances the join is limited to, merge rule) - mirrors the spatial join field
+# mappings of disturbance_field_mapping, disturbance_buffer_field_mapping and protection_layer.field_mapping
+FIRE = ("fire_historical", "fire_current")
+DISTURBANCE_FIELD_MAPS = [
+    ("disturbances", "disturbance", None, "join"),
+    ("types", "type", None, "join"),
+    ("Cutblock_year", "year", ("cutblock",), "join"),
+    ("latest_cut", "year", ("cutblock",), "max"),
+    ("Pest_year", "year", ("pest",), "join"),
+    ("latest_pest", "year", ("pest",), "max"),
+    ("pest_severity", "severity", ("pest",), "join"),
+    ("Fire_year", "year", FIRE, "join"),
+    ("latest_fire", "year", FIRE, "max"),
+]
+BUFFER_FIELD_MAPS = [
+    ("disturbances_buffer", "disturbance", None, "join"),
+    ("types_buffer", "type", None, "join"),
+    ("Cutblock_year_buffer", "year", ("cutblock buffer",), "join"),
+    ("latest_cut_buffer", "year", ("cutblock buffer",), "max"),
+]
+PROTECTION_FIELD_MAPS = [
+    ("designations", "designation", None, "join"),
+    ("sources_list", "source_name", None, "join"),
+    ("forest_restriction_list", "forest_restriction", None, "join"),
+    ("max_forest_restrict", "forest_restriction", None, "max"),
+    ("mine_restriction_list", "mine_restriction", None, "join"),
+    ("max_mine_restriction", "mine_restriction", None, "max"),
+    ("og_restriction_list", "og_restriction", None, "join"),
+    ("max_og_restriction", "og_restriction", None, "max"),
+]
+PROTECTION_FIELDS = ["designation", "source_name", "forest_restriction", "mine_restriction", "og_restriction"]
+
+# NAD83 / BC Albers
+GPKG_SRS_ID = 3005
+
+GPKG_TABLES = """
+CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+CREATE TABLE gpkg_contents (table_name TEXT PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+    description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER);
+CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+    geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+    CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name));
+CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+    definition TEXT NOT NULL, scope TEXT NOT NULL);
+INSERT INTO gpkg_spatial_ref_sys VALUES ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', NULL);
+INSERT INTO gpkg_spatial_ref_sys VALUES ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', NULL);
+"""
+
+
+def _shapely():
+    import shapely
+    return shapely
+
+
+def write_gpkg(layers, path, srs_id=GPKG_SRS_ID):
+    """
+    Write DataFrame layers to a GeoPackage with an rtree index on every table, a local stand-in for the BCGW/BCCE
+
+    Only what read_gpkg (and GDAL) need is written: the gpkg metadata tables, the features and the spatial index.
+    """
+    shapely = _shapely()
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA application_id = 1196444487")
+    connection.execute("PRAGMA user_version = 10200")
+    connection.executescript(GPKG_TABLES)
+    connection.execute("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, 'EPSG', ?, 'undefined', NULL)",
+                       (f"EPSG:{srs_id}", srs_id, srs_id))
+
+    for name, layer in layers.items():
+        attributes = [column for column in layer.columns if column != "geometry"]
+        types = {column: "INTEGER" if pd.api.types.is_integer_dtype(layer[column]) else
+                 "REAL" if pd.api.types.is_float_dtype(layer[column]) else "TEXT" for column in attributes}
+        columns = ", ".join(f'"{column}" {types[column]}' for column in attributes)
+        connection.execute(f'CREATE TABLE "{name}" (fid INTEGER PRIMARY KEY AUTOINCREMENT, geom BLOB'
+                           + (f", {columns})" if columns else ")"))
+        connection.execute(f'CREATE VIRTUAL TABLE "rtree_{name}_geom" USING rtree(id, minx, maxx, miny, maxy)')
+
+        geometries = layer["geometry"].values
+        bounds = shapely.bounds(geometries) if len(layer) else np.empty((0, 4))
+        header = b"GP\x00\x01" + struct.pack("<i", srs_id)
+        blobs = [header + wkb for wkb in shapely.to_wkb(geometries, byte_order=1)] if len(layer) else []
+        rows = layer[attributes].astype(object).where(layer[attributes].notna(), None).values.tolist()
+        placeholders = ", ".join(["?"] * (len(attributes) + 2))
+        connection.executemany(f'INSERT INTO "{name}" VALUES ({placeholders})',
+                               [[fid, blob] + row for fid, blob, row in zip(range(1, len(layer) + 1), blobs, rows)])
+        connection.executemany(f'INSERT INTO "rtree_{name}_geom" VALUES (?, ?, ?, ?, ?)',
+                               [(fid, b[0], b[2], b[1], b[3]) for fid, b in zip(range(1, len(layer) + 1), bounds)])
+
+        geometry_type = shapely.get_type_id(geometries[0]) if len(layer) else 3
+        extent = (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()) if len(layer) else (None,) * 4
+        connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) "
+                           "VALUES (?, 'features', ?, ?, ?, ?, ?, ?)", (name, name, *extent, srs_id))
+        connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)",
+                           (name, {1: "POINT", 2: "LINESTRING", 3: "POLYGON"}.get(int(geometry_type), "GEOMETRY"), srs_id))
+        connection.execute("INSERT INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', "
+                           "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')", (name,))
+    connection.commit()
+    connection.close()
+
+
+def _gpkg_wkb(blob):
+    """WKB of a GeoPackage geometry blob, the header is 8 bytes plus the envelope given by flag bits 1-3"""
+    envelope = (blob[3] >> 1) & 0b111
+    return blob[8 + {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[envelope]:]
+
+
+def read_gpkg(path, table, where=None, aoi_geometry=None):
+    """
+    Features of a GeoPackage table, the attribute query and the AOI envelope are applied in SQLite (through the rtree
+    index) and the exact intersection with the AOI in shapely
+    """
+    shapely = _shapely()
+    sql = f'SELECT * FROM "{table}"'
+    clauses = [f"({where})"] if where else []
+    if aoi_geometry is not None:
+        xmin, ymin, xmax, ymax = shapely.bounds(aoi_geometry)
+        clauses.append(f'fid IN (SELECT id FROM "rtree_{table}_geom" WHERE maxx >= {xmin} AND minx <= {xmax} '
+                       f'AND maxy >= {ymin} AND miny <= {ymax})')
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+
+    connection = sqlite3.connect(path)
+    try:
+        rows = pd.read_sql_query(sql, connection)
+    finally:
+        connection.close()
+
+    layer = rows.drop(columns=["fid", "geom"])
+    layer["geometry"] = shapely.from_wkb([_gpkg_wkb(blob) for blob in rows["geom"]]) if len(rows) else []
+    return select_intersecting(layer, aoi_geometry) if aoi_geometry is not None else layer
+
+
+def fetch_gpkg(name, path, table, where, aoi_geometry, outputs, split_field=None, latency=0):
+    """
+    Fetch of one disturbance source from a GeoPackage stand-in, for fetch.fetch_all. The table is read once and split
+    into its outputs as extraction.extract_source does
+
+    outputs: list of (disturbance name, split value), see split_source
+    latency: seconds added to the read to stand in for the round trips to the BCGW
+    Returns disturbance name -> standardized features
+    """
+    time.sleep(latency)
+    return split_source(read_gpkg(path, table, where, aoi_geometry), outputs, split_field)
+
+
+def empty_layer(columns=()):
+    return pd.DataFrame({column: [] for column in list(columns) + ["geometry"]})
+
+
+def select_intersecting(layer, aoi_geometry, query=None):
+    """SelectLayerByLocation INTERSECT, with the attribute query applied first as MakeFeatureLayer does"""
+    shapely = _shapely()
+    if query is not None:
+        layer = layer[query(layer)]
+    if layer.empty:
+        return layer.reset_index(drop=True)
+    index = shapely.STRtree(layer["geometry"].values).query(aoi_geometry, predicate="intersects")
+    return layer.iloc[np.sort(index)].reset_index(drop=True)
+
+
+def standardize(layer, name):
+    """type/disturbance/year/severity from the DISTURBANCE_SCHEMA mapping used by extraction.extract_source"""
+    type_value, year_field, severity_field = DISTURBANCE_SCHEMA[name]
+    return pd.DataFrame({
+        "type": type_value,
+        "disturbance": name,
+        "year": layer[year_field].astype("Int64") if year_field else pd.array([pd.NA] * len(layer), dtype="Int64"),
+        "severity": layer[severity_field].values if severity_field else None,
+        "geometry": layer["geometry"].values,
+    })
+
+
+def split_source(layer, outputs, split_field=None):
+    """
+    Standardized features of every output of one source read, the split of extraction.extract_source
+
+    outputs: list of (disturbance name, split value); with a split_field each feature goes to the output whose split
+             value matches its split_field value, without one every feature goes to the output
+    """
+    return {name: standardize(layer[layer[split_field] == split_value] if split_field else layer, name)
+            for name, split_value in outputs}
+
+
+def buffer_layer(layer, distance, disturbance=None):
+    """Buffer every feature, optionally stamping the disturbance name used for the buffered class"""
+    shapely = _shapely()
+    buffered = layer.copy()
+    buffered["geometry"] = shapely.buffer(layer["geometry"].values, distance)
+    if disturbance:
+        buffered["type"] = "Static"
+        buffered["disturbance"] = disturbance
+    return buffered
+
+
+def merge_clip_dissolve(layers, aoi_geometry, dissolve_fields=DISSOLVE_FIELDS):
+    """Merge on the standard schema, clip to the AOI and dissolve per attribute key"""
+    shapely = _shapely()
+    layers = [layer for layer in layers if not layer.empty]
+    if not layers:
+        return empty_layer(dissolve_fields)
+    merged = pd.concat(layers, ignore_index=True)
+    merged["geometry"] = shapely.intersection(merged["geometry"].values, aoi_geometry)
+    merged = merged[~shapely.is_empty(merged["geometry"].values)]
+    keys = merged[dissolve_fields].astype(object).where(merged[dissolve_fields].notna(), None)
+    groups = merged.groupby([keys[field] for field in dissolve_fields], dropna=False, sort=False)["geometry"]
+    dissolved = groups.agg(lambda geometries: shapely.union_all(geometries.values)).reset_index()
+    dissolved.columns = dissolve_fields + ["geometry"]
+    return dissolved
+
+
+def buffer_disturbance(disturbance, distance=500):
+    """500m buffer of every disturbance class except fire, pest and reservoir"""
+    selected = disturbance[~disturbance["disturbance"].isin(NO_BUFFER)]
+    buffered = buffer_layer(selected, distance)
+    buffered["disturbance"] = buffered["disturbance"] + " buffer"
+    return buffered.reset_index(drop=True)
+
+
+def intersect(layer, habitat, habitat_fields=("Herd_Name", "BCHab_code")):
+    """Intersect with the habitat polygons, carrying the herd and habitat attributes"""
+    shapely = _shapely()
+    if layer.empty or habitat.empty:
+        return empty_layer(list(habitat_fields) + [c for c in layer.columns if c != "geometry"])
+    habitat_index, layer_index = shapely.STRtree(layer["geometry"].values).query(habitat["geometry"].values,
+                                                                                  predicate="intersects")
+    result = layer.drop(columns="geometry").iloc[layer_index].reset_index(drop=True)
+    for field in habitat_fields:
+        result.insert(0, field, habitat[field].values[habitat_index])
+    result["geometry"] = shapely.intersection(layer["geometry"].values[layer_index],
+                                              habitat["geometry"].values[habitat_index])
+    return result[~shapely.is_empty(result["geometry"].values)].reset_index(drop=True)
+
+
+def flatten(geometries):
+    """Spaghetti: node the boundaries of every (singlepart) polygon and rebuild the non-overlapping faces"""
+    shapely = _shapely()
+    parts = shapely.get_parts(np.asarray(geometries))
+    parts = parts[shapely.get_type_id(parts) == 3]
+    if not len(parts):
+        return np.array([], dtype=object)
+    linework = shapely.union_all(shapely.boundary(parts))
+    return shapely.get_parts(shapely.polygonize(shapely.get_parts(linework)))
+
+
+def field_mapping(faces, layer, field_maps, class_field="disturbance"):
+    """
+    Meatballs: join the attributes of every feature under each face's inside point with the Join/Max merge rules
+
+    Faces that nothing joined to (holes of the spaghetti) are dropped, as the 'IS NULL' deletes do.
+    """
+    shapely = _shapely()
+    if not len(faces) or layer.empty:
+        return empty_layer(["Join_Count"] + [output for output, _, _, _ in field_maps])
+
+    points = shapely.point_on_surface(faces)
+    face_index, feature_index = shapely.STRtree(layer["geometry"].values).query(points, predicate="intersects")
+    joined = layer.drop(columns="geometry").iloc[feature_index].reset_index(drop=True)
+    joined["face"] = face_index
+
+    table = pd.DataFrame({"Join_Count": joined.groupby("face").size()})
+    for output, field, classes, rule in field_maps:
+        rows = joined if classes is None else joined[joined[class_field].isin(classes)]
+        rows = rows[rows[field].notna()]
+        if rule == "join":
+            table[output] = rows[field].astype(str).groupby(rows["face"]).agg("; ".join)
+        else:
+            table[output] = pd.to_numeric(rows.groupby("face")[field].max(), errors="coerce")
+
+    table = table.reset_index().rename(columns={"face": "ORIG_FID"})
+    table["geometry"] = faces[table["ORIG_FID"].values]
+    table["area_ha"] = shapely.area(table["geometry"].values) / 10000
+    return table
+
+
+def identity(aoi, overlays):
+    """
+    Union of the AOI and the flat layers with the faces outside of the AOI dropped (final_identity)
+
+    overlays: list of (layer, suffix) - the suffix is added to fields that are already in the output, matching the
+              _1/_12 names the Union writes for the second and third area_ha fields
+    """
+    shapely = _shapely()
+    layers = [aoi] + [layer for layer, _ in overlays if not layer.empty]
+    faces = flatten(np.concatenate([layer["geometry"].values for layer in layers]))
+    points = shapely.point_on_surface(faces)
+
+    face_index, aoi_index = shapely.STRtree(aoi["geometry"].values).query(points, predicate="intersects")
+    _, first = np.unique(face_index, return_index=True)
+    face_index, aoi_index = face_index[first], aoi_index[first]
+
+    result = aoi.drop(columns="geometry").iloc[aoi_index].reset_index(drop=True)
+    inside = points[face_index]
+    for layer, suffix in overlays:
+        attributes = layer.drop(columns="geometry")
+        matched = np.full(len(inside), -1)
+        if not layer.empty:
+            point_index, layer_index = shapely.STRtree(layer["geometry"].values).query(inside, predicate="intersects")
+            matched[point_index] = layer_index
+        values = attributes.reindex(matched).reset_index(drop=True)
+        # Field names are case insensitive in a gdb, area_ha collides with the AOI's Area_Ha
+        existing = {column.lower() for column in result.columns}
+        values.columns = [f"{column}{suffix}" if column.lower() in existing else column for column in values.columns]
+        result = pd.concat([result, values], axis=1)
+
+    geometry = faces[face_index]
+    result.insert(0, "OID_", np.arange(1, len(result) + 1))
+    result["Shape_Length"] = shapely.length(geometry)
+    result["Shape_Area"] = shapely.area(geometry)
+    result["geometry"] = geometry
+    return result
@@ -0,0 +1,82 @@
+'''
+    Single pass partitioning of a feature class by a key field
+
+    Purpose:   Stream a source feature class once and route every feature to a per-key output (for example one
+               feature class per herd), instead of running a Select over the whole source for every key. Constant
+               fields and the area in hectares are written as the features are inserted so the outputs don't need
+               a later AddField/UpdateCursor pass. Nothing but the cursors is held in memory.
+
+               The outputs are written from this one process: they share a file gdb, which can't take new datasets
+               from several processes at once, and arcpy cursors aren't safe to use from several threads.
+'''
+import arcpy
+import os
+from contextlib import ExitStack
+
+
+def schema_template(source, workspace, name, drop_fields=(), add_fields=()):
+    """Empty copy of the source schema with fields dropped/added, changing an empty table doesn't rewrite any rows"""
+    desc = arcpy.Describe(source)
+    template = arcpy.management.CreateFeatureclass(workspace, name, desc.shapeType, template=source,
+                                                   spatial_reference=desc.spatialReference)[0]
+    existing = [field.name.upper() for field in arcpy.ListFields(template)]
+    for field in drop_fields:
+        if field.upper() in existing:
+            arcpy.DeleteField_management(template, field)
+            existing.remove(field.upper())
+    for field_name, field_type, field_alias in add_fields:
+        if field_name.upper() not in existing:
+            arcpy.AddField_management(template, field_name, field_type, field_alias=field_alias)
+    return template
+
+
+def partition_features(source, out_workspace, key_field, route, template=None, stamp=None, area_field=None):
+    """
+    Read source once and write one feature class per routed key
+
+    route (callable): key -> output feature class name, or None to skip the feature
+    template (str): feature class whose schema the outputs are created with (defaults to the source)
+    stamp (callable): key -> {field: value} written on every feature of that output
+    area_field (str): field filled with the feature area in hectares
+
+    Returns a dict of output name -> (key, feature count)
+    """
+    template = template or source
+    desc = arcpy.Describe(source)
+
+    out_fields = [field.name for field in arcpy.ListFields(template)
+                  if field.editable and field.type not in ("Geometry", "OID", "GlobalID")
+                  and not field.name.upper().startswith(("SHAPE", "GEOMETRY"))]
+    source_fields = {field.name.upper(): field.name for field in arcpy.ListFields(source)}
+    read_fields = [field for field in out_fields if field.upper() in source_fields and field != area_field]
+
+    # Each output is created empty with the template schema the first time its key comes up and every feature is
+    # inserted as it is read, only one insert cursor per output is held
+    counts = {}
+    keys = {}
+    cursor_fields = [key_field, "SHAPE@"] + [source_fields[field.upper()] for field in read_fields]
+    with ExitStack() as cursors:
+        inserts = {}
+        with arcpy.da.SearchCursor(source, cursor_fields) as cursor:
+            for row in cursor:
+                name = route(row[0])
+                if name is None:
+                    continue
+                if name not in inserts:
+                    arcpy.management.CreateFeatureclass(out_workspace, name, desc.shapeType, template=template,
+                                                        spatial_reference=desc.spatialReference)
+                    inserts[name] = cursors.enter_context(
+                        arcpy.da.InsertCursor(os.path.join(out_workspace, name), ["SHAPE@"] + out_fields))
+                    counts[name] = 0
+                    keys[name] = row[0]
+                values = dict(zip(read_fields, row[2:]))
+                if stamp:
+                    values.update(stamp(row[0]))
+                if area_field and row[1] is not None:
+                    values[area_field] = row[1].area * 0.0001
+                inserts[name].insertRow([row[1]] + [values.get(field) for field in out_fields])
+                counts[name] += 1
+
+    for name, count in counts.items():
+        print(f"{name}: {count} features")
+    return {name: (keys[name], count) for name, count in counts.items()}
@@ -0,0 +1,146 @@
+'''
+    Run predictions and live progress
+
+    Purpose:   Predict how long the per herd stages of a layer will take before they start (from the herd costs the
+               scheduler estimates out of the timing report, see scheduler.py), then follow the herds as they run:
+               each finished herd prints the stage's progress, throughput and ETA, and a herd still running after
+               SLOW_FACTOR times its predicted seconds is flagged while it runs, so it can be stopped and retiled
+               instead of being found days later.
+'''
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from scheduler import estimate_costs
+
+# A herd/stage running longer than this multiple of its prediction is flagged
+SLOW_FACTOR = 2
+# Herds predicted to take less than this aren't flagged, the estimate is too rough at that size
+MIN_FLAG_SECONDS = 60
+# How often the running herds are checked against their predictions
+CHECK_SECONDS = 30
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds or 0))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def lpt_makespan(costs, workers=1):
+    """Seconds until the last herd is done when the herds are handed largest first to the workers"""
+    loads = [0.0] * max(1, workers)
+    for cost in sorted(costs, reverse=True):
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def predict_run(inputs, timing, layer, workers=1):
+    """
+    Predicted seconds per herd for each stage, printed with the predicted duration and finish time of the layer
+
+    inputs: stage -> hectares, features and vertices per herd of what the stage reads (see herd_inputs)
+    """
+    predictions = {stage: estimate_costs(stage_inputs, timing, layer, stage) for stage, stage_inputs in inputs.items()}
+
+    total = 0
+    print('Predicted run for {} ({} herds, {} worker(s)):'.format(layer, len(next(iter(inputs.values()))), workers))
+    for stage, costs in predictions.items():
+        seconds = lpt_makespan(costs, workers)
+        total += seconds
+        largest = ", ".join(f"{herd} {format_seconds(cost)}" for herd, cost in costs.head(3).items())
+        print(f"    {stage:<12}{format_seconds(seconds):>10}   largest: {largest}")
+    print('    ETA {} ({})'.format((datetime.now() + timedelta(seconds=total)).strftime("%Y-%m-%d %H:%M"),
+                                  format_seconds(total)))
+    return predictions
+
+
+class StageProgress:
+    """Progress of one stage over the herds of a layer, run_herds reports each herd as it starts and finishes"""
+
+    def __init__(self, layer, stage, predicted, hectares, workers=1, check_seconds=CHECK_SECONDS):
+        self.layer = layer
+        self.stage = stage
+        self.predicted = predicted
+        self.hectares = hectares
+        self.workers = workers
+        self.check_seconds = check_seconds
+        self.running = {}
+        self.finished = {}
+        self.flagged = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._monitor = threading.Thread(target=self._watch, daemon=True)
+        self._monitor.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._monitor.join()
+        elapsed = time.perf_counter() - self.started
+        print('{} for {} done in {} (predicted {}){}'.format(
+            self.stage, self.layer, format_seconds(elapsed),
+            format_seconds(lpt_makespan(self.predicted.reindex(list(self.finished)).fillna(0), self.workers)),
+            ", over {}x prediction: {}".format(SLOW_FACTOR, ", ".join(sorted(self.flagged))) if self.flagged else ""))
+
+    def start(self, herd):
+        with self._lock:
+            self.running[herd] = time.perf_counter()
+
+    def finish(self, herd, seconds):
+        with self._lock:
+            self.running.pop(herd, None)
+            self.finished[herd] = seconds
+
+        predicted = self.predicted.get(herd, 0)
+        if self._is_slow(seconds, predicted):
+            self._flag(herd, seconds, predicted, "took")
+
+        elapsed = time.perf_counter() - self.started
+        hectares = self.hectares.reindex(list(self.finished)).sum()
+        print('[{} {}/{}] {} done in {} (predicted {}) | {:.0f} ha/min | ETA {}'.format(
+            self.stage, len(self.finished), len(self.predicted), herd, format_seconds(seconds),
+            format_seconds(predicted), hectares / elapsed * 60 if elapsed else 0, self.eta()))
+
+    def eta(self):
+        """Finish time of the stage, the remaining predictions scaled by how the finished herds did against theirs"""
+        with self._lock:
+            finished = dict(self.finished)
+            running = dict(self.running)
+
+        predicted_done = sum(self.predicted.get(herd, 0) for herd in finished)
+        ratio = sum(finished.values()) / predicted_done if predicted_done else 1
+        now = time.perf_counter()
+        remaining = [max(0, self.predicted[herd] * ratio - (now - running[herd]) if herd in running else
+                         self.predicted[herd] * ratio)
+                     for herd in self.predicted.index if herd not in finished]
+        seconds = lpt_makespan(remaining, self.workers)
+        return '{} ({} left)'.format((datetime.now() + timedelta(seconds=seconds)).strftime("%H:%M"),
+                                     format_seconds(seconds))
+
+    def _is_slow(self, seconds, predicted):
+        return predicted * SLOW_FACTOR >= MIN_FLAG_SECONDS and seconds > predicted * SLOW_FACTOR
+
+    def _flag(self, herd, seconds, predicted, state):
+        if herd in self.flagged:
+            return
+        self.flagged.add(herd)
+        print('SLOW: {} {} {} {}, over {}x the predicted {} - consider stopping it and retiling the herd'.format(
+            herd, self.stage, state, format_seconds(seconds), SLOW_FACTOR, format_seconds(predicted)))
+
+    def _watch(self):
+        # Flags herds while they are still running, a stalled herd never reaches finish()
+        while not self._stop.wait(self.check_seconds):
+            now = time.perf_counter()
+            with self._lock:
+                running = dict(self.running)
+            for herd, started in running.items():
+                predicted = self.predicted.get(herd, 0)
+                if self._is_slow(now - started, predicted):
+                    self._flag(herd, now - started, predicted, "has been running for")
@@ -25,20 +25,28 @@ import logging
 import smtplib
 import socket
 import pandas as pd
+from herd_index import herd_values
+
+def protection_flatten():
+    """PROTECTION_FLATTEN: herd (flatten the clipped designated lands of every herd) or province (flatten once, clip per herd)"""
+    mode = (os.getenv("PROTECTION_FLATTEN") or "herd").strip().lower()
+    if mode not in ("herd", "province"):
+        raise ValueError(f"Unknown PROTECTION_FLATTEN '{mode}', expected herd or province")
+    return mode
 # Function goes through area of interest (AOI) to start the intersection of protection layers
-def protect_aoi(aoi_location, layer_name, unique_value):
-    aoi = os.path.join(aoi_location,layer_name)
-
-    search_word = "{}".format(unique_value)
-
-    with arcpy.da.SearchCursor(aoi, [search_word]) as cursor:
-        values_sorted = sorted({row[0] for row in cursor})
+def protect_aoi(aoi_location, layer_name, unique_value, herd_index):
+    values_sorted = herd_values(herd_index, layer_name)
     print('Running protection on: {}'.format(values_sorted))
 
     print("AOI loaded")
 # Function clips the designated lands (protection) layer by each AOI created in the protection function of Run_Disturbance
-def gather_protection(designated_lands, value_update):
-    arcpy.analysis.Clip(designated_lands, 'aoi', f"{value_update}_designated_lands_clip")
+# With a tile index (see tile_index.py) only the tiles that overlap the AOI are read instead of the whole provincial layer
+def gather_protection(designated_lands, value_update, aoi_fc, tiles=None):
+    if tiles:
+        designated_lands = tiles.layer(arcpy.Describe(aoi_fc).extent, f"{value_update}_designated_tiles")
+    arcpy.analysis.Clip(designated_lands, aoi_fc, f"{value_update}_designated_lands_clip")
+    if tiles:
+        arcpy.Delete_management(designated_lands)
 
     arcpy.management.Dissolve(f"{value_update}_designated_lands_clip", f"{value_update}_designated_lands", ['designation', 'source_name', 'forest_restriction', 'mine_restriction', 'og_restriction'])
 # Using the Spaghetti and Meatballs method (see disturbance) protection overlap relationship is created
@@ -355,35 +363,19 @@ def clean_and_join(value_update, keep_list):
 
     arcpy.AddField_management("{}_protect_flat".format(value_update), "analysis_date", "DATE")
     arcpy.CalculateField_management("{}_protect_flat".format(value_update), "analysis_date", 'datetime.datetime.now()', "PYTHON3")
-
-    cleanupfeatures = arcpy.ListFeatureClasses()
-
-    final_str = ("_flat")
-    for intersect_f in cleanupfeatures:
-        if intersect_f.endswith(final_str):
-            pass
-        else:
-            arcpy.Delete_management(intersect_f)
     
-def combine(values, value_update, unique_value, intersect_layer, aoi_location):
-
-    layer_location =os.path.join(aoi_location,intersect_layer)
-    values_query = """{} = '{}'""".format(unique_value, values)
-    values_select = arcpy.SelectLayerByAttribute_management(layer_location, "NEW_SELECTION", values_query)
-    arcpy.CopyFeatures_management(values_select, 'aoi')
-    features = arcpy.ListFeatureClasses()
-    
-    protection_layers = []
-    for protection in features:
-        if protection.endswith('_protect_flat'):
-            protection_layers.append(protection)
-
-    for protection in protection_layers:
-        if protection.startswith(value_update):
-            arcpy.Identity_analysis('aoi', protection, "{}_protect_intersect".format(value_update))
-            arcpy.Identity_analysis("{}_protect_intersect".format(value_update),"{}_flat".format(value_update), "{}_final_flat".format(value_update))
-
-            print("Done identity for {}".format(value_update))
-
-            arcpy.Delete_management(protection)
-            arcpy.Rename_management("{}_protect_intersect".format(value_update), "{}_protect_flat".format(value_update))
\ No newline at end of file
+# Province mode: the flats of the grid cells become one provincial protection flat
+def merge_protection_cells(cells, workspace, province_flat):
+    cell_flats = [os.path.join(workspace, f"{cell}_protect_flat") for cell in cells]
+    cell_flats = [cell_flat for cell_flat in cell_flats if arcpy.Exists(cell_flat)]
+    if not cell_flats:
+        # No cell had designated lands to flatten, the herds get no protection flat
+        print("No protection faces in any of the {} cells, {} not written".format(len(cells), province_flat))
+        return
+    arcpy.management.Merge(cell_flats, province_flat)
+    for cell_flat in cell_flats:
+        arcpy.Delete_management(cell_flat)
+    print("{} protection faces in {} from {} cells".format(arcpy.management.GetCount(province_flat)[0], province_flat, len(cell_flats)))
+# Province mode: the protection flat of a herd is the provincial flat clipped to its AOI
+def clip_protection_flat(province_flat, value_update, aoi_fc):
+    arcpy.analysis.Clip(province_flat, aoi_fc, f"{value_update}_protect_flat")
@@ -16,65 +16,35 @@
      
     Outputs: Features classes and shapefiles of individual disturbance and cumulative disturbance
 '''
-import arcpy
 import os
 import re
 import json
 import logging
 import smtplib
 import socket
+import numpy as np
 import pandas as pd
-def tabletotable(value_update, csv_dir):
-    arcpy.TableToTable_conversion("{}_protect_flat".format(value_update), csv_dir, "{}_protect_flat.csv".format(value_update))
+# Fields the final identity carries over from the disturbance and disturbance buffer flats, the protection tables don't use them
+DISTURBANCE_COLUMNS = ['disturbances', 'types', 'Cutblock_year', 'latest_cut', 'Pest_year', 'latest_pest', 'pest_severity',
+                       'most_recent_pest', 'Fire_year', 'latest_fire', 'Number_Disturbance', 'disturbances_buffer', 'types_buffer',
+                       'Cutblock_year_buffer', 'latest_cut_buffer', 'Number_Disturbance_buff', 'area_ha_1', 'area_ha_12']
+
 def combine_loose_herds(csv_dir, value_update,csv_protect_output):
-    # list the files in the CSV directory
-    csv_files = os.listdir(csv_dir)
-
-    flat_files = []
-    df_flat_files = []
-    for files in csv_files:
-        if files.endswith('_protect_flat.csv'):
-            if files.startswith(value_update):
-                print(value_update)
-                print(files)
-                flat_files.append(files)
-            else:
-                pass
-        else:
-            pass
-
-    for flat_files_df in flat_files:
-
-        print(flat_files_df)
-        flatfiles_name = flat_files_df.strip('.csv')
-
-        flatfiles_name = pd.read_csv(os.path.join(csv_dir, flat_files_df))
-
-        df_flat_files.append(flatfiles_name)
-    
-    protect_flat = pd.concat(df_flat_files)
+    # The protection table of a herd is read from the _flat.csv the final identity writes for both tables
+    flat_file = os.path.join(csv_dir, f"{value_update}_flat.csv")
+    print(flat_file)
+
+    protect_flat = pd.read_csv(flat_file, low_memory=False)
     ###
     protect_flat = protect_flat.loc[:, ~protect_flat.columns.str.startswith('FID')]
+    protect_flat = protect_flat.drop(columns=DISTURBANCE_COLUMNS, errors='ignore')
     print(protect_flat)
     ##
 
     protect_flat.to_csv(os.path.join(csv_dir,f"{csv_protect_output}.csv"))
     
-def protection_grouping(csv_dir, csv_protect_output, table_group):
-    flat = pd.read_csv(os.path.join(csv_dir,f"{csv_protect_output}.csv"))
-
-    herd_base = pd.read_csv(os.path.join(csv_dir,'sheet_base.csv'))
-    herd_base = herd_base.drop(columns=['Shape_Length', 'Shape_Area'])
-
-    park_national = flat.loc[flat.designations.str.contains("park_national", na=False)]
-    park_national = park_national.groupby(table_group).sum('Shape_Area')
-    park_national = park_national.Shape_Area.div(10000).rename("National Parks")
-
-    flat_protections = pd.merge(herd_base, park_national,  how="outer", left_on = table_group, right_on = table_group)
-    
-    print(flat_protections)
-
-    protection_list = {'park_er' : 'Ecological Reserves' , 'park_provincial' : 'Provincial Parks' , 'park_conservancy' : 'Conservancies' , 'park_protectedarea' : 'Protected Areas' , 'park_recreationarea' : 'Recreation Area' , 
+# Designation token: column of the protections table, in column order
+PROTECTION_DESIGNATIONS = {'park_national' : 'National Parks' , 'park_er' : 'Ecological Reserves' , 'park_provincial' : 'Provincial Parks' , 'park_conservancy' : 'Conservancies' , 'park_protectedarea' : 'Protected Areas' , 'park_recreationarea' : 'Recreation Area' , 
     'private_conservation_lands_admin' : 'Conservation Lands, Administered Lands' , 'wildlife_management_area' : 'Wildlife Management Areas' , 'creston_valley_wma' : 'Creston Valley Wildlife Management Area' , 'national_wildlife_area' : 'National Wildlife Area' , 
     'ngo_fee_simple' : 'NGO Fee Simple Conservation Lands' ,'migratory_bird_sanctuary' : 'Migratory Bird Sanctuary' , 'mineral_reserve' : 'Mineral Reserve Sites' , 'uwr_no_harvest' : 'Ungulate Winter Range, No Harvest' , 'wha_no_harvest' : 'Wildlife Habitat Areas, No Harvest' , 
      'biodiv_mining_tourism_areas' : 'Biodiversity Mining and Tourism Areas' , 'wildland_area' : 'Sea to Sky Wildland Area' , 'muskwa_kechika_special_wildland' : 'Special Wildland RMZ in Muskwa Kechika MA' , 'ogma' : 'Old Growth Management Areas (Legal and Non-Legal)' , 
@@ -85,90 +55,74 @@ def protection_grouping(csv_dir, csv_protect_output, table_group):
       'fsw' : 'Fisheries Sensitive Watersheds' , 'great_bear_fisheries_watersheds' : 'Important Fisheries Watersheds (Great Bear Rainforest LUO)' , 'great_bear_ebm_area' : 'GBRO Area (Great Bear Rainforest LUO EBM Areas)' , 
       'lrmp_hg' : 'Haida Gwaii EBM Areas (unprotected areas on Haida Gwaii)' , 'atlin_taku_fra' : 'Atlin-Taku Forest Retention Areas'}
 
-    for protection, protection_name  in zip(protection_list.keys(), protection_list.values()):
-        protection_df = protection + '_df'
-        protection_df = flat.loc[flat.designations.str.contains("{}".format(protection), na=False)]
-        protection_df = protection_df.groupby(table_group).sum('Shape_Area')
-        protection_df = protection_df.Shape_Area.div(10000).rename("{}".format(protection_name))
-
-        flat_protections = pd.merge(flat_protections, protection_df,  how="outer", left_on = table_group, right_on = table_group)
-
-        print(flat_protections)
-    
-    range_out = csv_protect_output.replace('protect','')
-    flat_protections.to_csv(csv_dir + range_out + "protections_flat.csv")
-    
-def protection_classes(csv_dir, csv_protect_output, table_group):
+def designation_indicators(designations):
+    """(face, designation) of every designation token in the '; ' joined designations lists, each once per face"""
+    tokens = designations.fillna("").astype(str).str.split(";").explode().str.strip()
+    tokens = tokens.loc[tokens != ""]
+    return pd.DataFrame({"face": tokens.index.to_numpy(), "designation": tokens.to_numpy()}).drop_duplicates()
 
-    flat = pd.read_csv(os.path.join(csv_dir,f"{csv_protect_output}.csv"))
+def protection_grouping(csv_dir, csv_protect_output, table_group):
+    flat = pd.read_csv(os.path.join(csv_dir,f"{csv_protect_output}.csv"), low_memory=False).reset_index(drop=True)
 
     herd_base = pd.read_csv(os.path.join(csv_dir,'sheet_base.csv'))
     herd_base = herd_base.drop(columns=['Shape_Length', 'Shape_Area'])
 
+    # Sparse face x designation indicator matrix (exact tokens, vqo_modify doesn't match vqo_maxmodify), the hectares of
+    # every designation by herd/habitat are its product with the face areas summed by group: one bincount over the pairs
+    grouped = flat.groupby(table_group)
+    face_group = grouped.ngroup().to_numpy()
+    groups = grouped.size().index
+    indicators = designation_indicators(flat['designations'])
+    codes = pd.Categorical(indicators['designation'], categories=list(PROTECTION_DESIGNATIONS)).codes
+    faces = indicators['face'].to_numpy()
+    keep = (codes >= 0) & (face_group[faces] >= 0)
+    cells = face_group[faces[keep]] * len(PROTECTION_DESIGNATIONS) + codes[keep]
+
+    shape = (len(groups), len(PROTECTION_DESIGNATIONS))
+    hectares = np.bincount(cells, weights=flat['Shape_Area'].to_numpy(float)[faces[keep]] / 10000, minlength=shape[0] * shape[1])
+    counts = np.bincount(cells, minlength=shape[0] * shape[1])
+    # Groups without any face of a designation stay empty, as they did after the outer merges
+    hectares = np.where(counts > 0, hectares, np.nan).reshape(shape)
+    protections = pd.DataFrame(hectares, index=groups, columns=list(PROTECTION_DESIGNATIONS.values()))
+
+    flat_protections = pd.merge(herd_base, protections.reset_index(), how="outer", left_on = table_group, right_on = table_group)
 
-    park_national = flat.loc[flat['max_forest_restrict'] == 5]
-    park_national = park_national.groupby(table_group).sum('Shape_Area')
-    park_national = park_national.Shape_Area.div(10000).rename("Forestry - Protected")
-
-    flat_protections = pd.merge(herd_base, park_national,  how="outer", left_on = table_group, right_on = table_group)
-
-    protection_coding = {4: 'Full', 3: 'High', 2: 'Medium', 1: 'Low'}
-
-    for coding, classes in zip(protection_coding.keys(), protection_coding.values()):
-            
-        classes_df = classes + '_df'
-        classes_df = flat.loc[flat['max_forest_restrict'] == coding]
-        classes_df = classes_df.groupby(table_group).sum('Shape_Area')
-        classes_df = classes_df.Shape_Area.div(10000).rename("Forestry - {}".format(classes))
-
-        flat_protections = pd.merge(flat_protections, classes_df,  how="outer", left_on = table_group, right_on = table_group)
-
-        print(flat_protections)
-    
-    flat_protections.loc[:,"Forestry Protected (Aggregated)"] = sum(flat_protections[['Forestry - Protected',
-                                                                   'Forestry - Full',
-                                                                   'Forestry - High']].sum())
+    print(flat_protections)
 
-    flat_protections.loc[:,"Forestry Managed (Aggregated)"] = sum(flat_protections[['Forestry - Medium',
-                                                                   'Forestry - Low']].sum())
+    range_out = csv_protect_output.replace('protect','')
+    flat_protections.to_csv(os.path.join(csv_dir, f"{range_out}protections_flat.csv"))
     
-    protection_coding = {5: 'Protected', 4: 'Full', 3: 'High', 2: 'Medium', 1: 'Low'}
+# Restriction field of each sector and the label its columns get
+RESTRICTION_SECTORS = {'max_forest_restrict': 'Forestry', 'max_mine_restriction': 'Mining', 'max_og_restriction': 'Oil & Gas'}
+RESTRICTION_CLASSES = {5: 'Protected', 4: 'Full', 3: 'High', 2: 'Medium', 1: 'Low'}
+# Aggregated column: the classes summed into it, per herd/habitat row
+RESTRICTION_AGGREGATES = {'Protected': ['Protected', 'Full', 'High'], 'Managed': ['Medium', 'Low']}
 
-    for coding, classes in zip(protection_coding.keys(), protection_coding.values()):
-            
-        classes_df = classes + '_df'
-        classes_df = flat.loc[flat['max_mine_restriction'] == coding]
-        classes_df = classes_df.groupby(table_group).sum('Shape_Area')
-        classes_df = classes_df.Shape_Area.div(10000).rename("Mining - {}".format(classes))
-
-        flat_protections = pd.merge(flat_protections, classes_df,  how="outer", left_on = table_group, right_on = table_group)
-
-        print(flat_protections)
-        
-    flat_protections.loc[:,"Mining Protected (Aggregated)"] = sum(flat_protections[['Mining - Protected',
-                                                                   'Mining - Full',
-                                                                   'Mining - High']].sum())
-
-    flat_protections.loc[:,"Mining Managed (Aggregated)"] = sum(flat_protections[['Mining - Medium',
-                                                                   'Mining - Low']].sum())
-
-    for coding, classes in zip(protection_coding.keys(), protection_coding.values()):
-            
-        classes_df = classes + '_df'
-        classes_df = flat.loc[flat['max_og_restriction'] == coding]
-        classes_df = classes_df.groupby(table_group).sum('Shape_Area')
-        classes_df = classes_df.Shape_Area.div(10000).rename("Oil & Gas - {}".format(classes))
-
-        flat_protections = pd.merge(flat_protections, classes_df,  how="outer", left_on = table_group, right_on = table_group)
+def protection_classes(csv_dir, csv_protect_output, table_group):
 
-        print(flat_protections)
+    flat = pd.read_csv(os.path.join(csv_dir,f"{csv_protect_output}.csv"), low_memory=False)
 
-    flat_protections.loc[:,"Oil & Gas Protected (Aggregated)"] = sum(flat_protections[['Oil & Gas - Protected',
-                                                                   'Oil & Gas - Full',
-                                                                   'Oil & Gas - High']].sum())
+    herd_base = pd.read_csv(os.path.join(csv_dir,'sheet_base.csv'))
+    herd_base = herd_base.drop(columns=['Shape_Length', 'Shape_Area'])
 
-    flat_protections.loc[:,"Oil & Gas Managed (Aggregated)"] = sum(flat_protections[['Oil & Gas - Medium',
-                                                                   'Oil & Gas - Low']].sum())
+    # One long table of (herd/habitat, sector, max restriction, ha) pivoted into every sector/class column at once
+    restrictions = flat[table_group + ['Shape_Area'] + list(RESTRICTION_SECTORS)].melt(
+        id_vars=table_group + ['Shape_Area'], var_name='sector', value_name='restriction')
+    restrictions = restrictions.loc[restrictions['restriction'].isin(list(RESTRICTION_CLASSES))]
+    restrictions['column'] = restrictions['sector'].map(RESTRICTION_SECTORS) + ' - ' + restrictions['restriction'].map(RESTRICTION_CLASSES)
+    classes = restrictions.groupby(table_group + ['column'])['Shape_Area'].sum().unstack('column').div(10000)
+
+    columns = []
+    for sector in RESTRICTION_SECTORS.values():
+        sector_columns = ["{} - {}".format(sector, name) for name in RESTRICTION_CLASSES.values()]
+        classes = classes.reindex(columns=classes.columns.union(sector_columns, sort=False))
+        columns += sector_columns
+        for aggregate, aggregated_classes in RESTRICTION_AGGREGATES.items():
+            column = "{} {} (Aggregated)".format(sector, aggregate)
+            classes[column] = classes[["{} - {}".format(sector, name) for name in aggregated_classes]].sum(axis=1)
+            columns.append(column)
+
+    flat_protections = pd.merge(herd_base, classes[columns].reset_index(), how="outer", left_on = table_group, right_on = table_group)
 
     range_out = csv_protect_output.replace('protect','')
     flat_protections.to_csv(os.path.join(csv_dir,f"{range_out}flat_groupings.csv"))
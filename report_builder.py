@@ -0,0 +1,177 @@
+'''
+    Excel report builder for the disturbance and protection results
+
+    Purpose:   Format the per herd tables written by table_create and protection_table into the workbooks delivered
+               for the analysis. All herd tables are read at once, relabelled from the declarative maps below and the
+               ha and % sheets are computed for every column in one operation.
+
+    Outputs:   Disturbance Analysis <year>.xlsx and Protection Analysis <year>.xlsx in the report folder
+'''
+import os
+import re
+import pandas as pd
+from herd_index import normalize_name
+
+# Attribute fields carried over from the habitat/herd boundary layers that are not reported
+DROP_ROWS = ['Unnamed: 0', 'OID_', 'HERD_NO', 'HERD_CODE', 'REGION', 'ECO_GROUP',
+             'COSEWIC_DU_CODE', 'COSEWIC_DU', 'HERD_PLAN', 'STATUS', 'DATE_LOADED',
+             'DATE_APPROVED', 'DATE_RETIRED', 'CENTROID_X', 'CENTROID_Y', 'Area_ha', 'Area_Ha',
+             'Species', 'Herd_id', 'Herd_code', 'Bc_ecotype_grouping', 'Bc_habitat_type', 'Bc_ecotype',
+             'Elevation', 'Season', 'Du_cosewic_2014', 'Designation_cosewic_2014', 'Version',
+             'Herd_ID', 'Herd_Code', 'BC_Ecotype_Grouping', 'BC_Habitat_Type', 'Habitat',
+             'DU_COSEWIC_2014', 'Designation_COSEWIC_2014', 'VERSION']
+
+# Applied in order to every capitalized field name
+LABEL_REPLACEMENTS = [('Cumuatlive', 'Cumulative'), ('buffer', '500m buffer'),
+                      ('past 40', 'past 40 years'), ('past 80', 'past 80 years')]
+
+# Case by case labels, keyed by the label after the replacements above
+ROW_LABELS = {"Bchab_code": "Habitat", "Herd_name": "Herd Name", "Air (ha)": "Airstrip (ha)",
+              "Pipe (ha)": "Pipeline (ha)", "Static (ha)": "Static Total (ha)",
+              "Air 500m buffer (ha)": "Airstrip 500m buffer (ha)",
+              "Pipe 500m buffer (ha)": "Pipeline 500m buffer (ha)",
+              "Ag 500m buffer (ha)": "Agriculture 500m buffer (ha)",
+              "Static (500m buffer) (ha)": "Static Total 500m buffer (ha)"}
+
+# Protection tables keep the field names as written, only the herd/habitat fields are renamed
+PROTECTION_LABELS = {"BCHab_code": "Habitat", "HERD_NAME": "Herd Name", "Herd_Name": "Herd Name"}
+
+# Rows that identify a column rather than hold an area
+ID_ROWS = ["Herd Name", "Habitat", "Area (ha)"]
+
+# Range names that were shortened for feature class naming
+RANGE_NAMES = {"Klinseza": "Klinse-za"}
+
+# Sheet group for records with no ecotype in either source
+UNASSIGNED_ECOTYPE = "Unassigned"
+
+
+def read_tables(csv_dir, file_names):
+    """Read every herd table in one go, skipping herds that have no table"""
+    paths = [os.path.join(csv_dir, name) for name in file_names]
+    missing = [path for path in paths if not os.path.exists(path)]
+    for path in missing:
+        print(f"Warning: {path} not found, skipping")
+    frames = [pd.read_csv(path) for path in paths if path not in missing]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def relabel(columns):
+    """Capitalize, apply the replacements and then the case by case labels to every field name at once"""
+    labels = pd.Index(columns).str.capitalize()
+    for old, new in LABEL_REPLACEMENTS:
+        labels = labels.str.replace(old, new, regex=False)
+    return labels.map(lambda label: ROW_LABELS.get(label, label))
+
+
+def add_area(table, area_df, herd_field="Herd_Name", habitat_field="BCHab_code"):
+    """Insert the herd (and habitat) area after the herd name, matching on the feature class friendly herd name"""
+    keys = ["Herd", "Habitat"] if habitat_field in table.columns else ["Herd"]
+    areas = area_df.groupby(keys, as_index=False)["Hectare"].sum()
+
+    lookup = pd.DataFrame({"Herd": table[herd_field].astype(str).map(normalize_name)})
+    if "Habitat" in keys:
+        lookup["Habitat"] = table[habitat_field].values
+    hectares = lookup.merge(areas, how="left", on=keys)["Hectare"].values
+
+    missing = table.loc[pd.isna(hectares), herd_field].unique()
+    for herd in missing:
+        print(f"Warning: No area found for herd {herd}")
+
+    table = table.copy()
+    table.insert(table.columns.get_loc(herd_field) + 1, 'Area (ha)', hectares)
+    return table
+
+
+def percentages(table):
+    """Area of every numeric column as a percentage of the record's area, formatted as text"""
+    percent = table.copy()
+    values = table.drop(columns=[row for row in ID_ROWS if row in table.columns]).select_dtypes("number")
+    ratio = values.div(table["Area (ha)"], axis=0).mul(100).astype(float).round(2)
+    percent[values.columns] = ratio.where(ratio.isna(), ratio.astype(str) + '%')
+    return percent
+
+
+def drop_fields(table, labels):
+    """Drop the unreported fields, matching either the original or the relabelled name"""
+    labels = pd.Index(labels)
+    columns = pd.Index(table.columns).astype(str)
+    keep = ~(columns.isin(DROP_ROWS) | columns.str.startswith('Unnamed:') | (labels.isin(DROP_ROWS) & ~labels.isin(ID_ROWS)))
+    table = table.loc[:, keep]
+    table.columns = labels[keep]
+    return table
+
+
+def ecotypes(table, area_df, herd_field="Herd_Name"):
+    """Ecotype of every record, looked up by the feature class friendly herd name in the herd index"""
+    herd_ecotypes = area_df.dropna(subset=["Ecotype"]).drop_duplicates("Herd").set_index("Herd")["Ecotype"]
+    herds = table[herd_field].astype(str).map(normalize_name)
+    ecotype = pd.Series(herds.map(herd_ecotypes).values, index=table.index, dtype="object")
+
+    for herd in table.loc[ecotype.isna().values, herd_field].unique():
+        print(f"Warning: no ecotype found for {herd}")
+    return ecotype.fillna(UNASSIGNED_ECOTYPE)
+
+
+def ecotype_sheets(hectares, percent, ecotype):
+    """Yield the (sheet name, table) pairs for all ranges and then every ecotype from one grouping of the records"""
+    yield "All Ranges (ha)", hectares
+    yield "All Ranges (%)", percent
+    for group, rows in ecotype.groupby(ecotype.values, sort=True).indices.items():
+        yield f"{group} (ha)", hectares.iloc[rows]
+        yield f"{group} (%)", percent.iloc[rows]
+
+
+def write_workbook(path, sheets):
+    """Write the sheets row by row with xlsxwriter's constant memory mode, records run across the columns"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "nan_inf_to_errors": True})
+    for sheet_name, table in sheets:
+        # Ecotype values become sheet names so strip the characters Excel doesn't allow
+        worksheet = workbook.add_worksheet(re.sub(r"[\[\]:*?/\\]", "-", sheet_name)[:31])
+        for row_number, label in enumerate(table.columns):
+            worksheet.write(row_number, 0, label)
+            values = table.iloc[:, row_number].tolist()
+            worksheet.write_row(row_number, 1, [None if pd.isna(value) else value for value in values])
+    workbook.close()
+    print(f"Report written to {path}")
+
+
+def build_disturbance_report(csv_dir, final_output_list, area_df, output_path):
+    """Disturbance workbook from the <range>_final.csv tables written by static_grouping"""
+    table = read_tables(csv_dir, [f"{final_output}.csv" for final_output in final_output_list])
+    if table.empty:
+        print("No disturbance tables found, skipping the disturbance report")
+        return
+
+    ecotype = ecotypes(table, area_df)
+    table = add_area(table, area_df)
+    table = drop_fields(table, relabel(table.columns))
+    table["Herd Name"] = table["Herd Name"].replace(RANGE_NAMES)
+
+    write_workbook(output_path, ecotype_sheets(table, percentages(table), ecotype))
+
+
+def build_protection_report(csv_dir, csv_protect_output_list, area_df, output_path):
+    """Protection workbook from the designation (protections_flat) and restriction level (flat_groupings) tables"""
+    range_names = [protect_output.replace('_protect', '') for protect_output in csv_protect_output_list]
+    designations = read_tables(csv_dir, [f"{range_name}_protections_flat.csv" for range_name in range_names])
+    groupings = read_tables(csv_dir, [f"{range_name}_flat_groupings.csv" for range_name in range_names])
+    if designations.empty:
+        print("No protection tables found, skipping the protection report")
+        return
+
+    # Both tables are built on the same herd base so the records line up; the groupings repeat the herd fields
+    groupings = groupings.drop(columns=[column for column in groupings.columns if column in designations.columns])
+    table = pd.concat([designations, groupings], axis=1)
+
+    herd_field = "Herd_Name" if "Herd_Name" in table.columns else "HERD_NAME"
+    ecotype = ecotypes(table, area_df, herd_field)
+    table = add_area(table, area_df, herd_field=herd_field)
+    table = drop_fields(table, [PROTECTION_LABELS.get(column, column) for column in table.columns])
+    table["Herd Name"] = table["Herd Name"].replace(RANGE_NAMES)
+
+    write_workbook(output_path, ecotype_sheets(table, percentages(table), ecotype))
@@ -0,0 +1,162 @@
+'''
+    Cost-aware herd scheduler
+
+    Purpose:   Run a per herd stage largest herd first (longest processing time first) instead of in alphabetical
+               order, so the few very large herds start at the beginning of a run and don't finish last as
+               stragglers. With HERD_WORKERS above 1 the herds are dispatched to a pool of worker processes and each
+               worker takes the next largest herd when it frees up.
+
+               The cost of a herd is estimated from its AOI area (herd index) and the features and vertices of its
+               disturbance layer, weighted by a least squares fit of the seconds recorded in the timing report of
+               the previous runs. A herd that was timed before uses its last recorded seconds for the stage.
+
+    Settings:  HERD_WORKERS=1 (default, the herds run one after another in this process)
+
+    Outputs:   herd_timing.csv in the report folder, one row per herd/stage of every run
+'''
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+TIMING_COLUMNS = ["run", "layer", "herd", "stage", "seconds", "hectares", "features", "vertices"]
+COST_FIELDS = ["hectares", "features", "vertices"]
+
+# Seconds per hectare/feature/vertex used until the timing report has enough records for a fit
+DEFAULT_WEIGHTS = np.array([0.001, 0.01, 0.0001])
+
+RUN = datetime.now().isoformat(timespec="seconds")
+
+# Set in the worker processes of run_herds
+_worker = False
+
+
+def herd_workers():
+    return max(1, int(os.getenv("HERD_WORKERS") or 1))
+
+
+def layer_size(fc):
+    """(features, vertices) of a feature class, (0, 0) when it doesn't exist"""
+    import arcpy
+
+    if not arcpy.Exists(fc):
+        return 0, 0
+    features = vertices = 0
+    with arcpy.da.SearchCursor(fc, ["SHAPE@"]) as cursor:
+        for row in cursor:
+            features += 1
+            vertices += row[0].pointCount if row[0] is not None else 0
+    return features, vertices
+
+
+def load_timing(report_path):
+    if not os.path.exists(report_path):
+        return pd.DataFrame(columns=TIMING_COLUMNS)
+    return pd.read_csv(report_path)
+
+
+def record_timing(report_path, layer, herd, stage, seconds, hectares, features, vertices):
+    """Append one herd/stage timing to the report, written as it happens so an interrupted run still adds to it"""
+    row = pd.DataFrame([[RUN, layer, herd, stage, round(seconds, 2), hectares, features, vertices]],
+                       columns=TIMING_COLUMNS)
+    row.to_csv(report_path, mode="a", index=False, header=not os.path.exists(report_path))
+
+
+def herd_inputs(herd_index, layer_name, sizes=None):
+    """
+    Hectares, features and vertices per herd of the layer
+
+    sizes: herd name -> (features, vertices) measured in this run, herds without a measurement get 0
+    """
+    herds = herd_index.loc[herd_index["layer"] == layer_name].groupby("Herd_Name")["hectares"].sum()
+    inputs = pd.DataFrame({"hectares": herds})
+    sizes = sizes or {}
+    inputs["features"] = [sizes.get(herd, (0, 0))[0] for herd in inputs.index]
+    inputs["vertices"] = [sizes.get(herd, (0, 0))[1] for herd in inputs.index]
+    return inputs
+
+
+def fit_weights(timing, stage):
+    """Seconds per hectare/feature/vertex for a stage, least squares over the recorded timings (negatives dropped)"""
+    records = timing.loc[timing["stage"] == stage].dropna(subset=COST_FIELDS + ["seconds"])
+    if len(records) < 2 * len(COST_FIELDS):
+        return DEFAULT_WEIGHTS
+    weights = np.linalg.lstsq(records[COST_FIELDS].to_numpy(float), records["seconds"].to_numpy(float), rcond=None)[0]
+    weights = np.clip(weights, 0, None)
+    return weights if weights.any() else DEFAULT_WEIGHTS
+
+
+def estimate_costs(inputs, timing, layer, stage):
+    """Estimated seconds of the stage for every herd, largest first"""
+    costs = pd.Series(inputs[COST_FIELDS].to_numpy(float) @ fit_weights(timing, stage), index=inputs.index)
+
+    previous = timing.loc[(timing["layer"] == layer) & (timing["stage"] == stage)].sort_values("run")
+    previous = previous.groupby("herd")["seconds"].last()
+    costs.update(previous.reindex(costs.index).dropna())
+    return costs.sort_values(ascending=False, kind="stable")
+
+
+def _timed(task, herd, args):
+    start = time.perf_counter()
+    task(herd, *args)
+    return time.perf_counter() - start
+
+
+def _init_worker(workers):
+    global _worker
+    import arcpy
+    _worker = True
+    # The workers share the cores the single process would have used
+    arcpy.env.parallelProcessingFactor = f"{max(1, 50 // workers)}%"
+
+
+def in_worker():
+    """True in a worker process of run_herds, which must not write to the output gdb the other workers share"""
+    return _worker
+
+
+def run_herds(costs, task, args=(), workers=1, progress=None, label="Herd order (estimated seconds)"):
+    """
+    Run task(herd, *args) for every herd in costs (largest first), yields (herd, seconds) as each herd finishes
+
+    task has to be a module level function so the worker processes can import it
+    progress: optional StageProgress (see progress.py) told when each herd starts and finishes
+    label: what the printed order and costs are
+    """
+    order = list(costs.index)
+    print('{}: {}'.format(label, ", ".join(f"{herd} ({costs[herd]:.0f})" for herd in order)))
+
+    if workers <= 1 or len(order) <= 1:
+        for herd in order:
+            if progress:
+                progress.start(herd)
+            seconds = _timed(task, herd, args)
+            if progress:
+                progress.finish(herd, seconds)
+            yield herd, seconds
+        return
+
+    workers = min(workers, len(order))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,)) as pool:
+        # Submitted in cost order, the pool hands the next largest herd to whichever worker is free
+        futures = {pool.submit(_timed, task, herd, args): herd for herd in order}
+        # so the first herds start together and each finished herd starts the next one in the order
+        waiting = iter(order)
+        if progress:
+            for _ in range(workers):
+                progress.start(next(waiting))
+        try:
+            for future in as_completed(futures):
+                herd, seconds = futures[future], future.result()
+                if progress:
+                    progress.finish(herd, seconds)
+                    following = next(waiting, None)
+                    if following is not None:
+                        progress.start(following)
+                yield herd, seconds
+        except BaseException:
+            # A failed herd stops the stage, the herds still queued are cancelled instead of run before it is raised
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
@@ -0,0 +1,66 @@
+'''
+    Intermediate workspace for the per herd stages
+
+    Purpose:   Settings for where the per herd stages write their intermediates (see artifacts.py). In memory mode the
+               stages run in the memory workspace until the process is past the memory budget, after that (and in
+               gdb mode) each herd/stage gets its own scratch gdb in the local scratch folder.
+
+    Settings:  INTERMEDIATE_WORKSPACE=gdb (default) or memory
+               MEMORY_BUDGET_MB=4096 (only checked when psutil is installed)
+               SCRATCH_FOLDER (defaults to the arcpy scratch folder)
+'''
+import arcpy
+import os
+
+# Memory datasets that outlive a single stage (the herd AOIs), a stage's clean up never removes these
+_held = set()
+
+
+def intermediate_mode():
+    mode = (os.getenv("INTERMEDIATE_WORKSPACE") or "gdb").strip().lower()
+    if mode not in ("gdb", "memory"):
+        raise ValueError(f"Unknown INTERMEDIATE_WORKSPACE '{mode}', expected gdb or memory")
+    return mode
+
+
+def memory_budget():
+    return float(os.getenv("MEMORY_BUDGET_MB") or 4096)
+
+
+def memory_in_use():
+    """Resident memory of this process in MB, None when psutil isn't installed"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+def hold(name):
+    _held.add(os.path.basename(name))
+
+
+def is_held(name):
+    return os.path.basename(name) in _held
+
+
+def intermediate(name):
+    """Path for a single intermediate written outside of a stage workspace"""
+    return os.path.join("memory", name) if intermediate_mode() == "memory" else name
+
+
+def list_datasets(workspace):
+    with arcpy.EnvManager(workspace=workspace):
+        return (arcpy.ListFeatureClasses() or []) + (arcpy.ListTables() or [])
+
+
+def over_budget():
+    used = memory_in_use()
+    if used is not None and used > memory_budget():
+        print(f"{used:.0f} MB in use is over the {memory_budget():.0f} MB budget, writing intermediates to disk")
+        return True
+    return False
+
+
+def scratch_folder():
+    return os.getenv("SCRATCH_FOLDER") or arcpy.env.scratchFolder
@@ -0,0 +1,172 @@
+'''
+    Synthetic province for benchmarking
+
+    Purpose:   Generate caribou herds and the disturbance and designated lands layers around them with the field names
+               and year/severity/restriction values of the real BCGW/BCCE sources, so every stage can be timed without
+               production data or a BCGW login. Feature density is set as a multiple of the provincial density
+               (scale 1, 5, 20) and the herds are laid out on a grid so the extraction selection also has features
+               outside of every AOI to skip.
+
+    Dependencies:  numpy, pandas and shapely (2.0 or later)
+'''
+import numpy as np
+import pandas as pd
+
+# Features per km² at scale 1, roughly the provincial averages inside caribou ranges
+BASE_DENSITY = {
+    "cutblock": 0.6,
+    "fire": 0.01,
+    "pest": 0.05,
+    "roads": 0.3,
+    "rail": 0.002,
+    "seismic": 0.05,
+    "bcce": 0.03,
+    "designated_lands": 0.02,
+}
+
+HABITAT_CODES = ["HEWSR", "LEWR", "Matrix"]
+ECOTYPES = ["Northern Mountain", "Central Mountain", "Southern Mountain", "Boreal"]
+BCCE_GROUPS = ["Urban", "Agriculture_and_Clearing", "Mining_and_Extraction"]
+PEST_SPECIES = ["IBM", "IBS", "IDW"]
+PEST_SEVERITY = ["T", "L", "M", "S", "V"]
+DESIGNATIONS = ["park_provincial", "park_er", "ogma", "uwr_no_harvest", "wha_no_harvest", "community_watershed",
+                "vqo_retain", "vqo_partretain", "fsw", "mineral_reserve"]
+
+# Radius (m) of a herd's outer habitat ring and the spacing between herd centres
+HERD_RADIUS = 10000
+HERD_SPACING = 30000
+
+# Width (m) of a seismic cutline
+SEISMIC_WIDTH = 8
+
+
+def _shapely():
+    import shapely
+    return shapely
+
+
+def _blob(shapely, rng, x, y, radius, vertices=16):
+    """Irregular polygon around (x, y)"""
+    angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    radii = radius * rng.uniform(0.6, 1.0, vertices)
+    return shapely.polygons(np.column_stack([x + radii * np.cos(angles), y + radii * np.sin(angles)]))
+
+
+def _rectangle(shapely, rng, x, y, width, height):
+    angle = rng.uniform(0, np.pi)
+    corners = np.array([[-width, -height], [width, -height], [width, height], [-width, height]]) / 2
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    return shapely.polygons(corners @ rotation.T + [x, y])
+
+
+def _walk(shapely, rng, x, y, steps, step_length):
+    """Random walk polyline for roads and rail"""
+    heading = rng.uniform(0, 2 * np.pi)
+    points = [(x, y)]
+    for _ in range(steps):
+        heading += rng.normal(0, 0.4)
+        x, y = x + step_length * np.cos(heading), y + step_length * np.sin(heading)
+        points.append((x, y))
+    return shapely.linestrings(points)
+
+
+def herd_names(count):
+    return [f"Synthetic Herd {number:02d}" for number in range(1, count + 1)]
+
+
+def generate_herds(shapely, rng, count):
+    """Habitat polygons (one ring per habitat code) and the herd boundaries"""
+    columns = int(np.ceil(np.sqrt(count)))
+    habitat, boundaries = [], []
+    for number, name in enumerate(herd_names(count)):
+        x = 1000000 + (number % columns) * HERD_SPACING
+        y = 1000000 + (number // columns) * HERD_SPACING
+        ecotype = ECOTYPES[number % len(ECOTYPES)]
+        outer = _blob(shapely, rng, x, y, HERD_RADIUS, 32)
+        inner = None
+        for ring, code in enumerate(HABITAT_CODES):
+            radius = HERD_RADIUS * (ring + 1) / len(HABITAT_CODES)
+            shape = shapely.intersection(_blob(shapely, rng, x, y, radius, 32), outer)
+            ring_shape = shape if inner is None else shapely.difference(shape, inner)
+            inner = shape if inner is None else shapely.union(inner, shape)
+            habitat.append({"Herd_Name": name, "BCHab_code": code, "BC_Ecotype_Grouping": ecotype,
+                            "geometry": ring_shape})
+        boundaries.append({"Herd_Name": name, "BCHab_code": "Boundary", "BC_Ecotype_Grouping": ecotype,
+                           "geometry": inner})
+    return pd.DataFrame(habitat), pd.DataFrame(boundaries)
+
+
+def _count(layer, area_km2, scale, rng):
+    return rng.poisson(BASE_DENSITY[layer] * area_km2 * scale)
+
+
+def generate_layers(shapely, rng, boundaries, scale):
+    """Disturbance and designated lands features around every herd, 20% beyond the herd radius"""
+    extent = HERD_RADIUS * 1.2
+    area_km2 = (2 * extent) ** 2 / 1e6
+    rows = {name: [] for name in ["cutblock", "fire", "pest", "roads", "rail", "bcce", "designated_lands"]}
+
+    for centre in shapely.centroid(boundaries["geometry"].values):
+        cx, cy = shapely.get_x(centre), shapely.get_y(centre)
+
+        def points(layer):
+            n = _count(layer, area_km2, scale, rng)
+            return zip(rng.uniform(cx - extent, cx + extent, n), rng.uniform(cy - extent, cy + extent, n))
+
+        for x, y in points("cutblock"):
+            side = rng.uniform(200, 800, 2)
+            rows["cutblock"].append({"HARVEST_START_YEAR_CALENDAR": int(rng.integers(1950, 2025)),
+                                     "geometry": _rectangle(shapely, rng, x, y, *side)})
+        for x, y in points("fire"):
+            rows["fire"].append({"FIRE_YEAR": int(rng.integers(1920, 2025)),
+                                 "geometry": _blob(shapely, rng, x, y, rng.uniform(500, 3000), 24)})
+        for x, y in points("pest"):
+            rows["pest"].append({"CAPTURE_YEAR": int(rng.integers(1999, 2025)),
+                                 "PEST_SPECIES_CODE": rng.choice(PEST_SPECIES),
+                                 "PEST_SEVERITY_CODE": rng.choice(PEST_SEVERITY),
+                                 "geometry": _blob(shapely, rng, x, y, rng.uniform(200, 1500))})
+        for x, y in points("roads"):
+            rows["roads"].append({"geometry": _walk(shapely, rng, x, y, int(rng.integers(5, 15)),
+                                                    rng.uniform(300, 1500))})
+        for x, y in points("rail"):
+            rows["rail"].append({"geometry": _walk(shapely, rng, x, y, 20, 1500)})
+        for x, y in points("seismic"):
+            heading = rng.uniform(0, np.pi)
+            length = rng.uniform(2000, 8000)
+            line = shapely.linestrings([(x, y), (x + length * np.cos(heading), y + length * np.sin(heading))])
+            # The BCCE delivers seismic lines as narrow cutline polygons in its OGC_Geophysical group
+            rows["bcce"].append({"CEF_DISTURB_GROUP": "OGC_Geophysical",
+                                 "geometry": shapely.buffer(line, SEISMIC_WIDTH / 2, cap_style="flat")})
+        for x, y in points("bcce"):
+            rows["bcce"].append({"CEF_DISTURB_GROUP": rng.choice(BCCE_GROUPS),
+                                 "geometry": _blob(shapely, rng, x, y, rng.uniform(100, 800))})
+        for x, y in points("designated_lands"):
+            rows["designated_lands"].append({"designation": rng.choice(DESIGNATIONS), "source_name": "synthetic",
+                                             "forest_restriction": int(rng.integers(0, 6)),
+                                             "mine_restriction": int(rng.integers(0, 6)),
+                                             "og_restriction": int(rng.integers(0, 6)),
+                                             "geometry": _blob(shapely, rng, x, y, rng.uniform(1000, 6000), 24)})
+
+    layers = {name: pd.DataFrame(layer_rows) if layer_rows else pd.DataFrame({"geometry": []})
+              for name, layer_rows in rows.items()}
+
+    # The BCGW keeps historical and current fires in separate layers
+    fire = layers.pop("fire")
+    current = fire.get("FIRE_YEAR", pd.Series(dtype=float)).ge(2024).reindex(fire.index, fill_value=False)
+    layers["fire_historical"] = fire[~current].reset_index(drop=True)
+    layers["fire_current"] = fire[current].reset_index(drop=True)
+    return layers
+
+
+def generate_province(herds=12, scale=1, seed=0):
+    """
+    Herd habitat, herd boundaries and the source layers at `scale` times the provincial density
+
+    Returns a dict of layer name -> DataFrame with a shapely 'geometry' column
+    """
+    shapely = _shapely()
+    rng = np.random.default_rng(seed)
+    habitat, boundaries = generate_herds(shapely, rng, herds)
+    province = {"habitat": habitat, "boundaries": boundaries}
+    province.update(generate_layers(shapely, rng, boundaries, scale))
+    return province
@@ -16,7 +16,6 @@
      
     Outputs: Features classes and shapefiles of individual disturbance and cumulative disturbance
 '''
-import arcpy
 import os
 import re
 import json
@@ -24,6 +23,7 @@ import logging
 import smtplib
 import socket
 import pandas as pd
+from herd_index import herd_values
 # import pandasql
 ## python -m pip install "pandasql"
 
@@ -50,7 +50,7 @@ def combine_loose_sheets(csv_dir,csv_output_name):
     for flat_files_df in flat_files:
         flatfiles_name = flat_files_df.strip('.csv')
 
-        flatfiles_name = pd.read_csv(os.path.join(csv_dir,flat_files_df))
+        flatfiles_name = pd.read_csv(os.path.join(csv_dir,flat_files_df), low_memory=False)
 
         df_flat_files.append(flatfiles_name)
 
@@ -64,19 +64,20 @@ def combine_loose_sheets(csv_dir,csv_output_name):
     # Export the concat files together to a single flat 
     disturb_flat.to_csv(os.path.join(csv_dir ,f"{csv_output_name}.csv"))
 
-def make_sheet_base(intersect_layer, unique_value, aoi_location, csv_dir):
+def make_sheet_base(intersect_layer, unique_value, aoi_location, csv_dir, herd_index):
+    # arcpy is only needed here, the grouping functions run on the csv files alone
+    import arcpy
     
     layer = os.path.join(aoi_location, intersect_layer)
 
-    with arcpy.da.SearchCursor(layer, [unique_value]) as cursor:
-        ecotypes = sorted({row[0] for row in cursor})
+    ecotypes = herd_values(herd_index, intersect_layer)
     print('Values that are being selected: {}'.format(ecotypes))
 
     arcpy.TableToTable_conversion(layer, csv_dir, 'sheet_base.csv')
 
 def static_grouping(csv_dir, csv_output_name, table_group, final_output):
     
-    flat_table = pd.read_csv(os.path.join(csv_dir,f"{csv_output_name}.csv"))
+    flat_table = pd.read_csv(os.path.join(csv_dir,f"{csv_output_name}.csv"), low_memory=False)
     data_top = flat_table .head()
     print(data_top)
     print(flat_table.columns)
@@ -87,7 +88,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
     ### Set up the first one to join to the herd table
 
     ag_df = flat_table.loc[flat_table.disturbances.str.contains("ag", na=False)]
-    ag_df = ag_df.groupby(table_group).sum('Shape_Area')
+    ag_df = ag_df.groupby(table_group).sum(numeric_only=True)
     ag_df = ag_df.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
     ag_df = ag_df.Shape_Area.div(10000).rename("Agriculture (Ha)")
 
@@ -100,7 +101,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
     for disturbance in disturbance_list:
         disturbance_df = disturbance + '_df'
         disturbance_df = flat_table.loc[flat_table.disturbances.str.contains("{}".format(disturbance), na=False)]
-        disturbance_df = disturbance_df.groupby(table_group).sum('Shape_Area')
+        disturbance_df = disturbance_df.groupby(table_group).sum(numeric_only=True)
         disturbance_df = disturbance_df.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
         disturbance_df = disturbance_df.Shape_Area.div(10000).rename("{} (Ha)".format(disturbance))
         
@@ -109,7 +110,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
     print(static_table)
     # #### Static Disturbance
     static_df = flat_table.loc[flat_table.types.str.contains("Static", na=False)]
-    static_df = static_df.groupby(table_group).sum('Shape_Area')
+    static_df = static_df.groupby(table_group).sum(numeric_only=True)
     static_df = static_df.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
     static_df = static_df.Shape_Area.div(10000).rename("Static (Ha)")
 
@@ -122,7 +123,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
     for disturbance_buffer in disturbance_list:
         disturbance_buffer_df = disturbance_buffer + '_df'
         disturbance_buffer_df = flat_table.loc[flat_table.disturbances_buffer.str.contains("{}".format(disturbance_buffer), na=False)]
-        disturbance_buffer_df = disturbance_buffer_df.groupby(table_group).sum('Shape_Area')
+        disturbance_buffer_df = disturbance_buffer_df.groupby(table_group).sum(numeric_only=True)
         disturbance_buffer_df = disturbance_buffer_df.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
         disturbance_buffer_df = disturbance_buffer_df.Shape_Area.div(10000).rename("{} Buffer (Ha)".format(disturbance_buffer))
         
@@ -131,7 +132,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
 
     # Cumulative static (buffer) area
     static_buffer_df = flat_table.loc[flat_table.types_buffer.str.contains("Static", na=False)]
-    static_buffer_df = static_buffer_df .groupby(table_group).sum('Shape_Area')
+    static_buffer_df = static_buffer_df .groupby(table_group).sum(numeric_only=True)
     static_buffer_df = static_buffer_df.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
     static_buffer_df = static_buffer_df.Shape_Area.div(10000).rename("Static (Buffer) (Ha)")
 
@@ -163,7 +164,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
 
     # # cutblock_81_01_df, cutblock_81_11_df, cutblock_81_21_df]
     for cutblock_df_name, cutblock_df_layer in zip(cutblock_selections.keys(), cutblock_selections.values()):
-        cutblock_df_layer = cutblock_df_layer.groupby(table_group).sum('Shape_Area')
+        cutblock_df_layer = cutblock_df_layer.groupby(table_group).sum(numeric_only=True)
         cutblock_df_layer = cutblock_df_layer.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
         cutblock_df_layer = cutblock_df_layer.Shape_Area.div(10000).rename("{} (Ha)".format(cutblock_df_name))
  
@@ -192,7 +193,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
                                 "cut 1981-2001 (buffer)" : cutblock_buffer_81_01_df, "cut 1981-2011 (buffer)" : cutblock_buffer_81_11_df, "cut 1981-2021 (buffer)" : cutblock_buffer_81_21_df}
 
     for cutblock_buffer_df_name, cutblock_buffer_df_layer in zip(cutblock_buffer_selections.keys(), cutblock_buffer_selections.values()):
-        cutblock_buffer_df_layer = cutblock_buffer_df_layer.groupby(table_group).sum('Shape_Area')
+        cutblock_buffer_df_layer = cutblock_buffer_df_layer.groupby(table_group).sum(numeric_only=True)
         cutblock_buffer_df_layer = cutblock_buffer_df_layer.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
         cutblock_buffer_df_layer = cutblock_buffer_df_layer.Shape_Area.div(10000).rename("{} (Ha)".format(cutblock_buffer_df_name))
 
@@ -220,7 +221,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
                             "pest 1981-2011" : pest_81_11_df, "pest 1981-2021" : pest_81_21_df}
     
     for pest_df_name, pest_df_layer in zip(pest_selections.keys(), pest_selections.values()):
-        pest_df_layer = pest_df_layer.groupby(table_group).sum('Shape_Area')
+        pest_df_layer = pest_df_layer.groupby(table_group).sum(numeric_only=True)
         pest_df_layer = pest_df_layer.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
         pest_df_layer = pest_df_layer.Shape_Area.div(10000).rename("{} (Ha)".format(pest_df_name))
 
@@ -248,7 +249,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
                             "fire 1981-2011" : fire_81_11_df, "fire 1981-2021" : fire_81_21_df}
     
     for fire_df_name, fire_df_layer in zip(fire_selections.keys(), fire_selections.values()):
-        fire_df_layer = fire_df_layer.groupby(table_group).sum('Shape_Area')
+        fire_df_layer = fire_df_layer.groupby(table_group).sum(numeric_only=True)
         fire_df_layer = fire_df_layer.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID', 'latest_cut', 'latest_pest', 'latest_fire'])
         fire_df_layer = fire_df_layer.Shape_Area.div(10000).rename("{} (Ha)".format(fire_df_name))
 
@@ -408,7 +409,7 @@ def static_grouping(csv_dir, csv_output_name, table_group, final_output):
                             "cumulative pest buffer 1981-2001":cumulative_buffer_p_81_01, "cumulative pest buffer 1981-2011":cumulative_buffer_p_81_11}
 
     for cumulative_selections_name, cumulative_selections_layer in zip(cumulative_selections.keys(), cumulative_selections.values()):
-        cumulative_selections_layer  = cumulative_selections_layer.groupby(table_group).sum('Shape_Area')
+        cumulative_selections_layer  = cumulative_selections_layer.groupby(table_group).sum(numeric_only=True)
         # Might not have latest pest depending on severity cutoff level
         cumulative_selections_layer  = cumulative_selections_layer.drop(columns=['Unnamed: 0', 'OID_', 'Shape_Length', 'Number_Disturbance', 'ORIG_FID'])
         if 'latest_pest' in cumulative_selections_layer.columns:
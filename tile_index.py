@@ -0,0 +1,170 @@
+'''
+    Tiled spatial index of the designated lands
+
+    Purpose:   Partition the provincial designated lands layer into tiles of a grid, stored in Hilbert curve order
+               with the envelope of every tile, so the protection clip of a herd reads the few tiles whose envelope
+               overlaps the herd instead of scanning the whole provincial layer for every herd. The tiles are only
+               rebuilt when the designated lands or the tile size change (see RunJournal.current).
+
+               A feature belongs to the tile its envelope centre falls in and a tile's envelope is the union of its
+               features' envelopes, so every feature that can intersect a herd is in one of the tiles read for it and
+               no feature is read twice. A tile's id is the Hilbert key of its grid cell, sorting the features on it
+               keeps neighbouring tiles next to each other on disk.
+
+    Settings:  DESIGNATED_TILE_KM=50 (side of a grid cell)
+
+    Outputs:   designated_tiles.gdb in the root directory with designated_lands_tiled (the features with their
+               tile_id, indexed) and designated_lands_tile_index (tile_id, grid cell, envelope and feature count of
+               every tile, with the grid origin and cell size)
+'''
+import arcpy
+import os
+from partition import schema_template
+
+TILED_FC = "designated_lands_tiled"
+INDEX_TABLE = "designated_lands_tile_index"
+INDEX_FIELDS = ["tile_id", "xmin", "ymin", "xmax", "ymax", "features", "grid_column", "grid_row", "origin_x", "origin_y",
+                "cell_size", "vertices"]
+
+# One index per tile gdb, loaded the first time a herd in the process asks for it
+_indexes = {}
+
+
+def tile_size():
+    return float(os.getenv("DESIGNATED_TILE_KM") or 50) * 1000
+
+
+def hilbert_key(column, row, order=16):
+    """Position of a grid cell on a Hilbert curve over a 2**order grid"""
+    key = 0
+    s = 1 << (order - 1)
+    while s:
+        rx = 1 if column & s else 0
+        ry = 1 if row & s else 0
+        key += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                column, row = s - 1 - column, s - 1 - row
+            column, row = row, column
+        s >>= 1
+    return key
+
+
+def tile_artifacts(gdb):
+    """Datasets build_tile_index writes, recorded in the run journal"""
+    return [os.path.join(gdb, TILED_FC), os.path.join(gdb, INDEX_TABLE)]
+
+
+def build_tile_index(source, gdb, size=None):
+    """Write the source features in tile order to the tile gdb along with the envelope of every tile"""
+    size = size or tile_size()
+    if not arcpy.Exists(gdb):
+        arcpy.management.CreateFileGDB(os.path.dirname(gdb), os.path.basename(gdb))
+    tiled_fc, index_table = tile_artifacts(gdb)
+    unsorted_fc = os.path.join(gdb, f"{TILED_FC}_unsorted")
+
+    # The tile_id is the Hilbert key of the feature's grid cell, so sorting on it gives the tile order
+    desc = arcpy.Describe(source)
+    origin = desc.extent.XMin, desc.extent.YMin
+    cells_across = max(desc.extent.XMax - origin[0], desc.extent.YMax - origin[1]) // size + 1
+    order = max(1, int(cells_across - 1).bit_length())
+    out_fields = [field.name for field in arcpy.ListFields(source)
+                  if field.editable and field.type not in ("Geometry", "OID", "GlobalID")
+                  and not field.name.upper().startswith(("SHAPE", "GEOMETRY"))]
+
+    # Single read of the source streamed to the unsorted copy, only the envelope and count of every tile are kept
+    tiles = {}
+    schema_template(source, gdb, os.path.basename(unsorted_fc), add_fields=[("tile_id", "LONG", "Tile")])
+    with arcpy.da.SearchCursor(source, ["SHAPE@"] + out_fields) as search, \
+            arcpy.da.InsertCursor(unsorted_fc, ["SHAPE@"] + out_fields + ["tile_id"]) as insert:
+        for row in search:
+            if row[0] is None:
+                continue
+            extent = row[0].extent
+            cell = (int(((extent.XMin + extent.XMax) / 2 - origin[0]) // size),
+                    int(((extent.YMin + extent.YMax) / 2 - origin[1]) // size))
+            tile_id = hilbert_key(*cell, order)
+            insert.insertRow(list(row) + [tile_id])
+            _, features, vertices, envelope = tiles.get(tile_id, (cell, 0, 0, None))
+            envelope = (extent.XMin, extent.YMin, extent.XMax, extent.YMax) if envelope is None else (
+                min(envelope[0], extent.XMin), min(envelope[1], extent.YMin),
+                max(envelope[2], extent.XMax), max(envelope[3], extent.YMax))
+            tiles[tile_id] = (cell, features + 1, vertices + row[0].pointCount, envelope)
+
+    arcpy.management.Sort(unsorted_fc, tiled_fc, [["tile_id", "ASCENDING"]])
+    arcpy.Delete_management(unsorted_fc)
+    arcpy.management.AddIndex(tiled_fc, ["tile_id"], "tile_id_idx")
+
+    arcpy.management.CreateTable(gdb, INDEX_TABLE)
+    arcpy.management.AddFields(index_table, [["tile_id", "LONG"], ["xmin", "DOUBLE"], ["ymin", "DOUBLE"],
+                                             ["xmax", "DOUBLE"], ["ymax", "DOUBLE"], ["features", "LONG"],
+                                             ["grid_column", "LONG"], ["grid_row", "LONG"], ["origin_x", "DOUBLE"],
+                                             ["origin_y", "DOUBLE"], ["cell_size", "DOUBLE"], ["vertices", "DOUBLE"]])
+    with arcpy.da.InsertCursor(index_table, INDEX_FIELDS) as cursor:
+        for tile_id in sorted(tiles):
+            cell, features, vertices, envelope = tiles[tile_id]
+            cursor.insertRow([tile_id, *envelope, features, *cell, *origin, size, vertices])
+
+    print('Designated lands in {} tiles of {:.0f} km ({} features)'.format(
+        len(tiles), size / 1000, sum(features for _, features, _, _ in tiles.values())))
+    _indexes.pop(gdb, None)
+
+
+class TileIndex:
+    """Envelopes of the designated lands tiles, read from the index table of the tile gdb"""
+
+    def __init__(self, gdb):
+        self.tiled_fc, index_table = tile_artifacts(gdb)
+        with arcpy.da.SearchCursor(index_table, INDEX_FIELDS) as cursor:
+            rows = [row for row in cursor]
+        # (tile_id, xmin, ymin, xmax, ymax, features) of every tile
+        self.tiles = [row[:6] for row in rows]
+        self.vertices = {row[0]: row[11] for row in rows}
+        self.spatial_reference = arcpy.Describe(self.tiled_fc).spatialReference
+        # Grid origin and cell size the index was built with
+        self.origin, self.size = ((rows[0][8], rows[0][9]), rows[0][10]) if rows else ((0, 0), tile_size())
+
+    def tiles_for(self, extent):
+        """Tiles whose envelope overlaps the extent"""
+        return [tile_id for tile_id, xmin, ymin, xmax, ymax, features in self.tiles
+                if not (xmax < extent.XMin or xmin > extent.XMax or ymax < extent.YMin or ymin > extent.YMax)]
+
+    def size(self, extent):
+        """(features, vertices) of the designated lands in the tiles that overlap the extent"""
+        tile_ids = set(self.tiles_for(extent))
+        return (sum(features for tile_id, xmin, ymin, xmax, ymax, features in self.tiles if tile_id in tile_ids),
+                sum(self.vertices[tile_id] for tile_id in tile_ids))
+
+    def cells(self):
+        """
+        Grid cell name -> features that may reach into the cell, for every cell a tile envelope overlaps
+
+        The cells cover the designated lands without overlapping each other, unlike the tile envelopes
+        """
+        cells = {}
+        for tile_id, xmin, ymin, xmax, ymax, features in self.tiles:
+            for column in range(int((xmin - self.origin[0]) // self.size), int((xmax - self.origin[0]) // self.size) + 1):
+                for row in range(int((ymin - self.origin[1]) // self.size), int((ymax - self.origin[1]) // self.size) + 1):
+                    name = f"cell_{column}_{row}"
+                    cells[name] = cells.get(name, 0) + features
+        return cells
+
+    def cell_polygon(self, name):
+        """Polygon of a grid cell named by cells()"""
+        column, row = (int(part) for part in name.split("_")[1:])
+        xmin, ymin = self.origin[0] + column * self.size, self.origin[1] + row * self.size
+        corners = [(xmin, ymin), (xmin, ymin + self.size), (xmin + self.size, ymin + self.size), (xmin + self.size, ymin)]
+        return arcpy.Polygon(arcpy.Array([arcpy.Point(x, y) for x, y in corners]), self.spatial_reference)
+
+    def layer(self, extent, name):
+        """Feature layer of the tiled designated lands limited to the tiles that overlap the extent"""
+        tile_ids = self.tiles_for(extent)
+        where = "tile_id IN ({})".format(", ".join(map(str, tile_ids))) if tile_ids else "1 = 0"
+        print('Reading {} of {} designated lands tiles'.format(len(tile_ids), len(self.tiles)))
+        return arcpy.management.MakeFeatureLayer(self.tiled_fc, name, where)[0]
+
+
+def get_tile_index(gdb):
+    if gdb not in _indexes:
+        _indexes[gdb] = TileIndex(gdb)
+    return _indexes[gdb]
@@ -0,0 +1,146 @@
+'''
+    As-of-year disturbance queries
+
+    Purpose:   Keep the year lists the meatball join collects for every face of the flat (Cutblock_year, Pest_year,
+               Fire_year, Cutblock_year_buffer) as sorted int16 arrays with per face offsets, so any as-of-year or
+               age window question ("what was disturbed as of 2005, cut in the 40 years before it?") is answered by
+               herd and habitat from the one flatten in milliseconds, without rerunning or editing static_grouping.
+
+               Windows use the bounds of static_grouping: start < latest year < end, both exclusive. Without an
+               as-of year the latest year is the latest of the whole list (latest_cut/latest_pest/latest_fire), so
+               window("cutblock", 1981, 1991) is static_grouping's "cutblock 1981-1991 (Ha)". With an as-of year only
+               the years up to and including it count, a face cut in 1990 and again in 2010 is cut in 1990 as of 2005.
+
+    Outputs:   <csv_output_name>_years.npz in the report folder, loaded again with YearIndex.load
+
+    Usage:     index = YearIndex.load(os.path.join(csv_dir, "Mountain_1005_years.npz"))
+               index.age_window("cutblock", as_of=2005, age=40)
+               index.cumulative(as_of=2005, age=40, classes=("fire", "cutblock", "pest"))
+'''
+import os
+import numpy as np
+import pandas as pd
+
+# class: (year list field, static/type field the class belongs to)
+YEAR_FIELDS = {
+    "cutblock": ("Cutblock_year", "types"),
+    "pest": ("Pest_year", "types"),
+    "fire": ("Fire_year", "types"),
+    "cutblock buffer": ("Cutblock_year_buffer", "types_buffer"),
+}
+
+# Faces whose list has no year within the query have this as their latest year
+NO_YEAR = np.iinfo(np.int16).min
+
+
+def parse_years(year_lists):
+    """(face, year) of every year in the '; ' joined year lists of the spatial join, faces in order"""
+    years = year_lists.fillna("").astype(str).str.split(";").explode()
+    years = pd.to_numeric(years.str.strip(), errors="coerce").dropna()
+    return years.index.to_numpy(np.int64), years.to_numpy().astype(np.int16)
+
+
+class YearIndex:
+    """Year lists of the faces of one flat table, with the hectares and herd/habitat group of every face"""
+
+    def __init__(self, groups, face_group, hectares, static, years):
+        # groups: DataFrame of the table_group values, face_group: row of each face in it
+        self.groups = groups
+        self.face_group = face_group
+        self.hectares = hectares
+        # static: type field -> faces with a Static disturbance, years: class -> (offsets, sorted years)
+        self.static = static
+        self.years = years
+
+    @classmethod
+    def from_table(cls, flat_table, table_group):
+        flat_table = flat_table.reset_index(drop=True)
+        face_group, groups = pd.MultiIndex.from_frame(flat_table[table_group].astype(str)).factorize()
+        hectares = flat_table["Shape_Area"].fillna(0).to_numpy(float) / 10000
+
+        static = {field: flat_table[field].str.contains("Static", case=False, na=False).to_numpy()
+                  for field in dict.fromkeys(type_field for _, type_field in YEAR_FIELDS.values())
+                  if field in flat_table}
+
+        years = {}
+        for name, (field, _) in YEAR_FIELDS.items():
+            if field not in flat_table:
+                continue
+            faces, values = parse_years(flat_table[field])
+            order = np.lexsort((values, faces))
+            offsets = np.zeros(len(flat_table) + 1, np.int64)
+            offsets[1:] = np.cumsum(np.bincount(faces, minlength=len(flat_table)))
+            years[name] = (offsets, values[order])
+
+        return cls(groups.to_frame(index=False, name=table_group), face_group.astype(np.int32), hectares, static, years)
+
+    @classmethod
+    def from_csv(cls, csv_dir, csv_output_name, table_group):
+        """Index of the combined flat table static_grouping reads"""
+        return cls.from_table(pd.read_csv(os.path.join(csv_dir, f"{csv_output_name}.csv"), low_memory=False), table_group)
+
+    def save(self, path):
+        arrays = {f"group_{column}": self.groups[column].to_numpy(str) for column in self.groups}
+        arrays.update({f"static_{field}": mask for field, mask in self.static.items()})
+        for name, (offsets, years) in self.years.items():
+            arrays[f"offsets_{name}"], arrays[f"years_{name}"] = offsets, years
+        np.savez_compressed(path, face_group=self.face_group, hectares=self.hectares, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            groups = pd.DataFrame({key[len("group_"):]: arrays[key] for key in arrays.files if key.startswith("group_")})
+            static = {key[len("static_"):]: arrays[key] for key in arrays.files if key.startswith("static_")}
+            years = {key[len("years_"):]: (arrays[f"offsets_{key[len('years_'):]}"], arrays[key])
+                     for key in arrays.files if key.startswith("years_")}
+            return cls(groups, arrays["face_group"], arrays["hectares"], static, years)
+
+    def latest(self, name, as_of=None):
+        """Latest year of every face up to and including as_of (all years without it), NO_YEAR when there is none"""
+        offsets, years = self.years[name]
+        counts = np.diff(offsets)
+        if as_of is not None:
+            # The years of a face are sorted, the ones up to as_of are the first of its slice
+            faces = np.repeat(np.arange(len(counts)), counts)
+            counts = np.bincount(faces[years <= as_of], minlength=len(counts))
+        latest = np.full(len(counts), NO_YEAR, np.int16)
+        has_year = counts > 0
+        latest[has_year] = years[offsets[:-1][has_year] + counts[has_year] - 1]
+        return latest
+
+    def in_window(self, name, start=None, end=None, as_of=None):
+        """Faces whose latest year (as of as_of) is after start and before end"""
+        latest = self.latest(name, as_of)
+        selected = latest != NO_YEAR
+        if start is not None:
+            selected &= latest > start
+        if end is not None:
+            selected &= latest < end
+        return selected
+
+    def area(self, selected, label=None):
+        """Hectares of the selected faces by herd and habitat"""
+        hectares = np.bincount(self.face_group, weights=np.where(selected, self.hectares, 0), minlength=len(self.groups))
+        return pd.Series(hectares, index=pd.MultiIndex.from_frame(self.groups), name=label)
+
+    def window(self, name, start=None, end=None, as_of=None):
+        """Hectares by herd and habitat whose latest year of the class is within (start, end)"""
+        return self.area(self.in_window(name, start, end, as_of), f"{name} {start}-{end} (Ha)")
+
+    def age_window(self, name, as_of, age):
+        """Hectares by herd and habitat disturbed by the class in the age years up to and including as_of"""
+        return self.area(self.in_window(name, as_of - age, as_of + 1, as_of), f"{name} as of {as_of} past {age} (Ha)")
+
+    def cumulative(self, as_of=None, age=None, start=None, end=None, classes=("fire", "cutblock"), buffer=False):
+        """
+        Hectares by herd and habitat that are static or disturbed by one of the classes within the window, the
+        window is (start, end) or the age years up to as_of; with buffer the static and cutblock areas are the 500m
+        buffered ones, as in static_grouping's cumulative buffer columns
+        """
+        if age is not None:
+            start, end = as_of - age, as_of + 1
+        selected = self.static["types_buffer" if buffer else "types"].copy()
+        for name in classes:
+            name = f"{name} buffer" if buffer and f"{name} buffer" in self.years else name
+            selected |= self.in_window(name, start, end, as_of)
+        return self.area(selected, "cumulative {} as of {} ({}-{}) (Ha)".format(", ".join(classes), as_of, start, end))